@@ -0,0 +1,67 @@
+"""Compare xena.ladder.ladder_diff with naive cancel all and resend on random ladder moves, no connection is needed"""
+
+import random
+import time
+
+from xena.ladder import ladder_diff
+from xena.orders import Order
+from xena.ticks import FixedPoint
+import xena.proto.constants as constants
+
+
+LEVELS = 20
+ROUNDS = 2000
+
+prices = FixedPoint("0.5")
+qtys = FixedPoint("0.001")
+
+
+def ladder(mid, step):
+    levels = []
+    for i in range(1, LEVELS + 1):
+        qty = qtys.format(random.choice((1000, 1000, 1000, 2000)))
+        levels.append((constants.Side_Buy, prices.format(mid - i * step), qty))
+        levels.append((constants.Side_Sell, prices.format(mid + i * step), qty))
+    return levels
+
+
+def to_orders(levels):
+    orders = []
+    for i, (side, price, qty) in enumerate(levels):
+        order = Order(1, 'XBTUSD', side, str(i))
+        order.price = price
+        order.order_qty = qty
+        order.leaves_qty = qty
+        orders.append(order)
+    return orders
+
+
+def main():
+    random.seed(1)
+    price_key = lambda value: prices.parse(value)
+    qty_key = lambda value: qtys.parse(value)
+
+    mid = 20000
+    live = to_orders(ladder(mid, 1))
+    naive_msgs = 0
+    diff_msgs = 0
+    diff_time = 0.0
+    for _ in range(ROUNDS):
+        mid += random.choice((-2, -1, 0, 0, 1, 2))
+        desired = ladder(mid, 1)
+
+        started = time.perf_counter()
+        new, replace, cancel = ladder_diff(desired, live, price_key, qty_key)
+        diff_time += time.perf_counter() - started
+
+        naive_msgs += len(live) + len(desired)
+        diff_msgs += len(new) + len(replace) + len(cancel)
+        live = to_orders(desired)
+
+    print('{} rounds, {} levels per side'.format(ROUNDS, LEVELS))
+    print('naive cancel and resend: {:.1f} commands per round'.format(naive_msgs / ROUNDS))
+    print('ladder diff:             {:.1f} commands per round, {:.1f}us per diff'.format(diff_msgs / ROUNDS, diff_time / ROUNDS * 1e6))
+
+
+if __name__ == '__main__':
+    main()
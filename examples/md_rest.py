@@ -13,35 +13,35 @@ def get_client():
     return XenaMDClient(loop)
 
 async def example_of_candles():
-    rest = get_client()
-    ts_from = int((datetime.today() - timedelta(days=1)).timestamp() * 1000000000) # from in nanosecond's
-    res = await rest.candles("XBTUSD", timeframe='1m', ts_from=ts_from)
-    print(res)
+    async with get_client() as rest:
+        ts_from = int((datetime.today() - timedelta(days=1)).timestamp() * 1000000000) # from in nanosecond's
+        res = await rest.candles("XBTUSD", timeframe='1m', ts_from=ts_from)
+        print(res)
 
 
 async def example_of_dom():
-    rest = XenaMDClient(loop)
-    res = await rest.dom("XBTUSD", throttling=500, market_depth=10, aggregation=5)
-    print(res)
+    async with XenaMDClient(loop) as rest:
+        res = await rest.dom("XBTUSD", throttling=500, market_depth=10, aggregation=5)
+        print(res)
 
 
 async def example_of_trades():
-    rest = get_client()
-    ts_from = ts_from=int((datetime.today() - timedelta(days=10)).timestamp()) * 1000000000 # nanoseconds
-    ts_to =  int(datetime.now().timestamp())*1000000000 # nanoseconds
-    res = await rest.trades("XBTUSD", ts_from=ts_from, ts_to=ts_to)
-    print(res)
+    async with get_client() as rest:
+        ts_from = ts_from=int((datetime.today() - timedelta(days=10)).timestamp()) * 1000000000 # nanoseconds
+        ts_to =  int(datetime.now().timestamp())*1000000000 # nanoseconds
+        res = await rest.trades("XBTUSD", ts_from=ts_from, ts_to=ts_to)
+        print(res)
 
 async def example_of_instruments():
-    rest = get_client()
-    res = await rest.instruments()
-    print(res)
+    async with get_client() as rest:
+        res = await rest.instruments()
+        print(res)
 
 
 async def example_of_server_time():
-    rest = get_client()
-    res = await rest.server_time()
-    print(res)
+    async with get_client() as rest:
+        res = await rest.server_time()
+        print(res)
 
 
 if __name__ == "__main__":
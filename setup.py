@@ -25,15 +25,15 @@ setup(
     author_email='',
     install_requires=[
         'requests', 'six', 'pyOpenSSL', 'service-identity', 'dateparser', 'urllib3', 'chardet', 'certifi',
-        'cryptography', 'aiohttp', 'ecdsa', 'protobuf', 'simplejson'
+        'cryptography', 'aiohttp', 'ecdsa', 'protobuf', 'simplejson', 'numpy'
     ],
+    python_requires='>=3.6',
     keywords='xena exchange api bitcoin ethereum btc eth neo',
     classifiers=[
         'Intended Audience :: Developers',
         'License :: OSI Approved :: MIT License',
         'Operating System :: OS Independent',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.5',
         'Programming Language :: Python :: 3.6',
         'Programming Language :: Python :: 3.7',
         'Programming Language :: Python',
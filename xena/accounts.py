@@ -0,0 +1,146 @@
+import collections
+import logging
+
+import xena.proto.constants as constants
+
+
+def _balance_values(balance):
+    return (balance.Available, balance.OnHold, balance.Settled, balance.Equity, balance.Bonus)
+
+
+class AccountState:
+    """Balances indexed by (Account, Currency) and margin requirements by Account, updated from
+    AccountStatusReport, AccountStatusUpdateReport and MarginRequirementReport messages.
+
+    Change callbacks are called only if a value really changes, reports repeating known values are ignored.
+    XenaTradingWebsocketClient does it when created with track_accounts=True.
+    """
+
+    def __init__(self):
+        self._log = logging.getLogger(__name__)
+        # (account, currency) -> xena.proto.balance_pb2.Balance
+        self._balances = {}
+        self._by_account = collections.defaultdict(set)
+        # account -> {(MarginAmtType, MarginAmtCcy): MarginAmt}
+        self._margins = {}
+        self._on_balance_change = []
+        self._on_margin_change = []
+        # accounts waiting for AccountStatusReport after reconnect
+        self.stale_accounts = set()
+
+    def on_balance_change(self, callback):
+        """Add callback(account, currency, old, new) called on balance change,
+        old is None for new currency, new is None for removed currency
+
+        :param callback: function
+        :type callback: callable
+        """
+
+        self._on_balance_change.append(callback)
+
+    def on_margin_change(self, callback):
+        """Add callback(account, old, new) called on margin requirements change, old and new are dicts like margin() returns
+
+        :param callback: function
+        :type callback: callable
+        """
+
+        self._on_margin_change.append(callback)
+
+    def balance(self, account, currency):
+        """xena.proto.balance_pb2.Balance or None"""
+
+        return self._balances.get((account, currency))
+
+    def available(self, account, currency):
+        balance = self._balances.get((account, currency))
+        return "0" if balance is None else balance.Available or "0"
+
+    def balances(self, account):
+        return [self._balances[key] for key in self._by_account.get(account, ())]
+
+    def accounts(self):
+        return [account for account, keys in self._by_account.items() if keys]
+
+    def margin(self, account, amount_type=constants.MarginAmtType_InitialMargin, currency=None):
+        """Margin amount of :amount_type or None, in :currency if set, otherwise the first amount of the type"""
+
+        for (amt_type, amt_ccy), amount in self._margins.get(account, {}).items():
+            if amt_type == amount_type and (currency is None or amt_ccy == currency):
+                return amount
+        return None
+
+    def margins(self, account):
+        """Margin requirements of :account as {(MarginAmtType, MarginAmtCcy): MarginAmt}"""
+
+        return dict(self._margins.get(account, {}))
+
+    def _notify_balance(self, account, currency, old, new):
+        for callback in self._on_balance_change:
+            try:
+                callback(account, currency, old, new)
+            except Exception:
+                self._log.exception('balance change callback')
+
+    def _set_balance(self, account, balance):
+        if balance.Account == 0:
+            balance.Account = account
+        key = (account, balance.Currency)
+        old = self._balances.get(key)
+        if old is not None:
+            if balance.LastUpdateTime != 0 and balance.LastUpdateTime < old.LastUpdateTime:
+                # stale update
+                return
+            if _balance_values(old) == _balance_values(balance) and old.Positions == balance.Positions:
+                self._balances[key] = balance
+                return
+
+        self._balances[key] = balance
+        self._by_account[account].add(key)
+        self._notify_balance(account, balance.Currency, old, balance)
+
+    def _apply_margin(self, msg):
+        margins = {(amount.MarginAmtType, amount.MarginAmtCcy): amount.MarginAmt for amount in msg.MarginAmounts}
+        old = self._margins.get(msg.Account)
+        if old == margins:
+            return
+
+        self._margins[msg.Account] = margins
+        for callback in self._on_margin_change:
+            try:
+                callback(msg.Account, old, margins)
+            except Exception:
+                self._log.exception('margin change callback')
+
+    def apply(self, msg):
+        """Apply incoming message, only account status and margin requirement reports change the state"""
+
+        if msg.MsgType == constants.MsgType_MarginRequirementReport:
+            if msg.RejectReason == "":
+                self._apply_margin(msg)
+            return
+
+        if msg.MsgType not in (constants.MsgType_AccountStatusReport, constants.MsgType_AccountStatusUpdateReport):
+            return
+
+        if msg.RejectReason != "":
+            self._log.warning('account status of %s is rejected: %s %s', msg.Account, msg.RejectReason, msg.Text)
+            return
+
+        for balance in msg.Balances:
+            self._set_balance(msg.Account, balance)
+
+        if msg.MsgType == constants.MsgType_AccountStatusReport:
+            # full report, currencies not in it are gone
+            currencies = set(balance.Currency for balance in msg.Balances)
+            for key in list(self._by_account.get(msg.Account, ())):
+                if key[1] not in currencies:
+                    old = self._balances.pop(key)
+                    self._by_account[msg.Account].discard(key)
+                    self._notify_balance(msg.Account, key[1], old, None)
+            self.stale_accounts.discard(msg.Account)
+
+    def invalidate(self, accounts=None):
+        """Mark :accounts (all known if not set) as stale until the next AccountStatusReport"""
+
+        self.stale_accounts.update(self._by_account if accounts is None else accounts)
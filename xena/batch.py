@@ -0,0 +1,136 @@
+import asyncio
+import logging
+
+import xena.proto.constants as constants
+import xena.proto.order_pb2 as order_pb2
+
+
+# execution reports which are not an answer to a command yet
+_PENDING_EXEC_TYPES = frozenset([
+    constants.ExecType_PendingNewExec,
+    constants.ExecType_PendingCancelExec,
+    constants.ExecType_PendingReplaceExec,
+])
+
+
+def batch_cl_ord_ids(cmds):
+    """ClOrdId of every command in :cmds, orders of NewOrderList are included"""
+
+    result = []
+    for cmd in cmds:
+        if isinstance(cmd, order_pb2.NewOrderList):
+            result.extend(order.ClOrdId for order in cmd.ListOrdGrp)
+        elif getattr(cmd, 'ClOrdId', "") != "":
+            result.append(cmd.ClOrdId)
+    return result
+
+
+class OrderBatch:
+    """Per command results of a batch of orders, cancels and replaces.
+
+    The first ExecutionReport which is not a pending status or OrderCancelReject with ClOrdId of the command
+    is its result. Rejected ListStatus of NewOrderList is the result of every list order without a result.
+    """
+
+    def __init__(self, cmds, loop=None):
+        """
+        :param cmds: required
+        :type cmds: list of protobuf commands
+        """
+
+        self._log = logging.getLogger(__name__)
+        self._loop = loop
+        self.cmds = list(cmds)
+        self.list_ids = [cmd.ListId for cmd in self.cmds if isinstance(cmd, order_pb2.NewOrderList)]
+        # ClOrdId -> ExecutionReport, OrderCancelReject or ListStatus, None if there is no answer yet
+        self.results = {cl_ord_id: None for cl_ord_id in batch_cl_ord_ids(self.cmds)}
+        # ListId -> the last ListStatus
+        self.list_statuses = {}
+        self._unanswered = len(self.results)
+        self._future = None
+        self._exception = None
+
+    def __len__(self):
+        return len(self.results)
+
+    @property
+    def done(self):
+        return self._unanswered == 0
+
+    def _set(self, cl_ord_id, msg):
+        if cl_ord_id not in self.results or self.results[cl_ord_id] is not None:
+            return False
+
+        self.results[cl_ord_id] = msg
+        self._unanswered -= 1
+        if self._unanswered == 0 and self._future is not None and not self._future.done():
+            self._future.set_result(self)
+        return True
+
+    def apply(self, msg):
+        """Apply incoming message
+
+        :returns: True if the message is an answer for the batch
+        """
+
+        if msg.MsgType == constants.MsgType_ExecutionReportMsgType:
+            if msg.ExecType in _PENDING_EXEC_TYPES:
+                return False
+            return self._set(msg.ClOrdId, msg)
+
+        if msg.MsgType == constants.MsgType_OrderCancelRejectMsgType:
+            return self._set(msg.ClOrdId, msg)
+
+        if msg.MsgType == constants.MsgType_ListStatus and msg.ListId in self.list_ids:
+            self.list_statuses[msg.ListId] = msg
+            if msg.ListRejectOrder.ClOrdId != "":
+                self._set(msg.ListRejectOrder.ClOrdId, msg.ListRejectOrder)
+
+            if msg.ListOrderStatus == constants.ListOrderStatus_RejectListOrderStatus:
+                for cmd in self.cmds:
+                    if isinstance(cmd, order_pb2.NewOrderList) and cmd.ListId == msg.ListId:
+                        for order in cmd.ListOrdGrp:
+                            self._set(order.ClOrdId, msg)
+            return True
+
+        return False
+
+    def rejected(self):
+        """ClOrdId of commands with reject results"""
+
+        result = []
+        for cl_ord_id, msg in self.results.items():
+            if msg is None:
+                continue
+            if msg.MsgType == constants.MsgType_ExecutionReportMsgType and msg.ExecType != constants.ExecType_RejectedExec:
+                continue
+            result.append(cl_ord_id)
+        return result
+
+    @property
+    def exception(self):
+        """Exception the batch failed with, e.g. xena.exceptions.ConnectionClosedException if it was not sent, or None"""
+
+        return self._exception
+
+    def fail(self, exception):
+        """Stop waiting for results, wait() raises :exception"""
+
+        self._exception = exception
+        if self._future is not None and not self._future.done():
+            self._future.set_exception(exception)
+
+    async def wait(self, timeout=None):
+        """Wait for results of all commands, on timeout raises asyncio.TimeoutError
+
+        :returns: self
+        """
+
+        if self.done:
+            return self
+        if self._exception is not None:
+            raise self._exception
+
+        if self._future is None:
+            self._future = (self._loop or asyncio.get_event_loop()).create_future()
+        return await asyncio.wait_for(asyncio.shield(self._future), timeout)
@@ -0,0 +1,233 @@
+import bisect
+import logging
+from decimal import ROUND_HALF_UP
+
+import xena.proto.constants as constants
+
+
+class BookSide:
+    """Price levels of one side of the book ordered from the best price"""
+
+    def __init__(self, is_bid):
+        self.is_bid = is_bid
+        # sort keys of prices, bids are negated so the best price is always first
+        self._keys = []
+        self._sizes = {}
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _key(self, price):
+        return -price if self.is_bid else price
+
+    def level(self, rank):
+        """(price, size) of level with :rank, rank 0 is the best price"""
+
+        price = self._key(self._keys[rank])
+        return price, self._sizes[price]
+
+    def levels(self, depth=None):
+        keys = self._keys if depth is None else self._keys[:depth]
+        return [(self._key(key), self._sizes[self._key(key)]) for key in keys]
+
+    def size(self, price):
+        return self._sizes.get(price, 0)
+
+    def set(self, price, size):
+        """Set level size, zero size removes the level
+
+        :returns: (rank, old_size) or None if nothing changed
+        """
+
+        old = self._sizes.get(price, 0)
+        if old == size:
+            return None
+
+        key = self._key(price)
+        rank = bisect.bisect_left(self._keys, key)
+        if size == 0:
+            del self._keys[rank]
+            del self._sizes[price]
+        else:
+            if old == 0:
+                self._keys.insert(rank, key)
+            self._sizes[price] = size
+
+        return rank, old
+
+    def clear(self):
+        self._keys = []
+        self._sizes = {}
+
+
+class OrderBook:
+    """L2 book for one symbol built from DOM stream messages.
+
+    Listeners are notified about each touched level with on_level(book, side, rank, price, old_size, new_size)
+    and about full rebuilds from snapshots with on_reset(book).
+
+    With fixed points prices are kept as int ticks and sizes as int lots, so all book arithmetic is exact.
+    """
+
+    def __init__(self, symbol, price_fixed_point=None, qty_fixed_point=None):
+        """
+        :param price_fixed_point: keep prices as ticks of this fixed point
+        :type price_fixed_point: xena.ticks.FixedPoint
+        :param qty_fixed_point: keep sizes as lots of this fixed point
+        :type qty_fixed_point: xena.ticks.FixedPoint
+        """
+
+        self.symbol = symbol
+        self.price_fixed_point = price_fixed_point
+        self.qty_fixed_point = qty_fixed_point
+        self.bids = BookSide(True)
+        self.asks = BookSide(False)
+        self.last_update_time = 0
+        self._listeners = []
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    @property
+    def best_bid(self):
+        """(price, size) or None"""
+
+        if len(self.bids) == 0:
+            return None
+        return self.bids.level(0)
+
+    @property
+    def best_ask(self):
+        """(price, size) or None"""
+
+        if len(self.asks) == 0:
+            return None
+        return self.asks.level(0)
+
+    @property
+    def mid(self):
+        if len(self.bids) == 0 or len(self.asks) == 0:
+            return None
+        return (self.bids.level(0)[0] + self.asks.level(0)[0]) / 2
+
+    def _parse_px(self, value):
+        if self.price_fixed_point is not None:
+            return self.price_fixed_point.parse(value, ROUND_HALF_UP)
+        return float(value)
+
+    def _parse_qty(self, value):
+        if self.qty_fixed_point is not None:
+            return self.qty_fixed_point.parse(value, ROUND_HALF_UP)
+        if value == "":
+            return 0
+        return float(value)
+
+    def _side(self, entry):
+        if entry.MDEntryType == constants.MDEntryType_Bid:
+            return self.bids
+        if entry.MDEntryType == constants.MDEntryType_Offer:
+            return self.asks
+        return None
+
+    def apply(self, msg):
+        """Apply DOM snapshot or incremental refresh
+
+        :param msg: required
+        :type msg: xena.proto.market_pb2.MarketDataRefresh
+        """
+
+        self.last_update_time = msg.LastUpdateTime
+        if msg.MsgType == constants.MsgType_MarketDataSnapshotFullRefresh:
+            self.bids.clear()
+            self.asks.clear()
+            for entry in msg.MDEntry:
+                side = self._side(entry)
+                if side is not None:
+                    side.set(self._parse_px(entry.MDEntryPx), self._parse_qty(entry.MDEntrySize))
+
+            for listener in self._listeners:
+                listener.on_reset(self)
+            return
+
+        for entry in msg.MDEntry:
+            side = self._side(entry)
+            if side is None:
+                continue
+
+            price = self._parse_px(entry.MDEntryPx)
+            size = 0
+            if entry.MDUpdateAction != constants.MDUpdateAction_DeleteAction:
+                size = self._parse_qty(entry.MDEntrySize)
+
+            change = side.set(price, size)
+            if change is None:
+                continue
+
+            rank, old = change
+            for listener in self._listeners:
+                listener.on_level(self, side, rank, price, old, size)
+
+
+class OrderBooks:
+    """Order books for many symbols fed by XenaMDWebsocketClient.dom stream"""
+
+    def __init__(self, instruments=None):
+        """
+        :param instruments: if set, books for known symbols keep prices in ticks and sizes in lots
+        :type instruments: xena.instruments.InstrumentCache
+        """
+
+        self._log = logging.getLogger(__name__)
+        self._instruments = instruments
+        self._books = {}
+        self._listeners = []
+
+    def book(self, symbol):
+        if symbol not in self._books:
+            if self._instruments is not None and symbol in self._instruments:
+                book = OrderBook(symbol, self._instruments.price_fixed_point(symbol), self._instruments.qty_fixed_point(symbol))
+            else:
+                book = OrderBook(symbol)
+            for listener in self._listeners:
+                book.add_listener(listener)
+            self._books[symbol] = book
+        return self._books[symbol]
+
+    def get(self, symbol):
+        """Book of :symbol or None if there is no book for it yet, unlike book() it does not create one"""
+
+        return self._books.get(symbol)
+
+    def add_listener(self, listener):
+        """Add listener to all current and future books, see OrderBook"""
+
+        self._listeners.append(listener)
+        for book in self._books.values():
+            book.add_listener(listener)
+            listener.on_reset(book)
+
+    async def handle(self, ws, msg):
+        """Apply DOM stream message, could be used as callback for XenaMDWebsocketClient.dom"""
+
+        if msg.MsgType == constants.MsgType_MarketDataRequestReject:
+            return
+
+        self.book(msg.Symbol or msg.MDStreamId.split(':')[1]).apply(msg)
+
+    async def subscribe(self, ws, symbol, callback=None, **kwargs):
+        """Subscribe books to DOM stream for :symbol
+
+        :param ws: connected md websocket client
+        :type ws: xena.websocket.XenaMDWebsocketClient
+        :param callback: optional callback coroutine called after book update
+        :type callback: async coroutine
+
+        :returns: stream id to use in usubscribe
+        """
+
+        async def handle(ws, msg):
+            await self.handle(ws, msg)
+            if callback is not None:
+                await callback(ws, msg)
+
+        return await ws.dom(symbol, handle, **kwargs)
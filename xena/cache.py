@@ -0,0 +1,185 @@
+import collections
+import hashlib
+import logging
+import os
+import time
+
+from xena.candles import timeframe_ns
+
+
+CANDLES_PATH = '/market-data/v2/candles/'
+
+# path prefix -> seconds to keep response
+DEFAULT_TTLS = {
+    '/public/instruments': 300.0,
+    '/market-data/v2/server-time': 1.0,
+    '/market-data/v2/dom/': 0.5,
+    CANDLES_PATH: 5.0,
+}
+
+_FOREVER = float('inf')
+
+
+class CacheStats:
+    """Counters of xena.cache.ResponseCache"""
+
+    __slots__ = ('hits', 'misses', 'expired', 'evictions', 'disk_hits', 'coalesced')
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.disk_hits = 0
+        # requests which waited for the same request already in flight
+        self.coalesced = 0
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        if total == 0:
+            return 0.0
+        return self.hits / total
+
+    def __repr__(self):
+        return 'CacheStats({})'.format(', '.join('{}={}'.format(name, getattr(self, name)) for name in self.__slots__))
+
+
+def _closed_candles(path, params, now):
+    """True if all bars of candles request are closed, so the response never changes"""
+
+    ts_to = params.get('to')
+    if ts_to in (None, "", 0):
+        return False
+
+    try:
+        duration = timeframe_ns(path.rsplit('/', 1)[1])
+    except ValueError:
+        return False
+
+    now_ns = int(now * 1000000000)
+    # bars opened before the current bar are closed
+    return int(ts_to) <= now_ns - now_ns % duration
+
+
+class ResponseCache:
+    """LRU cache of GET responses of public endpoints with TTL per path prefix.
+
+    Set it as cache of XenaMDClient to use it. Response text is kept, so every hit returns a new message.
+    Candles requests with all bars closed never expire and are also kept in :path directory if it is set,
+    so they survive restarts.
+    """
+
+    def __init__(self, max_entries=1000, ttls=None, path=None, clock=time.time):
+        """
+        :param max_entries: max number of responses in memory, the least recently used is evicted
+        :type max_entries: int
+        :param ttls: seconds to keep responses per path prefix, xena.cache.DEFAULT_TTLS if not set
+        :type ttls: dict of str to float
+        :param path: directory for the on-disk tier of closed candles
+        :type path: str
+        :param clock: function returning current unix time in seconds
+        :type clock: callable
+        """
+
+        if max_entries < 1:
+            raise ValueError("max_entries has to be positive")
+
+        self._log = logging.getLogger(__name__)
+        self._max_entries = max_entries
+        self._ttls = sorted((DEFAULT_TTLS if ttls is None else ttls).items(), key=lambda item: -len(item[0]))
+        self._path = path
+        self._clock = clock
+        # key -> (expires_at, text)
+        self._entries = collections.OrderedDict()
+        self.stats = CacheStats()
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _ttl(self, path):
+        for prefix, ttl in self._ttls:
+            if path.startswith(prefix):
+                return ttl
+        return None
+
+    def key(self, path, params=None):
+        """Cache key of GET request or None if :path is not cached"""
+
+        if self._ttl(path) is None:
+            return None
+        return (path,) + tuple(sorted((name, str(value)) for name, value in (params or {}).items()))
+
+    def _file(self, key):
+        return os.path.join(self._path, hashlib.sha256(repr(key).encode('utf-8')).hexdigest() + '.json')
+
+    def _load(self, key):
+        if self._path is None or not key[0].startswith(CANDLES_PATH):
+            return None
+        name = self._file(key)
+        if not os.path.exists(name):
+            return None
+        try:
+            with open(name, 'r') as fp:
+                return fp.read()
+        except Exception:
+            self._log.exception('load cached response %s', name)
+            return None
+
+    def _save(self, key, text):
+        name = self._file(key)
+        tmp = name + '.tmp'
+        with open(tmp, 'w') as fp:
+            fp.write(text)
+        os.replace(tmp, name)
+
+    def get(self, key):
+        """Response text or None"""
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > self._clock():
+                self._entries.move_to_end(key)
+                self.stats.hits += 1
+                return entry[1]
+            del self._entries[key]
+            self.stats.expired += 1
+
+        text = self._load(key)
+        if text is not None:
+            self.stats.hits += 1
+            self.stats.disk_hits += 1
+            self._set(key, _FOREVER, text)
+            return text
+
+        self.stats.misses += 1
+        return None
+
+    def put(self, key, path, params, text):
+        """Keep response text of request with :key for TTL of :path"""
+
+        now = self._clock()
+        ttl = self._ttl(path)
+        if ttl is None:
+            return
+
+        expires_at = now + ttl
+        if path.startswith(CANDLES_PATH) and _closed_candles(path, params or {}, now):
+            expires_at = _FOREVER
+            if self._path is not None:
+                self._save(key, text)
+        self._set(key, expires_at, text)
+
+    def _set(self, key, expires_at, text):
+        self._entries[key] = (expires_at, text)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+            self.stats.evictions += 1
+
+    def clear(self):
+        """Drop responses in memory, the on-disk tier is kept"""
+
+        self._entries.clear()
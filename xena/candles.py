@@ -0,0 +1,340 @@
+import logging
+import time
+from decimal import ROUND_HALF_UP
+
+import numpy as np
+
+import xena.proto.constants as constants
+
+
+COLUMNS = ('ts', 'open', 'high', 'low', 'close', 'volume')
+
+_TIMEFRAME_UNITS = {
+    's': 1000000000,
+    'm': 60 * 1000000000,
+    'h': 60 * 60 * 1000000000,
+    'd': 24 * 60 * 60 * 1000000000,
+    'w': 7 * 24 * 60 * 60 * 1000000000,
+}
+
+
+def timeframe_ns(timeframe):
+    """Convert timeframe string like '1m', '15m', '1h' or '24h' to duration in nanoseconds"""
+
+    if len(timeframe) < 2 or timeframe[-1] not in _TIMEFRAME_UNITS or not timeframe[:-1].isdigit():
+        raise ValueError("Unsupported timeframe \"{}\"".format(timeframe))
+
+    return int(timeframe[:-1]) * _TIMEFRAME_UNITS[timeframe[-1]]
+
+
+def _px(value):
+    if value == "":
+        return 0.0
+    return float(value)
+
+
+class CandleBuffer:
+    """Ring buffer of bars for one symbol and timeframe stored as numpy columns.
+
+    Bars are kept ordered by ts (bar open time in nanoseconds). When the buffer is full
+    the oldest bar is evicted to make room for a new one. With fixed points prices are stored
+    as int64 ticks and volume as int64 lots instead of float64.
+    """
+
+    BAR_SIZE = 8 * len(COLUMNS)
+
+    def __init__(self, symbol, timeframe, capacity=10000, max_bytes=None, price_fixed_point=None, qty_fixed_point=None):
+        """
+        :param capacity: max number of bars to keep
+        :type capacity: int
+        :param max_bytes: memory cap for the buffer columns, overrides :capacity if set
+        :type max_bytes: int
+        :param price_fixed_point: store prices as ticks of this fixed point
+        :type price_fixed_point: xena.ticks.FixedPoint
+        :param qty_fixed_point: store volume as lots of this fixed point
+        :type qty_fixed_point: xena.ticks.FixedPoint
+        """
+
+        if max_bytes is not None:
+            capacity = max_bytes // self.BAR_SIZE
+        if capacity < 1:
+            raise ValueError("Buffer capacity has to be positive")
+
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.duration = timeframe_ns(timeframe)
+        self.capacity = capacity
+        self.price_fixed_point = price_fixed_point
+        self.qty_fixed_point = qty_fixed_point
+
+        price_type = np.float64 if price_fixed_point is None else np.int64
+        qty_type = np.float64 if qty_fixed_point is None else np.int64
+        self._ts = np.zeros(capacity, dtype=np.int64)
+        self._open = np.zeros(capacity, dtype=price_type)
+        self._high = np.zeros(capacity, dtype=price_type)
+        self._low = np.zeros(capacity, dtype=price_type)
+        self._close = np.zeros(capacity, dtype=price_type)
+        self._volume = np.zeros(capacity, dtype=qty_type)
+        self._columns = (self._ts, self._open, self._high, self._low, self._close, self._volume)
+        self._start = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def _pos(self, i):
+        return (self._start + i) % self.capacity
+
+    def _segments(self):
+        end = self._start + self._size
+        if end <= self.capacity:
+            return [(self._start, end)]
+        return [(self._start, self.capacity), (0, end - self.capacity)]
+
+    def _search(self, ts):
+        """Logical index of the first bar with bar.ts >= :ts"""
+
+        offset = 0
+        for lo, hi in self._segments():
+            idx = int(np.searchsorted(self._ts[lo:hi], ts, side='left'))
+            if idx < hi - lo:
+                return offset + idx
+            offset += hi - lo
+        return offset
+
+    def _write(self, pos, bar):
+        for column, value in zip(self._columns, bar):
+            column[pos] = value
+
+    @property
+    def first_ts(self):
+        if self._size == 0:
+            return None
+        return int(self._ts[self._start])
+
+    @property
+    def last_ts(self):
+        if self._size == 0:
+            return None
+        return int(self._ts[self._pos(self._size - 1)])
+
+    def upsert(self, ts, open, high, low, close, volume):
+        """Insert bar or update existing one with the same ts"""
+
+        bar = (ts, open, high, low, close, volume)
+        if self._size == 0 or ts > self.last_ts:
+            if self._size == self.capacity:
+                self._start = self._pos(1)
+                self._size -= 1
+            self._write(self._pos(self._size), bar)
+            self._size += 1
+            return
+
+        idx = self._search(ts)
+        if idx < self._size and self._ts[self._pos(idx)] == ts:
+            self._write(self._pos(idx), bar)
+            return
+
+        if idx == 0:
+            # bar is older than anything in buffer, keep it only if there is free space
+            if self._size < self.capacity:
+                self._start = self._pos(-1)
+                self._size += 1
+                self._write(self._start, bar)
+            return
+
+        # gap inside buffer, rare case: rebuild columns in logical order
+        columns = self.range()
+        self.clear()
+        for i in range(idx):
+            self.upsert(*(columns[name][i] for name in COLUMNS))
+        self.upsert(*bar)
+        for i in range(idx, len(columns['ts'])):
+            self.upsert(*(columns[name][i] for name in COLUMNS))
+
+    def upsert_entry(self, entry):
+        """Insert or update bar from xena.proto.market_pb2.MDEntry"""
+
+        px = self._parse_px
+        volume = self._parse_qty(entry.BuyVolume) + self._parse_qty(entry.SellVolume)
+        self.upsert(entry.TransactTime, px(entry.FirstPx), px(entry.HighPx), px(entry.LowPx), px(entry.LastPx), volume)
+
+    def _parse_px(self, value):
+        if self.price_fixed_point is not None:
+            return self.price_fixed_point.parse(value, ROUND_HALF_UP)
+        return _px(value)
+
+    def _parse_qty(self, value):
+        if self.qty_fixed_point is not None:
+            return self.qty_fixed_point.parse(value, ROUND_HALF_UP)
+        return _px(value)
+
+    def range(self, ts_from=None, ts_to=None):
+        """Get bars which ts in [ts_from, ts_to)
+
+        :returns: dict of column name to numpy array, see xena.candles.COLUMNS
+        """
+
+        lo = 0 if ts_from is None else self._search(ts_from)
+        hi = self._size if ts_to is None else self._search(ts_to)
+        hi = max(lo, hi)
+
+        result = {}
+        for name, column in zip(COLUMNS, self._columns):
+            start, end = self._start + lo, self._start + hi
+            if end <= self.capacity:
+                result[name] = column[start:end].copy()
+            elif start >= self.capacity:
+                result[name] = column[start - self.capacity:end - self.capacity].copy()
+            else:
+                result[name] = np.concatenate((column[start:], column[:end - self.capacity]))
+
+        return result
+
+    def clear(self):
+        self._start = 0
+        self._size = 0
+
+
+class CandleCache:
+    """In-memory candles cache on top of XenaMDClient.candles.
+
+    Each (symbol, timeframe) pair gets its own CandleBuffer. Missing history is backfilled once
+    from REST, closed bars are never requested again, and the tail is kept current from
+    the websocket candles stream after subscribe() is called.
+    """
+
+    def __init__(self, md_client, capacity=10000, max_bytes=None, instruments=None):
+        """
+        :param md_client: rest client to backfill history
+        :type md_client: xena.rest.XenaMDClient
+        :param capacity: max number of bars per (symbol, timeframe)
+        :type capacity: int
+        :param max_bytes: memory cap per (symbol, timeframe), overrides :capacity if set
+        :type max_bytes: int
+        :param instruments: if set, buffers for known symbols store prices in ticks and volume in lots
+        :type instruments: xena.instruments.InstrumentCache
+        """
+
+        self._log = logging.getLogger(__name__)
+        self._client = md_client
+        self._instruments = instruments
+        self._capacity = capacity
+        self._max_bytes = max_bytes
+        self._buffers = {}
+        # [covered_from, covered_to) range of bar ts already loaded per buffer
+        self._covered = {}
+        self._live = set()
+        self._clients = []
+
+    def buffer(self, symbol, timeframe='1m'):
+        key = (symbol, timeframe)
+        if key not in self._buffers:
+            price_fixed_point = qty_fixed_point = None
+            if self._instruments is not None and symbol in self._instruments:
+                price_fixed_point = self._instruments.price_fixed_point(symbol)
+                qty_fixed_point = self._instruments.qty_fixed_point(symbol)
+            self._buffers[key] = CandleBuffer(symbol, timeframe, self._capacity, self._max_bytes, price_fixed_point, qty_fixed_point)
+        return self._buffers[key]
+
+    def _merge(self, buffer, msg):
+        for entry in msg.MDEntry:
+            buffer.upsert_entry(entry)
+
+    async def _fetch(self, buffer, ts_from, ts_to):
+        msg = await self._client.candles(buffer.symbol, buffer.timeframe, ts_from=ts_from, ts_to=ts_to)
+        self._merge(buffer, msg)
+
+    async def candles(self, symbol, timeframe='1m', ts_from=None, ts_to=None):
+        """Get bars for :symbol with :timeframe which ts in [ts_from, ts_to).
+        Only ranges that were never loaded before are requested over REST.
+
+        :param ts_from: required, unixtimestamp in nanoseconds
+        :type ts_from: int
+        :param ts_to: unixtimestamp in nanoseconds, now if not set
+        :type ts_to: int
+
+        :raises: ValueError if :ts_from is before the buffered bars and the buffer is full
+        :returns: dict of column name to numpy array, see xena.candles.COLUMNS
+        """
+
+        if ts_from is None:
+            raise ValueError("ts_from is required")
+
+        buffer = self.buffer(symbol, timeframe)
+        key = (symbol, timeframe)
+        now = int(time.time() * 1000000000)
+        if ts_to is None:
+            ts_to = now
+        ts_from -= ts_from % buffer.duration
+
+        # bars started before closed_to are final
+        closed_to = now - now % buffer.duration
+        covered = self._covered.get(key)
+        if covered is None:
+            await self._fetch(buffer, ts_from, ts_to)
+            covered = [ts_from, min(ts_to, closed_to)]
+        else:
+            if ts_from < covered[0]:
+                if len(buffer) == buffer.capacity:
+                    # bars older than the buffer could not be inserted, the range would be empty and requested again
+                    raise ValueError("Bars before {} do not fit into full buffer of {} {} {} bars".format(
+                        covered[0], buffer.capacity, symbol, timeframe))
+                await self._fetch(buffer, ts_from, covered[0])
+                covered[0] = ts_from
+
+            if key not in self._live and ts_to > covered[1]:
+                await self._fetch(buffer, covered[1], ts_to)
+                covered[1] = max(covered[1], min(ts_to, closed_to))
+
+        # evicted bars have to be loaded again
+        if buffer.first_ts is not None and len(buffer) == buffer.capacity:
+            covered[0] = max(covered[0], buffer.first_ts)
+        self._covered[key] = covered
+
+        return buffer.range(ts_from, ts_to)
+
+    async def handle(self, ws, msg):
+        """Merge candles stream message into cache, could be used as callback for XenaMDWebsocketClient.candles"""
+
+        if msg.MsgType == constants.MsgType_MarketDataRequestReject:
+            return
+
+        _, symbol, timeframe = msg.MDStreamId.split(':', 2)
+        self._merge(self.buffer(symbol, timeframe), msg)
+
+    async def subscribe(self, ws, symbol, timeframe='1m', callback=None, **kwargs):
+        """Subscribe cache to candles stream, so the last bars will be kept up to date without REST calls.
+
+        :param ws: connected md websocket client
+        :type ws: xena.websocket.XenaMDWebsocketClient
+        :param callback: optional callback coroutine called after cache update
+        :type callback: async coroutine
+
+        :returns: stream id to use in usubscribe
+        """
+
+        key = (symbol, timeframe)
+
+        async def handle(ws, msg):
+            await self.handle(ws, msg)
+            if callback is not None:
+                await callback(ws, msg)
+
+        if ws not in self._clients:
+            ws.on_connection_close(self._on_connection_close)
+            self._clients.append(ws)
+
+        stream_id = await ws.candles(symbol, handle, timeframe=timeframe, **kwargs)
+        self._live.add(key)
+        if key in self._covered:
+            # stream snapshot does not cover bars between the last loaded one and subscription
+            await self._fetch(self.buffer(symbol, timeframe), self._covered[key][1], int(time.time() * 1000000000))
+        return stream_id
+
+    async def _on_connection_close(self, ws, exception):
+        for key in self._live:
+            buffer = self._buffers[key]
+            if key in self._covered and buffer.last_ts is not None:
+                self._covered[key][1] = max(self._covered[key][1], buffer.last_ts)
+        self._live.clear()
@@ -0,0 +1,162 @@
+import logging
+import time
+
+import xena.proto.constants as constants
+import xena.proto.order_pb2 as order_pb2
+from xena.orders import TERMINAL_STATUSES
+
+
+class _Chain:
+    __slots__ = ('cl_ord_id', 'in_flight', 'pending')
+
+    def __init__(self, cl_ord_id):
+        # last acknowledged ClOrdId of the order
+        self.cl_ord_id = cl_ord_id
+        # replace sent, but not acknowledged yet
+        self.in_flight = None
+        # the latest desired replace, waits for in_flight acknowledgement
+        self.pending = None
+
+
+class ReplaceCoalescer:
+    """Keeps at most one OrderCancelReplaceRequest in flight per order.
+
+    Replaces submitted while the previous one is not acknowledged are held, a newer one overwrites the held one,
+    so only the latest desired state is sent, chained on the ClOrdId acknowledged by the exchange.
+    submit() decides if replace goes out now, apply() returns held replaces released by incoming messages.
+    Replace for an order could reference either acknowledged ClOrdId or ClOrdId of any in flight or held replace.
+    """
+
+    def __init__(self):
+        self._log = logging.getLogger(__name__)
+        # acknowledged ClOrdId -> chain
+        self._chains = {}
+        # ClOrdId of in flight or held replace -> chain
+        self._aliases = {}
+        # number of replaces never sent because newer replace overwrote them
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self._chains)
+
+    def in_flight(self, cl_ord_id):
+        """Replace in flight for order with acknowledged :cl_ord_id or None"""
+
+        chain = self._chains.get(cl_ord_id)
+        return None if chain is None else chain.in_flight
+
+    def submit(self, cmd):
+        """Register outgoing replace
+
+        :param cmd: required
+        :type cmd: xena.proto.order_pb2.OrderCancelReplaceRequest
+        :returns: :cmd if it has to be sent now or None if it's held until acknowledgement of the previous replace
+        """
+
+        if not isinstance(cmd, order_pb2.OrderCancelReplaceRequest):
+            raise ValueError("Command has to be OrderCancelReplaceRequest")
+
+        chain = self._aliases.get(cmd.OrigClOrdId) or self._chains.get(cmd.OrigClOrdId)
+        if chain is None:
+            chain = _Chain(cmd.OrigClOrdId)
+            self._chains[chain.cl_ord_id] = chain
+
+        self._aliases[cmd.ClOrdId] = chain
+        if chain.in_flight is None:
+            cmd.OrigClOrdId = chain.cl_ord_id
+            chain.in_flight = cmd
+            return cmd
+
+        if chain.pending is not None:
+            del self._aliases[chain.pending.ClOrdId]
+            self.coalesced += 1
+        chain.pending = cmd
+        return None
+
+    def _drop(self, chain):
+        for cmd in (chain.in_flight, chain.pending):
+            if cmd is not None:
+                self._aliases.pop(cmd.ClOrdId, None)
+        if self._chains.get(chain.cl_ord_id) is chain:
+            del self._chains[chain.cl_ord_id]
+
+    def _release(self, chain, cl_ord_id):
+        del self._aliases[chain.in_flight.ClOrdId]
+        chain.in_flight = None
+        if chain.cl_ord_id != cl_ord_id:
+            del self._chains[chain.cl_ord_id]
+            chain.cl_ord_id = cl_ord_id
+            self._chains[cl_ord_id] = chain
+
+        cmd = chain.pending
+        if cmd is None:
+            del self._chains[chain.cl_ord_id]
+            return []
+
+        chain.pending = None
+        cmd.OrigClOrdId = cl_ord_id
+        cmd.TransactTime = int(time.time() * 1000000000)
+        chain.in_flight = cmd
+        return [cmd]
+
+    def abort(self, cmd):
+        """Roll back replace :cmd returned by submit() or apply() which was not sent, e.g. send raised or socket is closed
+
+        :returns: list with held replace to send instead of :cmd, empty if nothing is held
+        """
+
+        chain = self._aliases.get(cmd.ClOrdId)
+        if chain is None or chain.in_flight is not cmd:
+            return []
+
+        del self._aliases[cmd.ClOrdId]
+        chain.in_flight = None
+        held = chain.pending
+        if held is None:
+            if self._chains.get(chain.cl_ord_id) is chain:
+                del self._chains[chain.cl_ord_id]
+            return []
+
+        chain.pending = None
+        held.OrigClOrdId = chain.cl_ord_id
+        held.TransactTime = int(time.time() * 1000000000)
+        chain.in_flight = held
+        return [held]
+
+    def apply(self, msg):
+        """Apply incoming ExecutionReport or OrderCancelReject
+
+        :returns: list of held replaces to send now
+        """
+
+        if msg.MsgType == constants.MsgType_ExecutionReportMsgType:
+            chain = self._aliases.get(msg.ClOrdId) or self._chains.get(msg.ClOrdId) or self._chains.get(msg.OrigClOrdId)
+            if chain is None:
+                return []
+
+            in_flight = chain.in_flight is not None and msg.ClOrdId == chain.in_flight.ClOrdId
+            if in_flight and msg.ExecType == constants.ExecType_ReplacedExec:
+                return self._release(chain, msg.ClOrdId)
+            if in_flight and msg.ExecType == constants.ExecType_RejectedExec:
+                # replace is rejected, order keeps acknowledged ClOrdId
+                return self._release(chain, chain.cl_ord_id)
+
+            if msg.OrdStatus in TERMINAL_STATUSES and msg.ExecType != constants.ExecType_OrderStatus:
+                if chain.pending is not None:
+                    self._log.debug('drop replace %s for done order %s', chain.pending.ClOrdId, chain.cl_ord_id)
+                self._drop(chain)
+            return []
+
+        if msg.MsgType == constants.MsgType_OrderCancelRejectMsgType:
+            chain = self._aliases.get(msg.ClOrdId)
+            if chain is not None and chain.in_flight is not None and msg.ClOrdId == chain.in_flight.ClOrdId:
+                # order keeps acknowledged ClOrdId
+                return self._release(chain, chain.cl_ord_id)
+
+        return []
+
+    def clear(self):
+        """Forget all replaces, e.g. after reconnect when acknowledgements could be lost"""
+
+        self._chains = {}
+        self._aliases = {}
@@ -0,0 +1,116 @@
+import itertools
+import logging
+
+
+# value of key parts for messages without the field, never equal to a filter or a wildcard
+_MISSING = object()
+
+
+class Dispatcher:
+    """Message handlers indexed by (MsgType, Account, Symbol, ClOrdId prefix).
+
+    Any part of the key could be None to match every value. Handlers for a message are found
+    with at most one dict lookup per used combination of wildcards, so the cost does not depend
+    on the number of handlers.
+
+    ClOrdId prefix is the part of ClOrdId before the first :separator, so strategies could mark
+    their orders like "grid1-..." and receive only reports for them.
+    """
+
+    def __init__(self, separator='-'):
+        self._log = logging.getLogger(__name__)
+        self._separator = separator
+        # key -> list of (handle, callback)
+        self._handlers = {}
+        # handle -> list of keys
+        self._keys = {}
+        # wildcard pattern -> number of keys using it
+        self._patterns = {}
+        self._handle_ids = itertools.count(1)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def prefix(self, cl_ord_id):
+        return cl_ord_id.split(self._separator, 1)[0]
+
+    @staticmethod
+    def _pattern(key):
+        # bit i is set if part i of the key is a wildcard
+        return sum(1 << i for i, part in enumerate(key) if part is None)
+
+    def add(self, callback, msg_types=None, account=None, symbol=None, prefix=None):
+        """Add :callback for messages matching all not None filters
+
+        :param callback: required
+        :type callback: async coroutine
+        :param msg_types: MsgType or list of MsgType
+        :type msg_types: str or list of str
+        :param account: filter by Account
+        :type account: int
+        :param symbol: filter by Symbol
+        :type symbol: str
+        :param prefix: filter by ClOrdId prefix
+        :type prefix: str
+
+        :returns: handle to use in remove()
+        """
+
+        if msg_types is None or isinstance(msg_types, str):
+            msg_types = [msg_types]
+
+        handle = next(self._handle_ids)
+        keys = []
+        for msg_type in msg_types:
+            key = (msg_type, account, symbol, prefix)
+            if key not in self._handlers:
+                self._handlers[key] = []
+                pattern = self._pattern(key)
+                self._patterns[pattern] = self._patterns.get(pattern, 0) + 1
+            self._handlers[key].append((handle, callback))
+            keys.append(key)
+
+        self._keys[handle] = keys
+        return handle
+
+    def remove(self, handle):
+        """Remove handlers added with add(), unknown handles raise KeyError"""
+
+        for key in self._keys.pop(handle):
+            handlers = [item for item in self._handlers[key] if item[0] != handle]
+            if handlers:
+                self._handlers[key] = handlers
+                continue
+
+            del self._handlers[key]
+            pattern = self._pattern(key)
+            self._patterns[pattern] -= 1
+            if self._patterns[pattern] == 0:
+                del self._patterns[pattern]
+
+    def handlers(self, msg):
+        """Callbacks for :msg in the order they were added"""
+
+        if not self._patterns:
+            return []
+
+        account = getattr(msg, 'Account', _MISSING)
+        symbol = getattr(msg, 'Symbol', _MISSING)
+        cl_ord_id = getattr(msg, 'ClOrdId', _MISSING)
+        parts = (msg.MsgType, account, symbol, _MISSING if cl_ord_id is _MISSING else self.prefix(cl_ord_id))
+
+        found = []
+        for pattern in self._patterns:
+            key = tuple(None if pattern & (1 << i) else part for i, part in enumerate(parts))
+            found.extend(self._handlers.get(key, ()))
+
+        if len(found) > 1:
+            found.sort(key=lambda item: item[0])
+        return [callback for _, callback in found]
+
+    async def dispatch(self, client, msg):
+        for callback in self.handlers(msg):
+            try:
+                await callback(client, msg)
+            except Exception:
+                self._log.exception('dispatch handler')
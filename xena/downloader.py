@@ -0,0 +1,260 @@
+import asyncio
+import collections
+import logging
+import os
+import time
+
+import numpy as np
+
+from xena.candles import COLUMNS as CANDLE_COLUMNS, timeframe_ns
+from xena.paginate import paginate
+
+
+TRADE_COLUMNS = ('ts', 'price', 'qty', 'side', 'trade_id')
+
+_HOUR = 60 * 60 * 1000000000
+
+
+def _px(value):
+    if value == "":
+        return 0.0
+    return float(value)
+
+
+def _side(value):
+    if value == "":
+        return 0
+    return int(value)
+
+
+def windows(ts_from, ts_to, size):
+    """Split [ts_from, ts_to) into [start, end) windows of :size nanoseconds, the last one could be shorter"""
+
+    if size <= 0:
+        raise ValueError("Window size has to be positive")
+
+    result = []
+    start = ts_from
+    while start < ts_to:
+        end = min(start + size, ts_to)
+        result.append((start, end))
+        start = end
+    return result
+
+
+# dtype of columns which are not float64
+_DTYPES = {
+    'ts': np.int64,
+    'side': np.int8,
+    'trade_id': 'U',
+}
+
+
+def _empty(columns):
+    return {name: np.zeros(0, dtype=_DTYPES.get(name, np.float64)) for name in columns}
+
+
+def _concat(chunks, columns):
+    if not chunks:
+        return _empty(columns)
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in columns}
+
+
+def merge(chunks, columns=CANDLE_COLUMNS, ts_from=None):
+    """Concatenate columnar chunks, sort by ts and drop duplicates, the last chunk wins for candles
+    with the same ts, trades are unique by (ts, trade_id)
+
+    :param ts_from: drop rows with ts before it, unixtimestamp in nanoseconds
+    :type ts_from: int
+    :returns: dict of column name to numpy array
+    """
+
+    result = _concat(chunks, columns)
+    if ts_from is not None:
+        keep = result['ts'] >= ts_from
+        result = {name: column[keep] for name, column in result.items()}
+    if len(result['ts']) == 0:
+        return result
+
+    if 'trade_id' in result:
+        # lexsort sorts by the last key first
+        order = np.lexsort((result['trade_id'], result['ts']))
+        result = {name: column[order] for name, column in result.items()}
+        keep = np.ones(len(order), dtype=bool)
+        keep[1:] = (result['ts'][1:] != result['ts'][:-1]) | (result['trade_id'][1:] != result['trade_id'][:-1])
+    else:
+        # stable sort keeps chunk order among bars with the same ts, so the last one is the latest
+        order = np.argsort(result['ts'], kind='stable')
+        result = {name: column[order] for name, column in result.items()}
+        keep = np.ones(len(order), dtype=bool)
+        keep[:-1] = result['ts'][1:] != result['ts'][:-1]
+
+    return {name: column[keep] for name, column in result.items()}
+
+
+class HistoryDownloader:
+    """Download long history of candles or trades with XenaMDClient.
+
+    [ts_from, ts_to) range is split into windows which fit into one request (candles) or a few pages (trades),
+    up to :concurrency windows are downloaded at once. Each window is a columnar chunk, chunks are
+    streamed in time order by chunks() or merged into one sorted result without duplicates by candles() and trades().
+
+    If :checkpoint_dir is set, every downloaded window is saved there as npz file, so an interrupted
+    download started again with the same arguments requests only the missing windows.
+    """
+
+    # max number of bars returned by one candles request
+    MAX_CANDLES = 1000
+    TRADES_WINDOW = _HOUR
+    # a page shorter than this is the last page of the window, so it must not exceed the server page cap
+    TRADES_PAGE_SIZE = 500
+
+    def __init__(self, md_client, concurrency=4, checkpoint_dir=None):
+        """
+        :param md_client: required
+        :type md_client: xena.rest.XenaMDClient
+        :param concurrency: max number of windows downloaded at once
+        :type concurrency: int
+        :param checkpoint_dir: directory to keep downloaded windows in
+        :type checkpoint_dir: str
+        """
+
+        if concurrency < 1:
+            raise ValueError("Concurrency has to be positive")
+
+        self._log = logging.getLogger(__name__)
+        self._client = md_client
+        self._concurrency = concurrency
+        self._checkpoint_dir = checkpoint_dir
+        if checkpoint_dir is not None:
+            os.makedirs(checkpoint_dir, exist_ok=True)
+        self.requests = 0
+        self.resumed = 0
+
+    def _checkpoint_path(self, name, start, end):
+        if self._checkpoint_dir is None:
+            return None
+        return os.path.join(self._checkpoint_dir, '{}-{}-{}.npz'.format(name.replace('/', '_'), start, end))
+
+    def _load(self, path):
+        if path is None or not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                return {name: data[name] for name in data.files}
+        except Exception:
+            self._log.exception('load checkpoint %s', path)
+            return None
+
+    def _save(self, path, chunk):
+        if path is None:
+            return
+        tmp = path + '.tmp.npz'
+        np.savez(tmp, **chunk)
+        os.replace(tmp, path)
+
+    async def _candles_window(self, symbol, timeframe, start, end):
+        self.requests += 1
+        msg = await self._client.candles(symbol, timeframe, ts_from=start, ts_to=end)
+        entries = [entry for entry in msg.MDEntry if start <= entry.TransactTime < end]
+        return {
+            'ts': np.array([entry.TransactTime for entry in entries], dtype=np.int64),
+            'open': np.array([_px(entry.FirstPx) for entry in entries]),
+            'high': np.array([_px(entry.HighPx) for entry in entries]),
+            'low': np.array([_px(entry.LowPx) for entry in entries]),
+            'close': np.array([_px(entry.LastPx) for entry in entries]),
+            'volume': np.array([_px(entry.BuyVolume) + _px(entry.SellVolume) for entry in entries]),
+        }
+
+    async def _trades_window(self, symbol, start, end):
+        async def fetch(page, limit):
+            self.requests += 1
+            return await self._client.trades(symbol, ts_from=start, ts_to=end, page=page, limit=limit)
+
+        # pages of one window are requested one by one, concurrency is spent on windows
+        entries = [entry async for entry in paginate(fetch, self.TRADES_PAGE_SIZE, 1) if start <= entry.TransactTime < end]
+        return {
+            'ts': np.array([entry.TransactTime for entry in entries], dtype=np.int64),
+            'price': np.array([_px(entry.MDEntryPx) for entry in entries]),
+            'qty': np.array([_px(entry.MDEntrySize) for entry in entries]),
+            'side': np.array([_side(entry.AggressorSide) for entry in entries], dtype=np.int8),
+            'trade_id': np.array([entry.TradeId for entry in entries], dtype='U'),
+        }
+
+    async def _window(self, name, start, end, fetch):
+        path = self._checkpoint_path(name, start, end)
+        chunk = self._load(path)
+        if chunk is not None:
+            self.resumed += 1
+            return chunk
+
+        chunk = await fetch(start, end)
+        # the window reaching now could still change
+        if end <= int(time.time() * 1000000000):
+            self._save(path, chunk)
+        return chunk
+
+    async def _chunks(self, name, spans, fetch):
+        pending = collections.deque()
+        spans = collections.deque(spans)
+        try:
+            while spans or pending:
+                while spans and len(pending) < self._concurrency:
+                    start, end = spans.popleft()
+                    pending.append((start, end, asyncio.ensure_future(self._window(name, start, end, fetch))))
+
+                start, end, task = pending.popleft()
+                yield start, end, await task
+        finally:
+            for _, _, task in pending:
+                task.cancel()
+
+    def chunks(self, symbol, ts_from, ts_to, timeframe=None, window=None):
+        """Async generator of (window_from, window_to, columns) in time order, candles windows start at the bar
+        boundary, so the first one could have a bar before :ts_from
+
+        :param symbol: required
+        :type symbol: str
+        :param ts_from: required, unixtimestamp in nanoseconds
+        :type ts_from: int
+        :param ts_to: required, unixtimestamp in nanoseconds
+        :type ts_to: int
+        :param timeframe: candles timeframe like '1m', trades are downloaded if not set
+        :type timeframe: str
+        :param window: window size in nanoseconds, MAX_CANDLES bars or TRADES_WINDOW if not set
+        :type window: int
+        """
+
+        if timeframe is None:
+            name = 'trades-' + symbol
+            window = window or self.TRADES_WINDOW
+            fetch = lambda start, end: self._trades_window(symbol, start, end)
+        else:
+            duration = timeframe_ns(timeframe)
+            name = 'candles-{}-{}'.format(symbol, timeframe)
+            window = window or duration * self.MAX_CANDLES
+            # windows start at bar boundaries, so no bar is split between two requests
+            ts_from -= ts_from % duration
+            window = max(duration, window - window % duration)
+            fetch = lambda start, end: self._candles_window(symbol, timeframe, start, end)
+
+        return self._chunks(name, windows(ts_from, ts_to, window), fetch)
+
+    async def candles(self, symbol, timeframe, ts_from, ts_to, window=None):
+        """Bars with ts in [ts_from, ts_to) merged from all windows
+
+        :returns: dict of column name to numpy array, see xena.candles.COLUMNS
+        """
+
+        chunks = [chunk async for _, _, chunk in self.chunks(symbol, ts_from, ts_to, timeframe, window)]
+        # the first window starts at the bar boundary before ts_from
+        return merge(chunks, CANDLE_COLUMNS, ts_from)
+
+    async def trades(self, symbol, ts_from, ts_to, window=None):
+        """Trades with TransactTime in [ts_from, ts_to) merged from all windows
+
+        :returns: dict of column name to numpy array, see xena.downloader.TRADE_COLUMNS
+        """
+
+        chunks = [chunk async for _, _, chunk in self.chunks(symbol, ts_from, ts_to, None, window)]
+        return merge(chunks, TRADE_COLUMNS)
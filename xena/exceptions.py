@@ -32,3 +32,30 @@ class RequestException(Exception):
             return 'RequestException({}): {}'.format(self.status_code, self.response)
         else:
             return 'RequestException({}): {}'.format(self.status_code, self.error)
+
+
+class ConnectionClosedException(Exception):
+    pass
+
+
+class RiskRejectException(Exception):
+    """Order rejected locally by xena.risk.RiskGate"""
+
+    def __init__(self, check, limit, value, cmd):
+        super().__init__('Risk check "{}" failed for {} {}: {} exceeds limit {}'.format(
+            check, getattr(cmd, 'Symbol', ''), getattr(cmd, 'ClOrdId', ''), value, limit))
+        self.check = check
+        self.limit = limit
+        self.value = value
+        self.cmd = cmd
+
+
+class NormalizationException(ValueError):
+    """Order field does not fit instrument rules, see xena.normalize.OrderNormalizer"""
+
+    def __init__(self, symbol, field, value, reason):
+        super().__init__('{} {}="{}": {}'.format(symbol, field, value, reason))
+        self.symbol = symbol
+        self.field = field
+        self.value = value
+        self.reason = reason
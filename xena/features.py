@@ -0,0 +1,169 @@
+import math
+
+import numpy as np
+
+
+MICROPRICE = 'microprice'
+MID = 'mid'
+SPREAD_TICKS = 'spread_ticks'
+IMBALANCE = 'imbalance'
+WEIGHTED_MID = 'weighted_mid'
+
+_TOP_OF_BOOK = (MICROPRICE, MID, SPREAD_TICKS)
+_KINDS = _TOP_OF_BOOK + (IMBALANCE, WEIGHTED_MID)
+
+
+class _SymbolState:
+
+    def __init__(self, depths, size):
+        self.values = np.full(size, np.nan)
+        # depth -> [size, notional] of top depth levels for bids and asks
+        self.bids = {depth: [0, 0] for depth in depths}
+        self.asks = {depth: [0, 0] for depth in depths}
+
+
+class FeatureEngine:
+    """Book features updated incrementally from touched levels.
+
+    Features are registered once before the engine is attached to books, after that every symbol gets
+    a flat numpy array of feature values which is updated in place, use index() to find feature position.
+    Only sums of top levels that are affected by the change are updated, so each DOM change costs
+    O(number of registered depths) instead of a scan of the book. For books with fixed points
+    prices in features are in ticks and sizes in lots.
+
+    Usage::
+
+        engine = FeatureEngine()
+        imbalance = engine.register(features.IMBALANCE, depth=5)
+        books.add_listener(engine)
+        ...
+        value = engine.features("BTC/USDT")[imbalance]
+    """
+
+    def __init__(self, tick_sizes=None):
+        """
+        :param tick_sizes: price step per symbol, used by spread_ticks feature for books without fixed points
+        :type tick_sizes: dict of str to float
+        """
+
+        self._tick_sizes = dict(tick_sizes or {})
+        self._names = []
+        self._features = []
+        self._depths = set()
+        self._states = {}
+
+    def register(self, kind, depth=1):
+        """Register feature and return its index in features array
+
+        :param kind: one of xena.features.MICROPRICE, MID, SPREAD_TICKS, IMBALANCE, WEIGHTED_MID
+        :type kind: str
+        :param depth: number of levels used by IMBALANCE and WEIGHTED_MID
+        :type depth: int
+        """
+
+        if self._states:
+            raise ValueError("Features have to be registered before the first book update")
+        if kind not in _KINDS:
+            raise ValueError("Unknown feature \"{}\"".format(kind))
+        if kind in _TOP_OF_BOOK:
+            depth = 1
+        if depth < 1:
+            raise ValueError("Depth has to be positive")
+
+        name = kind if kind in _TOP_OF_BOOK else "{}:{}".format(kind, depth)
+        if name in self._names:
+            return self._names.index(name)
+
+        self._names.append(name)
+        self._features.append((kind, depth))
+        self._depths.add(depth)
+        self._depths.add(1)
+        return len(self._names) - 1
+
+    def index(self, name):
+        """Index of feature by name, like 'microprice' or 'imbalance:5'"""
+
+        return self._names.index(name)
+
+    @property
+    def names(self):
+        return list(self._names)
+
+    def set_tick_size(self, symbol, tick_size):
+        self._tick_sizes[symbol] = tick_size
+
+    def features(self, symbol):
+        """Array of feature values for :symbol, NaN if value is unknown"""
+
+        if symbol not in self._states:
+            return np.full(len(self._names), np.nan)
+        return self._states[symbol].values
+
+    def _state(self, symbol):
+        if symbol not in self._states:
+            self._states[symbol] = _SymbolState(self._depths, len(self._names))
+        return self._states[symbol]
+
+    def on_reset(self, book):
+        state = self._state(book.symbol)
+        for sums, side in ((state.bids, book.bids), (state.asks, book.asks)):
+            for depth in sums:
+                levels = side.levels(depth)
+                sums[depth] = [sum(size for _, size in levels), sum(price * size for price, size in levels)]
+
+        self._compute(book, state, 0)
+
+    def on_level(self, book, side, rank, price, old_size, new_size):
+        if book.symbol not in self._states:
+            self.on_reset(book)
+            return
+
+        state = self._states[book.symbol]
+        sums = state.bids if side.is_bid else state.asks
+        for depth, total in sums.items():
+            if rank >= depth:
+                continue
+
+            total[0] += new_size - old_size
+            total[1] += price * (new_size - old_size)
+            if old_size == 0 and len(side) > depth:
+                # new level pushed the last one out of the top
+                out_price, out_size = side.level(depth)
+                total[0] -= out_size
+                total[1] -= out_price * out_size
+            elif new_size == 0 and len(side) >= depth:
+                # removed level let the next one into the top
+                in_price, in_size = side.level(depth - 1)
+                total[0] += in_size
+                total[1] += in_price * in_size
+
+        self._compute(book, state, rank)
+
+    def _compute(self, book, state, rank):
+        values = state.values
+        best_bid = book.best_bid
+        best_ask = book.best_ask
+        for i, (kind, depth) in enumerate(self._features):
+            if rank >= depth:
+                continue
+
+            value = math.nan
+            if kind in _TOP_OF_BOOK:
+                if best_bid is not None and best_ask is not None:
+                    if kind == MID:
+                        value = (best_bid[0] + best_ask[0]) / 2
+                    elif kind == MICROPRICE:
+                        value = (best_bid[0] * best_ask[1] + best_ask[0] * best_bid[1]) / (best_bid[1] + best_ask[1])
+                    elif book.price_fixed_point is not None:
+                        value = best_ask[0] - best_bid[0]
+                    elif book.symbol in self._tick_sizes:
+                        value = (best_ask[0] - best_bid[0]) / self._tick_sizes[book.symbol]
+            else:
+                bid_size, bid_notional = state.bids[depth]
+                ask_size, ask_notional = state.asks[depth]
+                if kind == IMBALANCE and bid_size + ask_size > 0:
+                    value = (bid_size - ask_size) / (bid_size + ask_size)
+                elif kind == WEIGHTED_MID and bid_size > 0 and ask_size > 0:
+                    value = (bid_notional + ask_notional) / (bid_size + ask_size)
+
+            values[i] = value
@@ -138,6 +138,38 @@ def mit_order(account, client_order_id, symbol, side, stop_price, qty, **kwargs)
     kwargs["stop_price"] = stop_price
     return order(account, client_order_id, constants.OrdType_MarketIfTouched, symbol, side, qty, **kwargs)
 
+def order_list(account, list_id, orders, symbol="", contingency_type=None):
+    """Create NewOrderList from given NewOrderSingle :orders, ListSeqNo of orders is set in the given order.
+    For more info about NewOrderList look at https://support.xena.exchange/support/solutions/articles/44000222082-ws-trading-api
+    """
+
+    cmd = order_pb2.NewOrderList()
+    cmd.MsgType = constants.MsgType_NewOrderListMsgType
+    cmd.ListId = list_id
+    cmd.BidType = constants.BidType_NoBiddingProcess
+    cmd.TotNoOrders = len(orders)
+    cmd.Symbol = symbol
+    cmd.TransactTime = int(time.time() * 1000000000)
+    cmd.Account = account
+
+    if contingency_type is not None:
+        cmd.ContingencyType = contingency_type
+
+    for seq_no, element in enumerate(orders, 1):
+        if not isinstance(element, order_pb2.NewOrderSingle):
+            raise ValueError("Orders of the list have to be NewOrderSingle")
+
+        list_order = cmd.ListOrdGrp.add()
+        list_order.CopyFrom(element)
+        list_order.ListSeqNo = seq_no
+
+    return cmd
+
+def oco_order_list(account, list_id, first, second):
+    """Wrapper around order_list() method to create "one cancels the other" list of two orders"""
+
+    return order_list(account, list_id, [first, second], first.Symbol, constants.ContingencyType_OneCancelsTheOther)
+
 def for_position(cmd, position_id):
     """ Helper to make order for position close"""
 
@@ -176,16 +208,53 @@ def add_take_profit(cmd, price):
     sltp.Price = price
 
 
-def aggregate_positions_volume(positions):
+def _lots_to_decimal(fixed_point, lots, scale):
+    """Sum of lots as Decimal with :scale fraction digits, the same as the sum of volume strings as Decimals"""
+
+    return (Decimal(lots) * fixed_point.step).quantize(Decimal(1).scaleb(-scale))
+
+
+def aggregate_positions_volume(positions, instruments=None):
+    """Sum signed volume of :positions per symbol.
+    If :instruments (xena.instruments.InstrumentCache) is set, volumes of known symbols are summed as int lots,
+    symbols with volume off the lot step are summed as Decimal. Volumes are formatted the same way in both cases.
+    """
+
+    # symbol -> (lots, max number of fraction digits)
+    lots = {}
     tmp_res = {}
     for position in positions:
-        if position.Symbol not in tmp_res:
-            tmp_res[position.Symbol] = Decimal(0)
+        symbol = position.Symbol
+        volume = None
+        if instruments is not None and symbol in instruments and symbol not in tmp_res:
+            int_part, _, frac = position.Volume.lstrip('-').partition('.')
+            # exponent notation changes the format of Decimal sum, so it is summed as Decimal
+            if int_part.isdigit() and (frac == "" or frac.isdigit()):
+                try:
+                    volume = instruments.qty_fixed_point(symbol).parse(position.Volume)
+                except ValueError:
+                    pass
+
+            if volume is None and symbol in lots:
+                tmp_res[symbol] = _lots_to_decimal(instruments.qty_fixed_point(symbol), *lots.pop(symbol))
+
+        if volume is not None:
+            if position.Side == constants.Side_Sell:
+                volume = -volume
+            total, scale = lots.get(symbol, (0, 0))
+            lots[symbol] = (total + volume, max(scale, len(frac)))
+            continue
+
+        if symbol not in tmp_res:
+            tmp_res[symbol] = Decimal(0)
 
         mul = Decimal(1)
         if position.Side == constants.Side_Sell:
             mul = Decimal(-1)
 
-        tmp_res[position.Symbol] += Decimal(position.Volume) * mul
+        tmp_res[symbol] += Decimal(position.Volume) * mul
 
-    return {symbol: str(volume) for symbol, volume in tmp_res.items()}
+    result = {symbol: str(volume) for symbol, volume in tmp_res.items()}
+    for symbol, (total, scale) in lots.items():
+        result[symbol] = str(_lots_to_decimal(instruments.qty_fixed_point(symbol), total, scale))
+    return result
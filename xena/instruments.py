@@ -0,0 +1,225 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from decimal import Decimal
+
+import xena.proto.common_pb2 as common_pb2
+import xena.serialization as serialization
+from xena.ticks import FixedPoint
+
+
+def price_step(instrument):
+    """Minimal price increment of :instrument, TickSize in units of the last price digit (10^-PricePrecision)"""
+
+    return Decimal(instrument.TickSize or 1).scaleb(-instrument.PricePrecision)
+
+
+def qty_step(instrument):
+    """Minimal order quantity increment of :instrument"""
+
+    return Decimal(instrument.OrderQtyStep or instrument.MinOrderQty or 1)
+
+
+class _InstrumentIndex:
+
+    def __init__(self, path=None, ttl=3600):
+        self._log = logging.getLogger(__name__)
+        self._path = path
+        self._ttl = ttl
+        self._instruments = {}
+        self._price_steps = {}
+        self._price_fixed_points = {}
+        self._qty_fixed_points = {}
+        self.loaded_at = 0
+
+    def __len__(self):
+        return len(self._instruments)
+
+    def __contains__(self, symbol):
+        return symbol in self._instruments
+
+    def __getitem__(self, symbol):
+        return self._instruments[symbol]
+
+    def get(self, symbol, default=None):
+        """xena.proto.common_pb2.Instrument for :symbol"""
+
+        return self._instruments.get(symbol, default)
+
+    def symbols(self):
+        return list(self._instruments)
+
+    def instruments(self):
+        return list(self._instruments.values())
+
+    def tick_size(self, symbol):
+        return self._instruments[symbol].TickSize
+
+    def price_precision(self, symbol):
+        return self._instruments[symbol].PricePrecision
+
+    def price_step(self, symbol):
+        """Minimal price increment as Decimal, see xena.instruments.price_step"""
+
+        return self._price_steps[symbol]
+
+    def price_fixed_point(self, symbol):
+        """xena.ticks.FixedPoint to convert :symbol prices to ticks and back"""
+
+        return self._price_fixed_points[symbol]
+
+    def qty_fixed_point(self, symbol):
+        """xena.ticks.FixedPoint to convert :symbol quantities to lots of OrderQtyStep and back"""
+
+        return self._qty_fixed_points[symbol]
+
+    def qty_step(self, symbol):
+        return self._instruments[symbol].OrderQtyStep
+
+    def min_qty(self, symbol):
+        return self._instruments[symbol].MinOrderQty
+
+    def max_qty(self, symbol):
+        return self._instruments[symbol].MaxOrderQty
+
+    def margin(self, symbol):
+        """xena.proto.common_pb2.Margin for :symbol"""
+
+        return self._instruments[symbol].Margin
+
+    @property
+    def stale(self):
+        return time.time() - self.loaded_at >= self._ttl
+
+    def _set(self, instruments, loaded_at=None):
+        self._instruments = {instrument.Symbol: instrument for instrument in instruments}
+        self._price_steps = {instrument.Symbol: price_step(instrument) for instrument in instruments}
+        self._price_fixed_points = {symbol: FixedPoint(step) for symbol, step in self._price_steps.items()}
+        self._qty_fixed_points = {instrument.Symbol: FixedPoint(qty_step(instrument)) for instrument in instruments}
+        self.loaded_at = time.time() if loaded_at is None else loaded_at
+
+    def _load_file(self):
+        if self._path is None or not os.path.exists(self._path):
+            return False
+
+        try:
+            with open(self._path, 'r') as fp:
+                instruments = serialization.from_json(fp.read(), to=common_pb2.Instrument)
+            self._set(instruments, os.path.getmtime(self._path))
+            return True
+        except Exception:
+            self._log.exception('load instruments from %s', self._path)
+            return False
+
+    def _save_file(self):
+        if self._path is None:
+            return
+
+        tmp = self._path + '.tmp'
+        with open(tmp, 'w') as fp:
+            fp.write('[' + ','.join(serialization.to_json(instrument) for instrument in self._instruments.values()) + ']')
+        os.replace(tmp, self._path)
+
+
+class InstrumentCache(_InstrumentIndex):
+    """Instruments indexed by Symbol, loaded once from XenaMDClient.instruments() and refreshed in background.
+
+    If :path is set, instruments are persisted to that file, so the next start does not wait for REST
+    and works offline with the last known instruments.
+    """
+
+    def __init__(self, md_client, path=None, ttl=3600, loop=None):
+        """
+        :param md_client: required
+        :type md_client: xena.rest.XenaMDClient
+        :param path: file to persist instruments
+        :type path: str
+        :param ttl: refresh interval in seconds
+        :type ttl: int
+        """
+
+        super().__init__(path, ttl)
+        self._client = md_client
+        self._loop = loop
+        self._future_refresh = None
+
+    async def start(self):
+        """Load instruments from file or REST and start background refresh.
+        Fails only if instruments are available from neither of them.
+        """
+
+        if not self._load_file() or self.stale:
+            try:
+                await self.refresh()
+            except Exception:
+                if len(self) == 0:
+                    raise
+                self._log.exception('refresh instruments, using instruments from %s', self._path)
+
+        if self._future_refresh is None:
+            self._future_refresh = asyncio.ensure_future(self._refresh_loop(), loop=self._loop)
+
+    async def refresh(self):
+        self._set(await self._client.instruments())
+        self._save_file()
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(max(0, self.loaded_at + self._ttl - time.time()))
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self._log.exception('refresh instruments')
+                await asyncio.sleep(min(self._ttl, 60))
+
+    async def close(self):
+        if self._future_refresh is not None:
+            self._future_refresh.cancel()
+            self._future_refresh = None
+
+
+class InstrumentSyncCache(_InstrumentIndex):
+    """All docs look up at InstrumentCache, refresh runs in a daemon thread"""
+
+    def __init__(self, md_client, path=None, ttl=3600):
+        super().__init__(path, ttl)
+        self._client = md_client
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if not self._load_file() or self.stale:
+            try:
+                self.refresh()
+            except Exception:
+                if len(self) == 0:
+                    raise
+                self._log.exception('refresh instruments, using instruments from %s', self._path)
+
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._refresh_loop, daemon=True)
+            self._thread.start()
+
+    def refresh(self):
+        self._set(self._client.instruments())
+        self._save_file()
+
+    def _refresh_loop(self):
+        while not self._stop.wait(max(0, self.loaded_at + self._ttl - time.time())):
+            try:
+                self.refresh()
+            except Exception:
+                self._log.exception('refresh instruments')
+                if self._stop.wait(min(self._ttl, 60)):
+                    break
+
+    def close(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,256 @@
+import asyncio
+import itertools
+import logging
+import time
+from decimal import Decimal, ROUND_HALF_UP
+
+import xena.proto.constants as constants
+import xena.proto.order_pb2 as order_pb2
+import xena.helpers as helpers
+
+
+# execution reports which do not finish a command
+_PENDING_EXEC_TYPES = frozenset([
+    constants.ExecType_PendingNewExec,
+    constants.ExecType_PendingCancelExec,
+    constants.ExecType_PendingReplaceExec,
+])
+
+
+def ladder_diff(desired, live, price_key=Decimal, qty_key=Decimal):
+    """Minimal set of changes turning :live orders into :desired levels.
+
+    Per side, orders matching a level exactly are kept, orders at a level price with other qty are replaced
+    with the new qty, the rest of orders are replaced to the rest of levels from the best price, and only
+    the remaining levels or orders become new orders or cancels.
+
+    :param desired: required
+    :type desired: iterable of (side, price, qty)
+    :param live: required
+    :type live: iterable of xena.orders.Order
+    :param price_key: function to make comparable price from string
+    :type price_key: callable
+    :param qty_key: function to make comparable qty from string
+    :type qty_key: callable
+
+    :returns: (list of new (side, price, qty), list of (order, price, qty) to replace, list of orders to cancel)
+    """
+
+    new, replace, cancel = [], [], []
+    for side in (constants.Side_Buy, constants.Side_Sell):
+        levels = {}
+        for level_side, price, qty in desired:
+            if level_side == side:
+                levels[price_key(price)] = (price, qty)
+
+        orders = {}
+        extra = []
+        for order in live:
+            if order.side != side:
+                continue
+            key = price_key(order.price)
+            if key in orders:
+                # the second order at the same price
+                extra.append(order)
+            else:
+                orders[key] = order
+
+        for key in list(orders):
+            if key not in levels:
+                continue
+            order = orders.pop(key)
+            price, qty = levels.pop(key)
+            if qty_key(order.leaves_qty or order.order_qty) != qty_key(qty):
+                replace.append((order, price, qty))
+
+        # the best prices first, so ladder moves without crossing itself
+        reverse = side == constants.Side_Buy
+        rest_levels = [levels[key] for key in sorted(levels, reverse=reverse)]
+        rest_orders = [orders[key] for key in sorted(orders, reverse=reverse)] + extra
+        for order, (price, qty) in zip(rest_orders, rest_levels):
+            replace.append((order, price, qty))
+        for price, qty in rest_levels[len(rest_orders):]:
+            new.append((side, price, qty))
+        cancel.extend(rest_orders[len(rest_levels):])
+
+    return new, replace, cancel
+
+
+class LadderManager:
+    """Keeps limit orders of :account for :symbol equal to the desired price ladder with minimal number of commands.
+
+    Orders of the ladder are recognized by ClOrdId prefix, live state comes from XenaTradingWebsocketClient.order_store,
+    so the client has to be created with track_orders=True. Commands of one update are sent as a batch and the next
+    update waits until every command of the batch is acknowledged, intermediate desired ladders are skipped.
+    Acknowledgements lost with the connection are not waited for after reconnect.
+    """
+
+    def __init__(self, ws, account, symbol, prefix='ladder', instruments=None, **order_kwargs):
+        """
+        :param ws: required
+        :type ws: xena.websocket.XenaTradingWebsocketClient
+        :param prefix: ClOrdId prefix of the ladder orders, has to be unique per ladder and must not contain "-"
+        :type prefix: str
+        :param instruments: if set, prices and quantities are compared in ticks and lots of :symbol
+        :type instruments: xena.instruments.InstrumentCache
+        :param order_kwargs: passed to xena.helpers.limit_order for new orders
+        """
+
+        if ws.order_store is None:
+            raise ValueError("Trading client has to be created with track_orders=True")
+        if '-' in prefix:
+            raise ValueError("Prefix must not contain \"-\"")
+
+        self._log = logging.getLogger(__name__)
+        self._ws = ws
+        self.account = account
+        self.symbol = symbol
+        self.prefix = prefix
+        self._instruments = instruments
+        self._order_kwargs = order_kwargs
+        self._ids = itertools.count(1)
+        self._id_base = str(int(time.time() * 1000))
+        # ClOrdId of commands sent, but not acknowledged
+        self._in_flight = set()
+        # the latest desired ladder which is not applied yet
+        self._desired = None
+        # number of sent commands
+        self.sent = 0
+        self._listener = ws.listen_filtered(
+            self._on_message, [constants.MsgType_ExecutionReportMsgType, constants.MsgType_OrderCancelRejectMsgType],
+            account, symbol, prefix)
+        ws.on_connection_close(self._on_connection_close)
+
+    @property
+    def acknowledged(self):
+        return len(self._in_flight) == 0
+
+    def _next_id(self):
+        return '{}-{}-{}'.format(self.prefix, self._id_base, next(self._ids))
+
+    def _keys(self):
+        if self._instruments is not None and self.symbol in self._instruments:
+            price = self._instruments.price_fixed_point(self.symbol)
+            qty = self._instruments.qty_fixed_point(self.symbol)
+            return (lambda value: price.parse(value, ROUND_HALF_UP)), (lambda value: qty.parse(value, ROUND_HALF_UP))
+        return Decimal, Decimal
+
+    def live_orders(self):
+        """Open ladder orders without pending cancel or replace"""
+
+        return [
+            order for order in self._ws.order_store.open_orders(self.account, self.symbol)
+            if order.pending_cl_ord_id == "" and order.cl_ord_id.split('-', 1)[0] == self.prefix
+        ]
+
+    def _replace(self, order, price, qty):
+        if order.report is not None:
+            cmd = helpers.replace_from_execution_report(self._next_id(), order.report)
+        else:
+            cmd = order_pb2.OrderCancelReplaceRequest()
+            cmd.MsgType = constants.MsgType_OrderCancelReplaceRequestMsgType
+            cmd.ClOrdId = self._next_id()
+            cmd.Symbol = order.symbol
+            cmd.Side = order.side
+            cmd.TransactTime = int(time.time() * 1000000000)
+            cmd.Account = order.account
+        cmd.OrigClOrdId = order.cl_ord_id
+        cmd.Price = price
+        # OrderQty includes filled qty, level qty is what is left
+        cmd.OrderQty = str(Decimal(qty) + Decimal(order.cum_qty)) if order.cum_qty not in ("", "0") else qty
+        return cmd
+
+    def _cancel(self, order):
+        cmd = order_pb2.OrderCancelRequest()
+        cmd.MsgType = constants.MsgType_OrderCancelRequestMsgType
+        cmd.ClOrdId = self._next_id()
+        cmd.OrigClOrdId = order.cl_ord_id
+        cmd.Symbol = order.symbol
+        cmd.Side = order.side
+        cmd.TransactTime = int(time.time() * 1000000000)
+        cmd.Account = order.account
+        return cmd
+
+    def commands(self, desired):
+        """Commands to turn live orders into :desired ladder, cancels first, then replaces and new orders
+
+        :param desired: required
+        :type desired: iterable of (side, price, qty)
+        """
+
+        price_key, qty_key = self._keys()
+        new, replace, cancel = ladder_diff(list(desired), self.live_orders(), price_key, qty_key)
+
+        cmds = [self._cancel(order) for order in cancel]
+        cmds.extend(self._replace(order, price, qty) for order, price, qty in replace)
+        cmds.extend(
+            helpers.limit_order(self.account, self._next_id(), self.symbol, side, price, qty, **self._order_kwargs)
+            for side, price, qty in new)
+        return cmds
+
+    async def update(self, desired):
+        """Move ladder to :desired levels. If commands of the previous update are not acknowledged yet,
+        :desired is applied after acknowledgements.
+
+        :param desired: required
+        :type desired: iterable of (side, price, qty)
+        :returns: list of sent commands
+        """
+
+        self._desired = list(desired)
+        if self._in_flight:
+            return []
+        return await self._sync()
+
+    async def cancel_all(self):
+        return await self.update([])
+
+    async def _sync(self):
+        desired, self._desired = self._desired, None
+        cmds = self.commands(desired)
+        if not cmds:
+            return cmds
+
+        self._in_flight.update(cmd.ClOrdId for cmd in cmds)
+        self.sent += len(cmds)
+        try:
+            batch = await self._ws.send_batch(cmds)
+        except Exception:
+            self._in_flight.difference_update(cmd.ClOrdId for cmd in cmds)
+            raise
+        if batch.exception is not None:
+            # closed connection, nothing is going to be acknowledged
+            self._in_flight.difference_update(cmd.ClOrdId for cmd in cmds)
+            raise batch.exception
+        return cmds
+
+    async def _resync(self):
+        # update() could have sent the latest ladder before this task started
+        if self._in_flight or self._desired is None:
+            return
+        try:
+            await self._sync()
+        except Exception:
+            self._log.exception('ladder %s %s sync', self.prefix, self.symbol)
+
+    async def _on_message(self, ws, msg):
+        if msg.ClOrdId not in self._in_flight:
+            return
+        if msg.MsgType == constants.MsgType_ExecutionReportMsgType and msg.ExecType in _PENDING_EXEC_TYPES:
+            return
+
+        self._in_flight.discard(msg.ClOrdId)
+        if not self._in_flight and self._desired is not None:
+            # sending could wait for rate limit tokens, so it must not block reading of the socket
+            asyncio.ensure_future(self._resync())
+
+    async def _on_connection_close(self, ws, exception):
+        self.reset()
+
+    def reset(self):
+        """Forget commands waiting for acknowledgement, it is done on connection close"""
+
+        self._in_flight = set()
+
+    def close(self):
+        self._ws.remove_listener(self._listener)
@@ -0,0 +1,229 @@
+import bisect
+import logging
+
+import xena.proto.constants as constants
+import xena.proto.order_pb2 as order_pb2
+from xena.pnl import Contract
+
+
+# margin amount type of MarginRequirementReport -> MarginRate field used to estimate it
+AMOUNT_RATES = {
+    constants.MarginAmtType_InitialMargin: 'InitialRate',
+    constants.MarginAmtType_CoreMargin: 'MaintenanceRate',
+}
+
+
+class _Spec:
+    """Margin rates tiers and contract math of one symbol"""
+
+    __slots__ = ('contract', 'max_volumes', 'rates', 'mark')
+
+    def __init__(self, instrument, price_step, multiplier_key):
+        self.contract = Contract(instrument, price_step)
+        multiplier = 1.0
+        if multiplier_key is not None and multiplier_key in instrument.Margin.RateMultipliers:
+            multiplier = float(instrument.Margin.RateMultipliers[multiplier_key])
+
+        tiers = []
+        for rate in instrument.Margin.Rates:
+            # tier without MaxVolume has no upper bound
+            max_volume = float(rate.MaxVolume) if rate.MaxVolume not in ("", "0") else float('inf')
+            tiers.append((max_volume, {field: float(getattr(rate, field) or 0) * multiplier for field in AMOUNT_RATES.values()}))
+        tiers.sort(key=lambda tier: tier[0])
+        self.max_volumes = [tier[0] for tier in tiers]
+        self.rates = [tier[1] for tier in tiers]
+        self.mark = float(instrument.Mark) if instrument.Mark != "" else None
+
+    def rate(self, volume, field):
+        if not self.rates:
+            return 0.0
+        tier = bisect.bisect_left(self.max_volumes, volume)
+        if tier == len(self.rates):
+            tier -= 1
+        return self.rates[tier][field]
+
+    def notional(self, volume, price):
+        if self.contract.inverse:
+            return volume * self.contract.multiplier / price
+        return volume * price * self.contract.multiplier
+
+
+class MarginEstimator:
+    """Local estimate of margin requirements from Instrument.Margin rates, live positions and open orders.
+
+    Margin of (account, symbol) is the notional of the worst case volume, the larger of abs(net position + open buys)
+    and abs(net position - open sells), times the rate of the Margin.Rates tier this volume falls into.
+    Rates are multiplied by Margin.RateMultipliers[multiplier_key] if it is set. Notional is valued at the price
+    from :prices or instrument Mark, the same way as xena.pnl.PnLEngine values contracts.
+
+    MarginRequirementReports passed to apply() are compared with the estimate, see drift().
+    """
+
+    def __init__(self, instruments, position_store, order_store=None, prices=None, multiplier_key=None, drift_warning=0.05):
+        """
+        :param instruments: required, margin rates and contract specs
+        :type instruments: xena.instruments.InstrumentCache
+        :param position_store: required, live positions, e.g. XenaTradingWebsocketClient.position_store
+        :type position_store: xena.positions.PositionStore
+        :param order_store: open orders, e.g. XenaTradingWebsocketClient.order_store
+        :type order_store: xena.orders.OrderStore
+        :param prices: function(symbol) returning mark price as float or None, e.g. xena.pnl.PnLEngine.price
+        :type prices: callable
+        :param multiplier_key: key of Margin.RateMultipliers applied to rates
+        :type multiplier_key: str
+        :param drift_warning: log a warning if relative difference with server report is larger
+        :type drift_warning: float
+        """
+
+        self._log = logging.getLogger(__name__)
+        self._instruments = instruments
+        self._position_store = position_store
+        self._order_store = order_store
+        self._prices = prices
+        self._multiplier_key = multiplier_key
+        self._drift_warning = drift_warning
+        self._specs = {}
+        self._loaded_at = None
+        # account -> {(MarginAmtType, MarginAmtCcy): (estimated, reported)}
+        self._drifts = {}
+        self.reports = 0
+        self.max_drift = 0.0
+        self._drift_sum = 0.0
+        self._drift_count = 0
+
+    def _spec(self, symbol):
+        if self._loaded_at != self._instruments.loaded_at:
+            self._specs = {}
+            self._loaded_at = self._instruments.loaded_at
+
+        spec = self._specs.get(symbol)
+        if spec is None:
+            instrument = self._instruments.get(symbol)
+            if instrument is None:
+                raise KeyError("Unknown instrument {}".format(symbol))
+            spec = self._specs[symbol] = _Spec(instrument, self._instruments.price_step(symbol), self._multiplier_key)
+        return spec
+
+    def _price(self, symbol, spec):
+        price = self._prices(symbol) if self._prices is not None else None
+        if price is None:
+            price = spec.mark
+        if not price:
+            raise ValueError("No price to value {} margin".format(symbol))
+        return price
+
+    def _net(self, account, symbol):
+        net = self._position_store.net(account, symbol)
+        if isinstance(net, int) and symbol in self._instruments:
+            return self._instruments.qty_fixed_point(symbol).to_float(net)
+        return float(net)
+
+    def _open_qty(self, account, symbol):
+        buys = sells = 0.0
+        if self._order_store is None:
+            return buys, sells
+        for order in self._order_store.open_orders(account, symbol):
+            qty = float(order.leaves_qty or order.order_qty or 0)
+            if order.side == constants.Side_Buy:
+                buys += qty
+            else:
+                sells += qty
+        return buys, sells
+
+    def requirement(self, account, symbol, buy=0.0, sell=0.0, amount_type=constants.MarginAmtType_InitialMargin):
+        """Estimated margin of :account positions and open orders in :symbol, with :buy and :sell added to open orders
+
+        :returns: (currency, amount)
+        """
+
+        spec = self._spec(symbol)
+        net = self._net(account, symbol)
+        buys, sells = self._open_qty(account, symbol)
+        volume = max(abs(net + buys + buy), abs(net - sells - sell))
+        if volume == 0:
+            return spec.contract.currency, 0.0
+
+        rate = spec.rate(volume, AMOUNT_RATES[amount_type])
+        return spec.contract.currency, spec.notional(volume, self._price(symbol, spec)) * rate
+
+    def impact(self, cmd, amount_type=constants.MarginAmtType_InitialMargin):
+        """Estimated margin change if NewOrderSingle :cmd is placed, without a request to the server
+
+        :returns: (currency, amount), amount is negative for orders reducing the requirement
+        """
+
+        if not isinstance(cmd, order_pb2.NewOrderSingle):
+            raise ValueError("Margin impact could be estimated only for NewOrderSingle")
+
+        qty = float(cmd.OrderQty or 0)
+        buy, sell = (qty, 0.0) if cmd.Side == constants.Side_Buy else (0.0, qty)
+        currency, before = self.requirement(cmd.Account, cmd.Symbol, amount_type=amount_type)
+        _, after = self.requirement(cmd.Account, cmd.Symbol, buy, sell, amount_type)
+        return currency, after - before
+
+    def estimate(self, account, amount_type=constants.MarginAmtType_InitialMargin):
+        """Estimated margin of all :account positions and open orders
+
+        :returns: dict of currency to amount
+        """
+
+        symbols = set(self._position_store.net_volumes(account))
+        if self._order_store is not None:
+            symbols.update(order.symbol for order in self._order_store.open_orders(account))
+
+        result = {}
+        for symbol in symbols:
+            currency, amount = self.requirement(account, symbol, amount_type=amount_type)
+            result[currency] = result.get(currency, 0.0) + amount
+        return result
+
+    def apply(self, msg):
+        """Compare MarginRequirementReport with the estimate, other messages are ignored"""
+
+        if msg.MsgType != constants.MsgType_MarginRequirementReport or msg.RejectReason != "":
+            return
+
+        drifts = {}
+        estimates = {}
+        for amount in msg.MarginAmounts:
+            if amount.MarginAmtType not in AMOUNT_RATES:
+                continue
+            if amount.MarginAmtType not in estimates:
+                try:
+                    estimates[amount.MarginAmtType] = self.estimate(msg.Account, amount.MarginAmtType)
+                except (KeyError, ValueError) as e:
+                    self._log.warning('margin of %s can not be estimated: %s', msg.Account, e)
+                    return
+
+            estimated = estimates[amount.MarginAmtType].get(amount.MarginAmtCcy, 0.0)
+            reported = float(amount.MarginAmt or 0)
+            drifts[(amount.MarginAmtType, amount.MarginAmtCcy)] = (estimated, reported)
+
+            drift = abs(estimated - reported) / reported if reported != 0 else abs(estimated)
+            self._drift_sum += drift
+            self._drift_count += 1
+            self.max_drift = max(self.max_drift, drift)
+            if drift > self._drift_warning:
+                self._log.warning('margin %s %s of %s is estimated as %s, reported %s',
+                                  amount.MarginAmtType, amount.MarginAmtCcy, msg.Account, estimated, reported)
+
+        self._drifts[msg.Account] = drifts
+        self.reports += 1
+
+    async def handle(self, ws, msg):
+        """Could be used as listener of XenaTradingWebsocketClient for MarginRequirementReport"""
+
+        self.apply(msg)
+
+    def drift(self, account):
+        """Last comparison with server report as {(MarginAmtType, MarginAmtCcy): (estimated, reported)}"""
+
+        return dict(self._drifts.get(account, {}))
+
+    @property
+    def mean_drift(self):
+        """Mean relative difference of estimates from server reports"""
+
+        if self._drift_count == 0:
+            return 0.0
+        return self._drift_sum / self._drift_count
@@ -0,0 +1,98 @@
+import xena.proto.market_pb2 as market_pb2
+import xena.proto.constants as constants
+
+
+_KEY_FIELDS = frozenset(['Symbol', 'MDEntryType', 'MDUpdateAction'])
+
+
+class MarketWatchState:
+    """Last known market watch entries, used to turn full market watch snapshots into deltas"""
+
+    def __init__(self, symbols=None):
+        """
+        :param symbols: keep only entries for these symbols, all symbols if not set
+        :type symbols: iterable of str
+        """
+
+        self._symbols = None if symbols is None else set(symbols)
+        # (Symbol, MDEntryType) -> xena.proto.market_pb2.MDEntry
+        self._entries = {}
+        # (Symbol, MDEntryType) -> names of fields changed to empty value by the last update()
+        self.cleared = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def entry(self, symbol, entry_type=""):
+        """Last known MDEntry for :symbol or None"""
+
+        return self._entries.get((symbol, entry_type))
+
+    def entries(self):
+        return list(self._entries.values())
+
+    def clear(self):
+        self._entries = {}
+        self.cleared = {}
+
+    def update(self, msg):
+        """Apply full market watch snapshot and return changes since previous one.
+
+        Result is xena.proto.market_pb2.MarketDataRefresh with MsgType_MarketDataIncrementalRefresh, where
+        each MDEntry has MDUpdateAction set: new entries are copied in full, changed entries contain only
+        Symbol, MDEntryType and the fields that changed, removed entries contain only Symbol and MDEntryType.
+        A field changed to "" or 0 can not be told from an unchanged one in the message, such fields are listed
+        in self.cleared until the next update.
+
+        :param msg: market watch snapshot
+        :type msg: xena.proto.market_pb2.MarketDataRefresh
+        :returns: xena.proto.market_pb2.MarketDataRefresh or None if nothing changed
+        """
+
+        delta = market_pb2.MarketDataRefresh()
+        delta.MsgType = constants.MsgType_MarketDataIncrementalRefresh
+        delta.MDStreamId = msg.MDStreamId
+        delta.LastUpdateTime = msg.LastUpdateTime
+
+        entries = {}
+        self.cleared = {}
+        for entry in msg.MDEntry:
+            if self._symbols is not None and entry.Symbol not in self._symbols:
+                continue
+
+            key = (entry.Symbol, entry.MDEntryType)
+            entries[key] = entry
+            old = self._entries.get(key)
+            if old is None:
+                change = delta.MDEntry.add()
+                change.CopyFrom(entry)
+                change.MDUpdateAction = constants.MDUpdateAction_NewAction
+            elif old != entry:
+                change = delta.MDEntry.add()
+                change.Symbol = entry.Symbol
+                change.MDEntryType = entry.MDEntryType
+                change.MDUpdateAction = constants.MDUpdateAction_ChangeAction
+                cleared = []
+                # ListFields() skips fields with default value, so the ones cleared since the last snapshot too
+                for field in entry.DESCRIPTOR.fields:
+                    value = getattr(entry, field.name)
+                    if field.name in _KEY_FIELDS or getattr(old, field.name) == value:
+                        continue
+                    if value == field.default_value:
+                        cleared.append(field.name)
+                    else:
+                        setattr(change, field.name, value)
+                if cleared:
+                    self.cleared[key] = tuple(cleared)
+
+        for key in self._entries:
+            if key not in entries:
+                change = delta.MDEntry.add()
+                change.Symbol, change.MDEntryType = key
+                change.MDUpdateAction = constants.MDUpdateAction_DeleteAction
+
+        self._entries = entries
+        if len(delta.MDEntry) == 0:
+            return None
+
+        return delta
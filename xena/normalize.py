@@ -0,0 +1,144 @@
+import logging
+from decimal import ROUND_CEILING, ROUND_FLOOR, ROUND_HALF_UP
+
+import xena.proto.constants as constants
+import xena.proto.order_pb2 as order_pb2
+import xena.exceptions as exceptions
+
+
+# fix fields to the instrument steps
+MODE_ROUND = 'round'
+# raise xena.exceptions.NormalizationException for any field that does not fit
+MODE_REJECT = 'reject'
+
+
+class _Rules:
+    __slots__ = ('price', 'qty', 'min_qty', 'max_qty')
+
+    def __init__(self, price, qty, min_qty, max_qty):
+        self.price = price
+        self.qty = qty
+        # in lots, None if not limited
+        self.min_qty = min_qty
+        self.max_qty = max_qty
+
+
+class OrderNormalizer:
+    """Fit prices and quantities of outgoing orders to instrument TickSize, PricePrecision and OrderQtyStep.
+
+    Price, StopPx, CapPrice, OrderQty and SLTP prices of NewOrderSingle and OrderCancelReplaceRequest are
+    checked with per symbol rules cached from the instrument cache, values already on the grid are left as is.
+    In MODE_ROUND limit price is rounded away from the market (down for buy, up for sell), quantity is rounded down
+    and other prices are rounded to the nearest step. Quantity out of MinOrderQty/MaxOrderQty is always rejected.
+    """
+
+    def __init__(self, instruments, mode=MODE_ROUND):
+        """
+        :param instruments: required
+        :type instruments: xena.instruments.InstrumentCache
+        :param mode: MODE_ROUND or MODE_REJECT
+        :type mode: str
+        """
+
+        if mode not in (MODE_ROUND, MODE_REJECT):
+            raise ValueError("Unknown mode \"{}\"".format(mode))
+
+        self._log = logging.getLogger(__name__)
+        self._instruments = instruments
+        self._mode = mode
+        self._rules = {}
+        self._loaded_at = None
+
+    def _symbol_rules(self, symbol):
+        if self._loaded_at != self._instruments.loaded_at:
+            # instruments were refreshed
+            self._rules = {}
+            self._loaded_at = self._instruments.loaded_at
+
+        rules = self._rules.get(symbol)
+        if rules is None:
+            if symbol not in self._instruments:
+                return None
+
+            instrument = self._instruments[symbol]
+            qty = self._instruments.qty_fixed_point(symbol)
+            min_qty = qty.parse(instrument.MinOrderQty, ROUND_CEILING) if instrument.MinOrderQty != "" else None
+            max_qty = qty.parse(instrument.MaxOrderQty, ROUND_FLOOR) if instrument.MaxOrderQty != "" else None
+            rules = _Rules(self._instruments.price_fixed_point(symbol), qty, min_qty or None, max_qty or None)
+            self._rules[symbol] = rules
+        return rules
+
+    def _fit(self, symbol, field, value, fixed_point, rounding):
+        """:returns: (steps, value fitted to the grid)"""
+
+        try:
+            steps = fixed_point.parse(value)
+            return steps, value
+        # decimal.InvalidOperation of garbage is ArithmeticError
+        except (ValueError, ArithmeticError) as e:
+            if self._mode == MODE_REJECT:
+                raise exceptions.NormalizationException(symbol, field, value, str(e))
+
+        try:
+            steps = fixed_point.parse(value, rounding)
+        except (ValueError, ArithmeticError) as e:
+            raise exceptions.NormalizationException(symbol, field, value, str(e))
+
+        fitted = fixed_point.format(steps)
+        self._log.debug('%s %s rounded from "%s" to "%s"', symbol, field, value, fitted)
+        return steps, fitted
+
+    def _fit_price(self, cmd, symbol, field, rules, rounding):
+        value = getattr(cmd, field)
+        if value == "":
+            return
+
+        steps, fitted = self._fit(symbol, field, value, rules.price, rounding)
+        if steps <= 0:
+            raise exceptions.NormalizationException(symbol, field, value, "price has to be positive")
+        if fitted is not value:
+            setattr(cmd, field, fitted)
+
+    def normalize(self, cmd):
+        """Normalize NewOrderSingle, orders of NewOrderList or OrderCancelReplaceRequest in place, other commands and unknown symbols are passed as is
+
+        :raises: xena.exceptions.NormalizationException
+        :returns: cmd
+        """
+
+        if isinstance(cmd, order_pb2.NewOrderList):
+            for element in cmd.ListOrdGrp:
+                self.normalize(element)
+            return cmd
+
+        if not isinstance(cmd, (order_pb2.NewOrderSingle, order_pb2.OrderCancelReplaceRequest)):
+            return cmd
+
+        rules = self._symbol_rules(cmd.Symbol)
+        if rules is None:
+            return cmd
+
+        symbol = cmd.Symbol
+        # do not make limit price more aggressive than requested
+        passive = ROUND_FLOOR if cmd.Side == constants.Side_Buy else ROUND_CEILING
+        self._fit_price(cmd, symbol, 'Price', rules, passive)
+        self._fit_price(cmd, symbol, 'StopPx', rules, ROUND_HALF_UP)
+        self._fit_price(cmd, symbol, 'CapPrice', rules, ROUND_HALF_UP)
+        for sltp in cmd.SLTP:
+            self._fit_price(sltp, symbol, 'Price', rules, ROUND_HALF_UP)
+            self._fit_price(sltp, symbol, 'StopPx', rules, ROUND_HALF_UP)
+            self._fit_price(sltp, symbol, 'CapPrice', rules, ROUND_HALF_UP)
+
+        qty = cmd.OrderQty
+        if qty != "":
+            lots, fitted = self._fit(symbol, 'OrderQty', qty, rules.qty, ROUND_FLOOR)
+            if rules.min_qty is not None and lots < rules.min_qty:
+                raise exceptions.NormalizationException(symbol, 'OrderQty', qty, "less than MinOrderQty")
+            if lots <= 0:
+                raise exceptions.NormalizationException(symbol, 'OrderQty', qty, "quantity has to be positive")
+            if rules.max_qty is not None and lots > rules.max_qty:
+                raise exceptions.NormalizationException(symbol, 'OrderQty', qty, "greater than MaxOrderQty")
+            if fitted is not qty:
+                cmd.OrderQty = fitted
+
+        return cmd
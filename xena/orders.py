@@ -0,0 +1,320 @@
+import collections
+import logging
+
+import xena.proto.constants as constants
+import xena.proto.order_pb2 as order_pb2
+
+
+OPEN_STATUSES = frozenset([
+    constants.OrdStatus_PendingNewOrd,
+    constants.OrdStatus_NewOrd,
+    constants.OrdStatus_PartiallyFilled,
+    constants.OrdStatus_PendingCancelOrd,
+    constants.OrdStatus_PendingReplaceOrd,
+    constants.OrdStatus_Suspended,
+    constants.OrdStatus_Stopped,
+])
+
+TERMINAL_STATUSES = frozenset([
+    constants.OrdStatus_Filled,
+    constants.OrdStatus_CanceledOrd,
+    constants.OrdStatus_RejectedOrd,
+    constants.OrdStatus_Expired,
+])
+
+
+def is_allowed_transition(old, new):
+    """Check order status transition, terminal statuses are final and order never goes back to pending new"""
+
+    if old in TERMINAL_STATUSES:
+        return False
+    if new == constants.OrdStatus_PendingNewOrd:
+        return old == constants.OrdStatus_PendingNewOrd
+    return True
+
+
+class Order:
+    """Last known state of an order"""
+
+    __slots__ = (
+        'account', 'symbol', 'side', 'cl_ord_id', 'orig_cl_ord_id', 'order_id', 'ord_type', 'status',
+        'price', 'stop_px', 'order_qty', 'leaves_qty', 'cum_qty', 'avg_px', 'transact_time', 'report',
+        'pending_cl_ord_id', 'prev_status',
+    )
+
+    def __init__(self, account, symbol, side, cl_ord_id):
+        self.account = account
+        self.symbol = symbol
+        self.side = side
+        self.cl_ord_id = cl_ord_id
+        self.orig_cl_ord_id = ""
+        self.order_id = ""
+        self.ord_type = ""
+        self.status = constants.OrdStatus_PendingNewOrd
+        self.price = ""
+        self.stop_px = ""
+        self.order_qty = ""
+        self.leaves_qty = ""
+        self.cum_qty = ""
+        self.avg_px = ""
+        self.transact_time = 0
+        # the last xena.proto.order_pb2.ExecutionReport for the order
+        self.report = None
+        # ClOrdId of cancel or replace request sent for the order, but not answered yet
+        self.pending_cl_ord_id = ""
+        self.prev_status = ""
+
+    @property
+    def is_open(self):
+        return self.status in OPEN_STATUSES
+
+    def __repr__(self):
+        return 'Order({}, {}, {}, status={}, price={}, qty={}, leaves={})'.format(
+            self.account, self.symbol, self.cl_ord_id, self.status, self.price, self.order_qty, self.leaves_qty)
+
+
+class OrderStore:
+    """Orders indexed by ClOrdId, OrderId, symbol and account, updated from execution reports.
+
+    Outgoing commands are tracked with track() and incoming messages are applied with apply(),
+    XenaTradingWebsocketClient does both when created with track_orders=True.
+    """
+
+    def __init__(self, max_closed=10000):
+        """
+        :param max_closed: number of orders in terminal statuses to keep, the oldest are dropped
+        :type max_closed: int
+        """
+
+        self._log = logging.getLogger(__name__)
+        self._max_closed = max_closed
+        self._by_cl_ord_id = {}
+        self._by_order_id = {}
+        self._by_symbol = collections.defaultdict(set)
+        self._by_account = collections.defaultdict(set)
+        self._open = set()
+        self._open_by_key = collections.defaultdict(set)
+        self._closed = collections.deque()
+
+    def __len__(self):
+        return sum(len(orders) for orders in self._by_account.values())
+
+    def get(self, cl_ord_id):
+        """Order by ClOrdId, ClOrdId of pending cancel or replace request works as well"""
+
+        return self._by_cl_ord_id.get(cl_ord_id)
+
+    def get_by_order_id(self, order_id):
+        return self._by_order_id.get(order_id)
+
+    def open_orders(self, account=None, symbol=None):
+        """List of open orders, optionally filtered by :account and :symbol"""
+
+        if account is not None and symbol is not None:
+            return list(self._open_by_key.get((account, symbol), ()))
+
+        orders = self._open
+        if symbol is not None:
+            orders = self._by_symbol.get(symbol, set()) & orders
+        if account is not None:
+            orders = self._by_account.get(account, set()) & orders
+        return list(orders)
+
+    def open_count(self, account, symbol):
+        """Number of open orders of :account for :symbol"""
+
+        return len(self._open_by_key.get((account, symbol), ()))
+
+    def orders(self, account=None, symbol=None):
+        """List of all known orders, optionally filtered by :account and :symbol"""
+
+        if account is None and symbol is None:
+            return [order for orders in self._by_account.values() for order in orders]
+        if account is None:
+            return list(self._by_symbol.get(symbol, set()))
+        if symbol is None:
+            return list(self._by_account.get(account, set()))
+        return list(self._by_symbol.get(symbol, set()) & self._by_account.get(account, set()))
+
+    def _add(self, order):
+        self._by_cl_ord_id[order.cl_ord_id] = order
+        if order.order_id != "":
+            self._by_order_id[order.order_id] = order
+        self._by_symbol[order.symbol].add(order)
+        self._by_account[order.account].add(order)
+        self._open.add(order)
+        self._open_by_key[(order.account, order.symbol)].add(order)
+
+    def _remove(self, order):
+        for cl_ord_id in (order.cl_ord_id, order.orig_cl_ord_id, order.pending_cl_ord_id):
+            if self._by_cl_ord_id.get(cl_ord_id) is order:
+                del self._by_cl_ord_id[cl_ord_id]
+        if self._by_order_id.get(order.order_id) is order:
+            del self._by_order_id[order.order_id]
+        self._by_symbol[order.symbol].discard(order)
+        self._by_account[order.account].discard(order)
+        self._discard_open(order)
+
+    def _discard_open(self, order):
+        self._open.discard(order)
+        key = (order.account, order.symbol)
+        if key in self._open_by_key:
+            self._open_by_key[key].discard(order)
+            if not self._open_by_key[key]:
+                del self._open_by_key[key]
+
+    def _set_status(self, order, status):
+        order.status = status
+        if status in TERMINAL_STATUSES and order in self._open:
+            self._discard_open(order)
+            if self._by_cl_ord_id.get(order.pending_cl_ord_id) is order:
+                del self._by_cl_ord_id[order.pending_cl_ord_id]
+            order.pending_cl_ord_id = ""
+            self._closed.append(order)
+            while len(self._closed) > self._max_closed:
+                self._remove(self._closed.popleft())
+
+    def _find(self, cl_ord_id, orig_cl_ord_id="", order_id=""):
+        order = self._by_cl_ord_id.get(cl_ord_id)
+        if order is None and orig_cl_ord_id != "":
+            order = self._by_cl_ord_id.get(orig_cl_ord_id)
+        if order is None and order_id != "":
+            order = self._by_order_id.get(order_id)
+        return order
+
+    def track(self, cmd):
+        """Track outgoing NewOrderSingle, NewOrderList, OrderCancelRequest or OrderCancelReplaceRequest, other commands are ignored"""
+
+        if isinstance(cmd, order_pb2.NewOrderList):
+            for element in cmd.ListOrdGrp:
+                self.track(element)
+            return
+
+        if isinstance(cmd, order_pb2.NewOrderSingle):
+            order = Order(cmd.Account, cmd.Symbol, cmd.Side, cmd.ClOrdId)
+            order.ord_type = cmd.OrdType
+            order.price = cmd.Price
+            order.stop_px = cmd.StopPx
+            order.order_qty = cmd.OrderQty
+            order.leaves_qty = cmd.OrderQty
+            self._add(order)
+            return
+
+        if isinstance(cmd, order_pb2.OrderCancelRequest):
+            status = constants.OrdStatus_PendingCancelOrd
+        elif isinstance(cmd, order_pb2.OrderCancelReplaceRequest):
+            status = constants.OrdStatus_PendingReplaceOrd
+        else:
+            return
+
+        order = self._find(cmd.OrigClOrdId, order_id=cmd.OrderId)
+        if order is None or not order.is_open:
+            return
+
+        if order.status not in (constants.OrdStatus_PendingCancelOrd, constants.OrdStatus_PendingReplaceOrd):
+            order.prev_status = order.status
+        order.status = status
+        order.pending_cl_ord_id = cmd.ClOrdId
+        self._by_cl_ord_id[cmd.ClOrdId] = order
+
+    def untrack(self, cmd):
+        """Undo track() of :cmd which was not sent, orders already updated by execution reports are kept"""
+
+        if isinstance(cmd, order_pb2.NewOrderList):
+            for element in cmd.ListOrdGrp:
+                self.untrack(element)
+            return
+
+        if isinstance(cmd, order_pb2.NewOrderSingle):
+            order = self._by_cl_ord_id.get(cmd.ClOrdId)
+            if order is not None and order.report is None and order.status == constants.OrdStatus_PendingNewOrd:
+                self._remove(order)
+            return
+
+        if not isinstance(cmd, (order_pb2.OrderCancelRequest, order_pb2.OrderCancelReplaceRequest)):
+            return
+
+        order = self._by_cl_ord_id.get(cmd.ClOrdId)
+        if order is None or order.pending_cl_ord_id != cmd.ClOrdId:
+            return
+
+        del self._by_cl_ord_id[cmd.ClOrdId]
+        order.pending_cl_ord_id = ""
+        if order.status in (constants.OrdStatus_PendingCancelOrd, constants.OrdStatus_PendingReplaceOrd) and order.prev_status != "":
+            order.status = order.prev_status
+
+    def apply(self, msg):
+        """Apply incoming message, only ExecutionReport, OrderCancelReject and OrderMassStatusResponse change the store"""
+
+        if msg.MsgType == constants.MsgType_ExecutionReportMsgType:
+            self._apply_report(msg)
+        elif msg.MsgType == constants.MsgType_OrderCancelRejectMsgType:
+            self._apply_cancel_reject(msg)
+        elif msg.MsgType == constants.MsgType_OrderMassStatusResponse:
+            for report in msg.ExecutionReports:
+                self._apply_report(report)
+
+    def _apply_report(self, report):
+        if report.ClOrdId == "" and report.OrderId == "":
+            return
+
+        order = self._find(report.ClOrdId, report.OrigClOrdId, report.OrderId)
+        if order is None:
+            if report.OrdStatus in TERMINAL_STATUSES and report.ExecType != constants.ExecType_OrderStatus:
+                # do not keep orders that were never seen open
+                return
+            order = Order(report.Account, report.Symbol, report.Side, report.ClOrdId)
+            self._add(order)
+        elif report.TransactTime != 0 and report.TransactTime < order.transact_time:
+            # stale report
+            return
+
+        status = report.OrdStatus
+        if status != order.status and not is_allowed_transition(order.status, status):
+            self._log.warning('ignore transition from "%s" to "%s" for order %s', order.status, status, order.cl_ord_id)
+            return
+
+        if report.ExecType == constants.ExecType_ReplacedExec and report.ClOrdId != order.cl_ord_id:
+            if self._by_cl_ord_id.get(order.cl_ord_id) is order:
+                del self._by_cl_ord_id[order.cl_ord_id]
+            order.orig_cl_ord_id = order.cl_ord_id
+            order.cl_ord_id = report.ClOrdId
+            self._by_cl_ord_id[order.cl_ord_id] = order
+
+        pending = (constants.OrdStatus_PendingCancelOrd, constants.OrdStatus_PendingReplaceOrd)
+        if status not in pending and order.pending_cl_ord_id != "":
+            # cancel or replace request is done one way or another
+            if order.pending_cl_ord_id != order.cl_ord_id and self._by_cl_ord_id.get(order.pending_cl_ord_id) is order:
+                del self._by_cl_ord_id[order.pending_cl_ord_id]
+            order.pending_cl_ord_id = ""
+
+        if report.OrderId != "" and order.order_id != report.OrderId:
+            order.order_id = report.OrderId
+            self._by_order_id[order.order_id] = order
+
+        order.ord_type = report.OrdType or order.ord_type
+        order.price = report.Price
+        order.stop_px = report.StopPx
+        order.order_qty = report.OrderQty or order.order_qty
+        order.leaves_qty = report.LeavesQty
+        order.cum_qty = report.CumQty
+        order.avg_px = report.AvgPx
+        order.transact_time = report.TransactTime
+        order.report = report
+        self._set_status(order, status)
+
+    def _apply_cancel_reject(self, reject):
+        order = self._find(reject.OrigClOrdId, order_id=reject.OrderId)
+        if order is None:
+            order = self._by_cl_ord_id.get(reject.ClOrdId)
+        if order is None:
+            return
+
+        if order.pending_cl_ord_id != "" and order.pending_cl_ord_id == reject.ClOrdId:
+            if self._by_cl_ord_id.get(order.pending_cl_ord_id) is order:
+                del self._by_cl_ord_id[order.pending_cl_ord_id]
+            order.pending_cl_ord_id = ""
+
+        status = reject.OrdStatus or order.prev_status
+        if status != "" and status != order.status and is_allowed_transition(order.status, status):
+            self._set_status(order, status)
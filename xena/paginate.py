@@ -0,0 +1,92 @@
+import asyncio
+import collections
+import concurrent.futures
+
+
+def page_records(page):
+    """Records of one history page, list responses as is and MDEntry of market data responses"""
+
+    if page is None:
+        return []
+    if isinstance(page, list):
+        return page
+    entries = getattr(page, 'MDEntry', None)
+    if entries is not None:
+        return list(entries)
+    return [page]
+
+
+def _is_last(records, limit):
+    return len(records) == 0 or (limit > 0 and len(records) < limit)
+
+
+async def paginate(fetch, limit=100, concurrency=4, first_page=1):
+    """Async generator of records from all pages starting with :first_page.
+
+    Up to :concurrency next pages are requested at once, records are yielded in page order as soon as the page
+    and all pages before it arrive. The first page shorter than :limit (or empty) is the last one, requests
+    of pages after it are cancelled.
+
+    :param fetch: coroutine function(page, limit) returning one page
+    :type fetch: callable
+    :param limit: page size
+    :type limit: int
+    :param concurrency: max number of pages requested at once
+    :type concurrency: int
+    """
+
+    if concurrency < 1:
+        raise ValueError("Concurrency has to be positive")
+
+    pending = collections.deque()
+    next_page = first_page
+    try:
+        while True:
+            while len(pending) < concurrency:
+                pending.append(asyncio.ensure_future(fetch(next_page, limit)))
+                next_page += 1
+
+            records = page_records(await pending.popleft())
+            for record in records:
+                yield record
+            if _is_last(records, limit):
+                return
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def paginate_sync(fetch, limit=100, concurrency=4, first_page=1, executor=None):
+    """Generator of records from all pages, pages are requested by a thread pool, see xena.paginate.paginate
+
+    :param fetch: function(page, limit) returning one page
+    :type fetch: callable
+    :param executor: pool to request pages, a pool of :concurrency threads is created for the call if not set
+    :type executor: concurrent.futures.Executor
+    """
+
+    if concurrency < 1:
+        raise ValueError("Concurrency has to be positive")
+
+    own_executor = executor is None
+    if own_executor:
+        executor = concurrent.futures.ThreadPoolExecutor(concurrency)
+
+    pending = collections.deque()
+    next_page = first_page
+    try:
+        while True:
+            while len(pending) < concurrency:
+                pending.append(executor.submit(fetch, next_page, limit))
+                next_page += 1
+
+            records = page_records(pending.popleft().result())
+            for record in records:
+                yield record
+            if _is_last(records, limit):
+                return
+    finally:
+        for future in pending:
+            future.cancel()
+        if own_executor:
+            executor.shutdown(wait=False)
@@ -0,0 +1,291 @@
+import collections
+import logging
+
+import xena.proto.constants as constants
+
+
+class Contract:
+    """PnL math of one symbol, shared by xena.pnl.PnLEngine, xena.portfolio.Portfolio and xena.margin.MarginEstimator.
+
+    Linear and quanto contracts: pnl = (mark - AvgPx) * volume * multiplier, where multiplier is TickValue per
+    price step if TickValue is set, otherwise ContractValue (1 if not set).
+    Inverse contracts: pnl = (1 / AvgPx - 1 / mark) * volume * ContractValue, in the base currency.
+    """
+
+    __slots__ = ('inverse', 'multiplier', 'currency')
+
+    def __init__(self, instrument=None, price_step=None):
+        """
+        :param instrument: contract specs, linear contract with multiplier 1 if not set
+        :type instrument: xena.proto.common_pb2.Instrument
+        :param price_step: price step of :instrument, see xena.instruments.InstrumentCache.price_step
+        :type price_step: str
+        """
+
+        self.inverse = False
+        self.multiplier = 1.0
+        self.currency = ""
+        if instrument is None:
+            return
+
+        self.inverse = instrument.Inverse
+        if instrument.TickValue != "" and not self.inverse and price_step:
+            self.multiplier = float(instrument.TickValue) / float(price_step)
+        elif instrument.ContractValue != "":
+            self.multiplier = float(instrument.ContractValue)
+
+        if instrument.SettlCurrencyName != "":
+            self.currency = instrument.SettlCurrencyName
+        elif self.inverse:
+            self.currency = instrument.BaseCurrencyName
+        else:
+            self.currency = instrument.QuoteCurrencyName
+
+
+class _Aggregate:
+    """Sums over open positions of one (account, symbol), enough to value them all at any price in O(1)"""
+
+    __slots__ = ('count', 'volume', 'cost', 'inverse_cost', 'pnl')
+
+    def __init__(self):
+        self.count = 0
+        # sum of signed volumes
+        self.volume = 0.0
+        # sum of volume * AvgPx
+        self.cost = 0.0
+        # sum of volume / AvgPx
+        self.inverse_cost = 0.0
+        # floating pnl at the last known price
+        self.pnl = 0.0
+
+    def value(self, contract, price):
+        if price is None:
+            return 0.0
+        if contract.inverse:
+            return (self.inverse_cost - self.volume / price) * contract.multiplier
+        return (price * self.volume - self.cost) * contract.multiplier
+
+
+class PnLEngine:
+    """Floating mark-to-market PnL of positions from xena.positions.PositionStore.
+
+    Positions are kept as per (account, symbol) sums, so a price change of one symbol revalues only accounts
+    with positions in it, and a position change updates only its own sums. Per account totals are kept
+    per currency and changed by the difference, reading them is O(1).
+
+    Prices could be set directly with set_price() or fed by market watch with handle_market_watch()
+    and by books mid price when the engine is added as listener of xena.book.OrderBooks.
+    """
+
+    def __init__(self, position_store, instruments=None, price_field='MDEntryPx', price_entry_type=None):
+        """
+        :param position_store: source of positions, e.g. XenaTradingWebsocketClient.position_store
+        :type position_store: xena.positions.PositionStore
+        :param instruments: contract specs, symbols without instrument are valued as linear with multiplier 1
+        :type instruments: xena.instruments.InstrumentCache
+        :param price_field: MDEntry field used as price by handle_market_watch(), LastPx if the field is empty in a snapshot
+        :type price_field: str
+        :param price_entry_type: MDEntryType of market watch entries with :price_field, if not set it is the type
+            of the first entry with :price_field of each symbol
+        :type price_entry_type: str
+        """
+
+        self._log = logging.getLogger(__name__)
+        self._instruments = instruments
+        self._price_field = price_field
+        self._price_entry_type = price_entry_type
+        # symbol -> MDEntryType of entries with price, when price_entry_type is not set
+        self._price_entry_types = {}
+        # symbol -> Contract
+        self._contracts = {}
+        # symbol -> float price
+        self._prices = {}
+        # symbol -> {account: _Aggregate}
+        self._aggregates = collections.defaultdict(dict)
+        # (account, position id) -> (symbol, signed volume, AvgPx)
+        self._positions = {}
+        # (account, currency) -> floating pnl
+        self._totals = {}
+        # (account, currency) -> number of symbols with positions
+        self._total_counts = {}
+        self._loaded_at = None
+
+        for position in position_store.positions():
+            self._on_position_change(None, position)
+        position_store.on_position_change(self._on_position_change)
+
+    def _contract(self, symbol):
+        if self._instruments is not None and self._instruments.loaded_at != self._loaded_at:
+            self._contracts = {}
+            self._loaded_at = self._instruments.loaded_at
+
+        contract = self._contracts.get(symbol)
+        if contract is None:
+            if self._instruments is not None and symbol in self._instruments:
+                contract = Contract(self._instruments[symbol], self._instruments.price_step(symbol))
+            else:
+                contract = Contract()
+            self._contracts[symbol] = contract
+        return contract
+
+    def _add_total(self, account, currency, pnl):
+        key = (account, currency)
+        self._totals[key] = self._totals.get(key, 0.0) + pnl
+
+    def _revalue(self, symbol, account, aggregate, contract):
+        pnl = aggregate.value(contract, self._prices.get(symbol))
+        if pnl != aggregate.pnl:
+            self._add_total(account, contract.currency, pnl - aggregate.pnl)
+            aggregate.pnl = pnl
+
+    def _on_position_change(self, old, new):
+        report = old if new is None else new
+        symbol = report.Symbol
+        account = report.Account
+        contract = self._contract(symbol)
+        aggregates = self._aggregates[symbol]
+        aggregate = aggregates.get(account)
+        if aggregate is None:
+            aggregate = aggregates[account] = _Aggregate()
+            total_key = (account, contract.currency)
+            self._total_counts[total_key] = self._total_counts.get(total_key, 0) + 1
+
+        key = (account, report.PositionId)
+        known = self._positions.pop(key, None)
+        if known is not None:
+            _, volume, price = known
+            aggregate.count -= 1
+            aggregate.volume -= volume
+            aggregate.cost -= volume * price
+            if price != 0:
+                aggregate.inverse_cost -= volume / price
+
+        if new is not None:
+            volume = float(new.Volume or 0)
+            if new.Side == constants.Side_Sell:
+                volume = -volume
+            price = float(new.AvgPx or 0)
+            self._positions[key] = (symbol, volume, price)
+            aggregate.count += 1
+            aggregate.volume += volume
+            aggregate.cost += volume * price
+            if price != 0:
+                aggregate.inverse_cost += volume / price
+
+        if aggregate.count == 0:
+            # no open positions left, drop the sums with their rounding errors
+            del aggregates[account]
+            if not aggregates:
+                del self._aggregates[symbol]
+            total_key = (account, contract.currency)
+            self._total_counts[total_key] -= 1
+            if self._total_counts[total_key] == 0:
+                del self._total_counts[total_key]
+                self._totals.pop(total_key, None)
+            else:
+                self._add_total(account, contract.currency, -aggregate.pnl)
+            return
+
+        self._revalue(symbol, account, aggregate, contract)
+
+    def set_price(self, symbol, price):
+        """Set mark price of :symbol and revalue positions in it
+
+        :param price: new price
+        :type price: float or str
+        """
+
+        price = float(price)
+        if price <= 0 or self._prices.get(symbol) == price:
+            return
+
+        self._prices[symbol] = price
+        aggregates = self._aggregates.get(symbol)
+        if not aggregates:
+            return
+
+        contract = self._contract(symbol)
+        for account, aggregate in aggregates.items():
+            self._revalue(symbol, account, aggregate, contract)
+
+    def price(self, symbol):
+        """Last known price of :symbol as float or None"""
+
+        return self._prices.get(symbol)
+
+    def position_pnl(self, account, position_id):
+        """Floating pnl of one position or None if the position or the price is unknown"""
+
+        known = self._positions.get((account, position_id))
+        if known is None:
+            return None
+
+        symbol, volume, avg_px = known
+        price = self._prices.get(symbol)
+        if price is None:
+            return None
+
+        contract = self._contract(symbol)
+        if contract.inverse:
+            if avg_px == 0:
+                return None
+            return (1 / avg_px - 1 / price) * volume * contract.multiplier
+        return (price - avg_px) * volume * contract.multiplier
+
+    def symbol_pnl(self, account, symbol):
+        """Floating pnl of all :account positions in :symbol, 0 if there is no position or price"""
+
+        aggregate = self._aggregates.get(symbol, {}).get(account)
+        if aggregate is None:
+            return 0.0
+        return aggregate.pnl
+
+    def account_pnl(self, account, currency=None):
+        """Floating pnl of :account in :currency, or {currency: pnl} if :currency is not set"""
+
+        if currency is not None:
+            return self._totals.get((account, currency), 0.0)
+        return {ccy: pnl for (acc, ccy), pnl in self._totals.items() if acc == account}
+
+    async def handle_market_watch(self, ws, msg):
+        """Set prices from market watch snapshot or deltas, could be used as callback for XenaMDWebsocketClient.market_watch"""
+
+        snapshot = msg.MsgType == constants.MsgType_MarketDataSnapshotFullRefresh
+        for entry in msg.MDEntry:
+            if entry.Symbol == "" or entry.MDUpdateAction == constants.MDUpdateAction_DeleteAction:
+                continue
+
+            price = getattr(entry, self._price_field)
+            entry_type = self._price_entry_type
+            if entry_type is None:
+                entry_type = self._price_entry_types.get(entry.Symbol)
+                if entry_type is None and price != "":
+                    entry_type = self._price_entry_types[entry.Symbol] = entry.MDEntryType
+            # entries of other types carry other prices
+            if entry.MDEntryType != entry_type:
+                continue
+
+            # a delta without the field does not change it, LastPx is a fallback only for full entries
+            if price == "" and snapshot:
+                price = entry.LastPx
+            if price != "":
+                self.set_price(entry.Symbol, price)
+
+    def _set_book_price(self, book):
+        mid = book.mid
+        if mid is None:
+            return
+        if book.price_fixed_point is not None:
+            mid = book.price_fixed_point.to_float(mid)
+        self.set_price(book.symbol, mid)
+
+    def on_reset(self, book):
+        """xena.book.OrderBook listener, revalue positions at the book mid price"""
+
+        self._set_book_price(book)
+
+    def on_level(self, book, side, rank, price, old, new):
+        """xena.book.OrderBook listener, only changes of the best levels move the mid price"""
+
+        if rank == 0:
+            self._set_book_price(book)
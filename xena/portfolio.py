@@ -0,0 +1,280 @@
+import numpy as np
+
+import xena.proto.constants as constants
+from xena.helpers import is_margin
+from xena.pnl import Contract
+
+
+def symbol_shocks(symbols_count, pct):
+    """Scenario matrix with +pct and -pct shock of each symbol alone, rows 2*i and 2*i+1 shock symbol i
+
+    :param symbols_count: number of symbols in the portfolio
+    :type symbols_count: int
+    :param pct: relative price change, like 0.1 for 10%
+    :type pct: float
+    """
+
+    shocks = np.zeros((2 * symbols_count, symbols_count))
+    index = np.arange(symbols_count)
+    shocks[2 * index, index] = pct
+    shocks[2 * index + 1, index] = -pct
+    return shocks
+
+
+class Portfolio:
+    """Positions of many accounts as accounts x symbols numpy matrices of net volume and cost.
+
+    Exposure, notional, margin usage and scenario PnL are computed as array operations over the whole matrix,
+    results per currency are accounts x currencies matrices, use accounts(), symbols() and currencies()
+    to map rows and columns. Contract math is the same as in xena.pnl.PnLEngine.
+
+    Usage::
+
+        portfolio = Portfolio(instruments)
+        portfolio.attach(ws.position_store)
+        portfolio.set_prices({"XBTUSD": 20000})
+        pnl = portfolio.scenarios(symbol_shocks(len(portfolio.symbols()), 0.1))
+    """
+
+    def __init__(self, instruments=None, margin_only=True):
+        """
+        :param instruments: contract specs and margin rates, symbols without instrument are linear with multiplier 1
+        :type instruments: xena.instruments.InstrumentCache
+        :param margin_only: skip positions of not margin accounts, see xena.helpers.is_margin
+        :type margin_only: bool
+        """
+
+        self._instruments = instruments
+        self._margin_only = margin_only
+        self._accounts = []
+        self._account_rows = {}
+        self._symbols = []
+        self._symbol_columns = {}
+        self._currencies = []
+        self._currency_indexes = {}
+        # (account, position id) -> (row, column, signed volume, volume * AvgPx, volume / AvgPx)
+        self._positions = {}
+
+        self._volume = np.zeros((0, 0))
+        self._cost = np.zeros((0, 0))
+        self._inverse_cost = np.zeros((0, 0))
+        self._prices = np.zeros(0)
+        self._multipliers = np.zeros(0)
+        self._inverse = np.zeros(0, dtype=bool)
+        self._margin_rates = np.zeros(0)
+        self._currency_columns = np.zeros(0, dtype=np.int64)
+
+    def accounts(self):
+        """Accounts in order of matrix rows"""
+
+        return list(self._accounts)
+
+    def symbols(self):
+        """Symbols in order of matrix columns"""
+
+        return list(self._symbols)
+
+    def currencies(self):
+        """Currencies in order of columns of per currency results"""
+
+        return list(self._currencies)
+
+    def _grow(self, rows, columns):
+        capacity_rows, capacity_columns = self._volume.shape
+        if rows <= capacity_rows and columns <= capacity_columns:
+            return
+
+        shape = (max(rows, 2 * capacity_rows), max(columns, 2 * capacity_columns))
+        for name in ('_volume', '_cost', '_inverse_cost'):
+            old = getattr(self, name)
+            new = np.zeros(shape)
+            new[:old.shape[0], :old.shape[1]] = old
+            setattr(self, name, new)
+
+        if shape[1] > capacity_columns:
+            for name in ('_prices', '_multipliers', '_inverse', '_margin_rates', '_currency_columns'):
+                old = getattr(self, name)
+                new = np.zeros(shape[1], dtype=old.dtype)
+                new[:len(old)] = old
+                setattr(self, name, new)
+
+    def _row(self, account):
+        row = self._account_rows.get(account)
+        if row is None:
+            row = len(self._accounts)
+            self._grow(row + 1, len(self._symbols))
+            self._accounts.append(account)
+            self._account_rows[account] = row
+        return row
+
+    def _set_contract(self, column, symbol):
+        instrument = None
+        if self._instruments is not None and symbol in self._instruments:
+            instrument = self._instruments[symbol]
+            contract = Contract(instrument, self._instruments.price_step(symbol))
+        else:
+            contract = Contract()
+
+        currency = self._currency_indexes.get(contract.currency)
+        if currency is None:
+            currency = len(self._currencies)
+            self._currencies.append(contract.currency)
+            self._currency_indexes[contract.currency] = currency
+
+        self._multipliers[column] = contract.multiplier
+        self._inverse[column] = contract.inverse
+        self._currency_columns[column] = currency
+        self._margin_rates[column] = 0.0
+        if instrument is not None and len(instrument.Margin.Rates) > 0:
+            # rate of the lowest volume tier
+            self._margin_rates[column] = float(instrument.Margin.Rates[0].InitialRate or 0)
+
+    def _column(self, symbol):
+        column = self._symbol_columns.get(symbol)
+        if column is None:
+            column = len(self._symbols)
+            self._grow(len(self._accounts), column + 1)
+            self._symbols.append(symbol)
+            self._symbol_columns[symbol] = column
+            self._set_contract(column, symbol)
+        return column
+
+    def refresh_contracts(self):
+        """Reload contract specs and margin rates of known symbols from instruments"""
+
+        for column, symbol in enumerate(self._symbols):
+            self._set_contract(column, symbol)
+
+    def on_position_change(self, old, new):
+        """Update cell of the position, could be used as xena.positions.PositionStore position change callback"""
+
+        report = old if new is None else new
+        if self._margin_only and not is_margin(report.Account):
+            return
+
+        key = (report.Account, report.PositionId)
+        known = self._positions.pop(key, None)
+        if known is not None:
+            row, column, volume, cost, inverse_cost = known
+            self._volume[row, column] -= volume
+            self._cost[row, column] -= cost
+            self._inverse_cost[row, column] -= inverse_cost
+
+        if new is None:
+            return
+
+        row = self._row(new.Account)
+        column = self._column(new.Symbol)
+        volume = float(new.Volume or 0)
+        if new.Side == constants.Side_Sell:
+            volume = -volume
+        price = float(new.AvgPx or 0)
+        cost = volume * price
+        inverse_cost = volume / price if price != 0 else 0.0
+        self._positions[key] = (row, column, volume, cost, inverse_cost)
+        self._volume[row, column] += volume
+        self._cost[row, column] += cost
+        self._inverse_cost[row, column] += inverse_cost
+
+    def attach(self, position_store):
+        """Load open positions of :position_store and follow its changes
+
+        :type position_store: xena.positions.PositionStore
+        """
+
+        for position in position_store.positions():
+            self.on_position_change(None, position)
+        position_store.on_position_change(self.on_position_change)
+
+    def set_price(self, symbol, price):
+        self._prices[self._column(symbol)] = float(price)
+
+    def set_prices(self, prices):
+        """
+        :param prices: price per symbol
+        :type prices: dict of str to float or str
+        """
+
+        for symbol, price in prices.items():
+            self._prices[self._column(symbol)] = float(price)
+
+    def prices(self):
+        """Prices in order of symbols(), 0 for unknown"""
+
+        return self._prices[:len(self._symbols)].copy()
+
+    def _view(self):
+        rows, columns = len(self._accounts), len(self._symbols)
+        return (self._volume[:rows, :columns], self._cost[:rows, :columns], self._inverse_cost[:rows, :columns],
+                self._prices[:columns], self._multipliers[:columns], self._inverse[:columns])
+
+    def volumes(self):
+        """Net signed volume, accounts x symbols"""
+
+        return self._volume[:len(self._accounts), :len(self._symbols)].copy()
+
+    def _by_currency(self, values):
+        """Sum accounts x symbols (or scenarios x accounts x symbols) values per currency"""
+
+        columns = len(self._symbols)
+        one_hot = np.zeros((columns, len(self._currencies)))
+        one_hot[np.arange(columns), self._currency_columns[:columns]] = 1.0
+        return values @ one_hot
+
+    def _signed_notional(self, volume, prices, multipliers, inverse):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            inverse_value = np.where(prices > 0, volume / np.where(prices > 0, prices, 1), 0.0)
+        return np.where(inverse, inverse_value, volume * prices) * multipliers
+
+    def notional(self):
+        """Absolute notional at current prices, accounts x symbols, in currency of each symbol"""
+
+        volume, _, _, prices, multipliers, inverse = self._view()
+        return np.abs(self._signed_notional(volume, prices, multipliers, inverse))
+
+    def exposure(self):
+        """Net signed notional per currency, accounts x currencies"""
+
+        volume, _, _, prices, multipliers, inverse = self._view()
+        return self._by_currency(self._signed_notional(volume, prices, multipliers, inverse))
+
+    def margin_usage(self):
+        """Initial margin of positions per currency, accounts x currencies"""
+
+        columns = len(self._symbols)
+        return self._by_currency(self.notional() * self._margin_rates[:columns])
+
+    def _pnl(self, prices):
+        """Floating pnl at :prices of shape (..., symbols), broadcast over accounts"""
+
+        volume, cost, inverse_cost, _, multipliers, inverse = self._view()
+        known = prices > 0
+        safe_prices = np.where(known, prices, 1.0)
+        linear = prices * volume - cost
+        inverse_pnl = inverse_cost - volume / safe_prices
+        return np.where(known, np.where(inverse, inverse_pnl, linear), 0.0) * multipliers
+
+    def pnl(self):
+        """Floating pnl at current prices, accounts x symbols, 0 for symbols without price"""
+
+        return self._pnl(self._prices[:len(self._symbols)])
+
+    def scenarios(self, shocks):
+        """PnL change per currency if prices move by relative :shocks
+
+        :param shocks: relative price change per symbol in order of symbols(), shape (symbols,) for one scenario
+            or (scenarios, symbols), like 0.1 for +10%, see xena.portfolio.symbol_shocks
+        :type shocks: numpy array
+        :returns: accounts x currencies array, or scenarios x accounts x currencies for 2d :shocks
+        """
+
+        shocks = np.asarray(shocks, dtype=float)
+        if shocks.shape[-1] != len(self._symbols):
+            raise ValueError("Shocks have to be set for {} symbols".format(len(self._symbols)))
+
+        prices = self._prices[:len(self._symbols)]
+        shocked = prices * (1 + shocks)
+        if shocks.ndim == 2:
+            # scenarios x 1 x symbols broadcasts over accounts
+            shocked = shocked[:, np.newaxis, :]
+        return self._by_currency(self._pnl(shocked) - self._pnl(prices))
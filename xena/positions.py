@@ -0,0 +1,165 @@
+import collections
+import logging
+from decimal import Decimal, ROUND_HALF_UP
+
+import xena.proto.constants as constants
+
+
+class PositionStore:
+    """Open positions indexed by (Account, PositionId) with net volume per (Account, Symbol), updated from
+    PositionReport and MassPositionReport messages.
+
+    Net volume is changed incrementally by the difference of the updated position, so reading it is O(1).
+    If :instruments are set, volumes of known symbols are summed as int lots, otherwise as Decimal.
+    XenaTradingWebsocketClient does it when created with track_positions=True.
+    """
+
+    def __init__(self, instruments=None):
+        """
+        :param instruments: instruments to sum volumes in lots
+        :type instruments: xena.instruments.InstrumentCache
+        """
+
+        self._log = logging.getLogger(__name__)
+        self._instruments = instruments
+        # (account, position id) -> PositionReport
+        self._positions = {}
+        # (account, position id) -> signed volume added to net volume
+        self._volumes = {}
+        # (account, symbol) -> signed net volume
+        self._net = {}
+        self._by_account = collections.defaultdict(set)
+        self._on_position_change = []
+        # accounts waiting for MassPositionReport after reconnect
+        self.stale_accounts = set()
+
+    def __len__(self):
+        return len(self._positions)
+
+    def on_position_change(self, callback):
+        """Add callback(old, new) called with PositionReports on position change,
+        old is None for new position, new is None for closed position
+
+        :param callback: function
+        :type callback: callable
+        """
+
+        self._on_position_change.append(callback)
+
+    def _notify(self, old, new):
+        for callback in self._on_position_change:
+            try:
+                callback(old, new)
+            except Exception:
+                self._log.exception('position change callback')
+
+    def _signed_volume(self, report):
+        if self._instruments is not None and report.Symbol in self._instruments:
+            volume = self._instruments.qty_fixed_point(report.Symbol).parse(report.Volume, ROUND_HALF_UP)
+        else:
+            volume = Decimal(report.Volume or 0)
+
+        if report.Side == constants.Side_Sell:
+            return -volume
+        return volume
+
+    def _format(self, symbol, volume):
+        if isinstance(volume, int) and self._instruments is not None and symbol in self._instruments:
+            return self._instruments.qty_fixed_point(symbol).format(volume)
+        return str(volume)
+
+    def position(self, account, position_id):
+        """xena.proto.positions_pb2.PositionReport or None"""
+
+        return self._positions.get((account, position_id))
+
+    def positions(self, account=None, symbol=None):
+        """List of open positions, optionally filtered by :account and :symbol"""
+
+        if account is None:
+            positions = self._positions.values()
+        else:
+            positions = [self._positions[key] for key in self._by_account.get(account, ())]
+        if symbol is None:
+            return list(positions)
+        return [position for position in positions if position.Symbol == symbol]
+
+    def net(self, account, symbol):
+        """Signed net volume as int lots or Decimal, positive for long"""
+
+        return self._net.get((account, symbol), 0)
+
+    def net_volume(self, account, symbol):
+        """Signed net volume as string, could be used as positions source of xena.risk.RiskGate"""
+
+        return self._format(symbol, self._net.get((account, symbol), 0))
+
+    def net_volumes(self, account):
+        """Signed net volume per symbol of :account like xena.helpers.aggregate_positions_volume"""
+
+        return {symbol: self._format(symbol, volume) for (acc, symbol), volume in self._net.items() if acc == account}
+
+    def _remove(self, key):
+        report = self._positions.pop(key)
+        volume = self._volumes.pop(key)
+        self._by_account[key[0]].discard(key)
+        self._add_net(key[0], report.Symbol, -volume)
+        return report
+
+    def _add_net(self, account, symbol, volume):
+        net_key = (account, symbol)
+        net = self._net.get(net_key, 0) + volume
+        if net == 0:
+            self._net.pop(net_key, None)
+        else:
+            self._net[net_key] = net
+
+    def _set(self, report, snapshot=False):
+        key = (report.Account, report.PositionId)
+        old = self._positions.get(key)
+        if old is not None:
+            if not snapshot and report.TransactTime != 0 and report.TransactTime < old.TransactTime:
+                # stale report
+                return
+            self._remove(key)
+
+        volume = self._signed_volume(report)
+        if volume == 0:
+            # closed position
+            if old is not None:
+                self._notify(old, None)
+            return
+
+        self._positions[key] = report
+        self._volumes[key] = volume
+        self._by_account[report.Account].add(key)
+        self._add_net(report.Account, report.Symbol, volume)
+        self._notify(old, report)
+
+    def _reset_account(self, account, reports):
+        for report in reports:
+            if report.Account == 0:
+                report.Account = account
+        ids = set(report.PositionId for report in reports)
+        for key in list(self._by_account.get(account, ())):
+            if key[1] not in ids:
+                self._notify(self._remove(key), None)
+        for report in reports:
+            self._set(report, snapshot=True)
+        self.stale_accounts.discard(account)
+
+    def apply(self, msg):
+        """Apply incoming message, only PositionReport and MassPositionReport change the store"""
+
+        if msg.MsgType == constants.MsgType_PositionReport:
+            self._set(msg)
+        elif msg.MsgType == constants.MsgType_MassPositionReport:
+            if msg.RejectReason != "":
+                self._log.warning('positions of %s are rejected: %s %s', msg.Account, msg.RejectReason, msg.Text)
+                return
+            self._reset_account(msg.Account, msg.OpenPositions)
+
+    def invalidate(self, accounts=None):
+        """Mark positions of :accounts (all known if not set) as stale until the next MassPositionReport"""
+
+        self.stale_accounts.update(self._by_account if accounts is None else accounts)
@@ -1,4 +1,5 @@
 import aiohttp
+import asyncio
 import logging
 import time
 import requests
@@ -15,14 +16,87 @@ import xena.proto.constants as constants
 import xena.serialization as serialization
 import xena.helpers as helpers
 import xena.exceptions as exceptions
+from xena.paginate import paginate
 
 
 class XenaClient:
+    """Base REST client, all requests share one aiohttp session with a pool of keep-alive connections.
+
+    The session is created on the first request, close() it when the client is not needed anymore
+    or use the client as async context manager::
+
+        async with XenaMDClient(loop) as client:
+            await client.warmup(connections=4)
+            ...
+    """
+
+    WARMUP_PATH = '/market-data/v2/server-time'
+
+    def __init__(self, url, loop, limit=100, limit_per_host=0, keepalive_timeout=30, ttl_dns_cache=300):
+        """
+        :param loop: ignored, the session uses the running event loop, kept for compatibility
+        :param limit: max number of open connections
+        :type limit: int
+        :param limit_per_host: max number of open connections to one host, unlimited if 0
+        :type limit_per_host: int
+        :param keepalive_timeout: seconds to keep idle connection open
+        :type keepalive_timeout: float
+        :param ttl_dns_cache: seconds to cache resolved host addresses, no expiration if None
+        :type ttl_dns_cache: int
+        """
 
-    def __init__(self, url, loop):
         self._log = logging.getLogger(__name__)
         self._loop = loop
         self._url = url
+        self._connector_options = {
+            'limit': limit,
+            'limit_per_host': limit_per_host,
+            'keepalive_timeout': keepalive_timeout,
+            'ttl_dns_cache': ttl_dns_cache,
+        }
+        self._session = None
+        # xena.cache.ResponseCache for GET responses of public endpoints
+        self.cache = None
+        # cache key -> task of response text, concurrent equal requests wait for the first one
+        self._in_flight = {}
+
+    async def __aenter__(self):
+        self._get_session()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(**self._connector_options)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def close(self):
+        """Close the session and all pooled connections"""
+
+        if self._session is not None:
+            session, self._session = self._session, None
+            await session.close()
+
+    async def warmup(self, connections=1):
+        """Open :connections pooled connections in advance, so the first requests skip TCP and TLS handshakes
+
+        :param connections: number of concurrent requests to WARMUP_PATH
+        :type connections: int
+        """
+
+        session = self._get_session()
+
+        async def touch():
+            async with session.get(self.URL + self.WARMUP_PATH, headers=XenaClient._get_headers(self)) as response:
+                await response.read()
+
+        results = await asyncio.gather(*[touch() for _ in range(connections)], return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                self._log.warning('warmup request failed: %s', result)
 
     def _get_headers(self):
         return {
@@ -34,10 +108,44 @@ class XenaClient:
         uri = self.URL + path 
         msg = kwargs.pop('msg', None)
         kwargs['headers'] = self._get_headers()
-        async with aiohttp.ClientSession(loop=self._loop) as session:
-            async with getattr(session, method)(uri, **kwargs) as response:
+        key = None
+        if self.cache is not None and method == 'get':
+            key = self.cache.key(path, kwargs.get('params'))
+        if key is None:
+            async with getattr(self._get_session(), method)(uri, **kwargs) as response:
                 return await self._handle_response(response, msg)
 
+        text = self.cache.get(key)
+        if text is None:
+            text = await self._cached_text(key, path, uri, kwargs)
+        return serialization.from_json(text, to=msg)
+
+    async def _cached_text(self, key, path, uri, kwargs):
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.cache.stats.coalesced += 1
+        else:
+            # request runs as own task, so cancelling any waiter, including the first one, does not cancel others
+            task = asyncio.ensure_future(self._fetch_text(key, path, uri, kwargs))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._fetch_done(key, done))
+        return await asyncio.shield(task)
+
+    async def _fetch_text(self, key, path, uri, kwargs):
+        async with self._get_session().get(uri, **kwargs) as response:
+            text = await response.text()
+            if not str(response.status).startswith('2'):
+                raise exceptions.RequestException(response, response.status, text)
+        self.cache.put(key, path, kwargs.get('params'), text)
+        return text
+
+    def _fetch_done(self, key, task):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if not task.cancelled():
+            # waiters get the exception, it is retrieved here in case all of them are cancelled
+            task.exception()
+
     async def _handle_response(self, response, msg=None):
         if not str(response.status).startswith('2'):
             raise exceptions.RequestException(response, response.status, await response.text())
@@ -55,8 +163,13 @@ class XenaMDClient(XenaClient):
 
     URL = 'https://api.xena.exchange'
 
-    def __init__(self, loop):
-        super().__init__(self.URL, loop)
+    def __init__(self, loop, **kwargs):
+        """
+        :param loop: ignored, kept for compatibility, see XenaClient
+        :param kwargs: connection pool options, see XenaClient
+        """
+
+        super().__init__(self.URL, loop, **kwargs)
         self._log = logging.getLogger(__name__)
 
     async def candles(self, symbol, timeframe='1m', ts_from="", ts_to=""):
@@ -125,6 +238,14 @@ class XenaMDClient(XenaClient):
             "limit": limit
         })
     
+    def iter_trades(self, symbol, ts_from="", ts_to="", limit=100, concurrency=4):
+        """Async generator of trades of all pages, pages are prefetched concurrently, see trades() and xena.paginate.paginate
+
+        :returns: xena.proto.market_pb2.MDEntry
+        """
+
+        return paginate(lambda page, limit: self.trades(symbol, ts_from, ts_to, page, limit), limit, concurrency)
+
     async def server_time(self):
         """Get server time
         
@@ -148,12 +269,21 @@ class XenaTradingClient(XenaClient):
     URL = 'https://api.xena.exchange'
     #  URL = 'http://localhost/api/trading'
 
-    def __init__(self, api_key, api_secret, loop):
-        super().__init__(self.URL, loop)
+    def __init__(self, api_key, api_secret, loop, **kwargs):
+        """
+        :param loop: ignored, kept for compatibility, see XenaClient
+        :param kwargs: connection pool options, see XenaClient
+        """
+
+        super().__init__(self.URL, loop, **kwargs)
 
         self._api_key = api_key
         self._api_secret = api_secret
         self._log = logging.getLogger(__name__)
+        # xena.normalize.OrderNormalizer to fit orders to instrument steps before they are sent
+        self.normalizer = None
+        # xena.risk.RiskGate to check orders before they are sent
+        self.risk_gate = None
 
     def _get_headers(self):
         timestamp = int(time.time() * 1000000000)
@@ -171,6 +301,11 @@ class XenaTradingClient(XenaClient):
         return headers
 
     async def new_order(self, cmd):
+        if self.normalizer is not None:
+            self.normalizer.normalize(cmd)
+        if self.risk_gate is not None:
+            self.risk_gate.check(cmd)
+
         return await self._post('/trading/order/new', data=serialization.to_json(cmd))
 
     async def market_order(self, account, client_order_id, symbol, side, qty, **kwargs):
@@ -247,8 +382,56 @@ class XenaTradingClient(XenaClient):
         if not isinstance(cmd, order_pb2.OrderCancelReplaceRequest):
             raise ValueError("Command has to be OrderCancelRequest")
 
+        if self.normalizer is not None:
+            self.normalizer.normalize(cmd)
+        if self.risk_gate is not None:
+            self.risk_gate.check(cmd)
+
         return await self._post('/trading/order/replace', data=serialization.to_json(cmd))
 
+    async def batch(self, cmds, concurrency=10):
+        """Send many orders, cancels and replaces with at most :concurrency requests at once.
+        All commands are normalized, checked and serialized before the first request, so a misfit or
+        risk breach of any command raises before anything is sent.
+        REST api has no endpoint for NewOrderList, lists could be sent by XenaTradingWebsocketClient.send_batch
+
+        :param cmds: required
+        :type cmds: list of NewOrderSingle, OrderCancelRequest, OrderCancelReplaceRequest or OrderMassCancelRequest
+        :param concurrency: max number of requests in flight
+        :type concurrency: int
+
+        :returns: list of responses in order of :cmds, failed request has exception instead of response
+        """
+
+        payloads = []
+        # risk limits count earlier commands of the batch
+        pending = {}
+        for cmd in cmds:
+            if isinstance(cmd, order_pb2.NewOrderSingle):
+                path = '/trading/order/new'
+            elif isinstance(cmd, order_pb2.OrderCancelReplaceRequest):
+                path = '/trading/order/replace'
+            elif isinstance(cmd, order_pb2.OrderCancelRequest):
+                path = '/trading/order/cancel'
+            elif isinstance(cmd, order_pb2.OrderMassCancelRequest):
+                path = '/trading/order/mass-cancel'
+            else:
+                raise ValueError("Command {} can not be sent in batch".format(type(cmd).__name__))
+
+            if self.normalizer is not None:
+                self.normalizer.normalize(cmd)
+            if self.risk_gate is not None:
+                self.risk_gate.check(cmd, pending)
+            payloads.append((path, serialization.to_json(cmd)))
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def post(path, data):
+            async with semaphore:
+                return await self._post(path, data=data)
+
+        return await asyncio.gather(*[post(path, data) for path, data in payloads], return_exceptions=True)
+
     async def collapse_positions(self, account, symbol):
         """Send request to collapse positions"""
 
@@ -347,6 +530,12 @@ class XenaTradingClient(XenaClient):
             "limit": limit
         })
     
+    def iter_positions_history(self, account, id=0, parentid=0, symbol="", open_ts_from=0, open_ts_to=0, close_ts_from=0, close_ts_to=0, limit=100, concurrency=4):
+        """Async generator of positions of all pages of positions_history(), pages are prefetched concurrently, see xena.paginate.paginate"""
+
+        return paginate(lambda page, limit: self.positions_history(
+            account, id, parentid, symbol, open_ts_from, open_ts_to, close_ts_from, close_ts_to, page, limit), limit, concurrency)
+
     async def order(self, account, client_order_id="", order_id=""):
         """Request last status fro :client_order_id or :order_id for :account
 
@@ -411,6 +600,11 @@ class XenaTradingClient(XenaClient):
         })
     
   
+    def iter_last_order_statuses(self, account, symbol="", ts_from=0, ts_to=0, limit=100, concurrency=4):
+        """Async generator of execution reports of all pages of last_order_statuses(), see xena.paginate.paginate"""
+
+        return paginate(lambda page, limit: self.last_order_statuses(account, symbol, ts_from, ts_to, page, limit), limit, concurrency)
+
     async def order_history(self, account, symbol="", ts_from=0, ts_to=0, page=1, limit=0):
         """Request order history for :account
         
@@ -438,6 +632,11 @@ class XenaTradingClient(XenaClient):
             "limit": limit
         })
     
+    def iter_order_history(self, account, symbol="", ts_from=0, ts_to=0, limit=100, concurrency=4):
+        """Async generator of execution reports of all pages of order_history(), see xena.paginate.paginate"""
+
+        return paginate(lambda page, limit: self.order_history(account, symbol, ts_from, ts_to, page, limit), limit, concurrency)
+
     async def trade_history(self, account, trade_id="", client_order_id="", symbol="", ts_from=0, ts_to=0, page=1, limit=0):
         """Request trade history for :account
         
@@ -470,6 +669,12 @@ class XenaTradingClient(XenaClient):
             "limit": limit
         })
     
+    def iter_trade_history(self, account, trade_id="", client_order_id="", symbol="", ts_from=0, ts_to=0, limit=100, concurrency=4):
+        """Async generator of trades of all pages of trade_history(), see xena.paginate.paginate"""
+
+        return paginate(lambda page, limit: self.trade_history(
+            account, trade_id, client_order_id, symbol, ts_from, ts_to, page, limit), limit, concurrency)
+
     async def balance(self, account):
         """Request balances for :account
         
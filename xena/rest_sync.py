@@ -1,9 +1,13 @@
+import concurrent.futures
 import logging
+import threading
 import time
 from datetime import datetime
 from hashlib import sha256
 import requests
 from ecdsa import SigningKey
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 import xena.proto.common_pb2 as common_pb2
 import xena.proto.market_pb2 as market_pb2
@@ -13,13 +17,85 @@ import xena.proto.constants as constants
 import xena.serialization as serialization
 import xena.helpers as helpers
 import xena.exceptions as exceptions
+from xena.paginate import paginate_sync
 
 
 class XenaSyncClient:
+    """Base sync REST client, each thread reuses its own requests.Session with a pool of keep-alive connections,
+    so the client could be shared by worker threads. Idempotent requests are retried on connection errors
+    and 502, 503, 504 responses, orders are never retried.
+    """
+
+    RETRY_STATUSES = (502, 503, 504)
+
+    def __init__(self, url, pool_connections=10, pool_maxsize=10, retries=3, backoff_factor=0.3, workers=4):
+        """
+        :param pool_connections: number of hosts to keep connection pools for
+        :type pool_connections: int
+        :param pool_maxsize: max number of kept connections per host
+        :type pool_maxsize: int
+        :param retries: max number of retries of idempotent requests, 0 disables retries
+        :type retries: int
+        :param backoff_factor: delay before the n-th retry is backoff_factor * 2^(n-1) seconds
+        :type backoff_factor: float
+        :param workers: number of threads requesting pages for iter_* methods
+        :type workers: int
+        """
 
-    def __init__(self, url):
         self._log = logging.getLogger(__name__)
         self._url = url
+        self._pool_connections = pool_connections
+        self._pool_maxsize = pool_maxsize
+        self._retries = retries
+        self._backoff_factor = backoff_factor
+        self._local = threading.local()
+        self._sessions = []
+        self._sessions_lock = threading.Lock()
+        self._workers = workers
+        # pool shared by iter_* methods, so its threads keep their sessions warm between calls
+        self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _new_session(self):
+        retry = Retry(total=self._retries, backoff_factor=self._backoff_factor, status_forcelist=self.RETRY_STATUSES,
+                      raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=self._pool_connections, pool_maxsize=self._pool_maxsize, max_retries=retry)
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def _get_session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = self._new_session()
+            with self._sessions_lock:
+                self._sessions.append(session)
+        return session
+
+    def _paginate(self, fetch, limit, concurrency):
+        with self._sessions_lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(self._workers)
+            executor = self._executor
+        return paginate_sync(fetch, limit, concurrency, executor=executor)
+
+    def close(self):
+        """Close sessions of all threads and stop the threads of iter_* methods"""
+
+        with self._sessions_lock:
+            sessions, self._sessions = self._sessions, []
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+        self._local = threading.local()
+        for session in sessions:
+            session.close()
 
     def _get_headers(self):
         return {
@@ -31,9 +107,8 @@ class XenaSyncClient:
         uri = self.URL + path
         msg = kwargs.pop('msg', None)
         kwargs['headers'] = self._get_headers()
-        with requests.Session() as session:
-            with getattr(session, method)(uri, **kwargs) as response:
-                return self._handle_response(response, msg)
+        with getattr(self._get_session(), method)(uri, **kwargs) as response:
+            return self._handle_response(response, msg)
 
     def _handle_response(self, response, msg=None):
         if not str(response.status_code).startswith('2'):
@@ -53,8 +128,12 @@ class XenaMDSyncClient(XenaSyncClient):
 
     URL = 'https://api.xena.exchange'
 
-    def __init__(self):
-        super().__init__(self.URL)
+    def __init__(self, **kwargs):
+        """
+        :param kwargs: connection pool and retry options, see XenaSyncClient
+        """
+
+        super().__init__(self.URL, **kwargs)
         self._log = logging.getLogger(__name__)
 
     def candles(self, symbol, timeframe='1m', ts_from="", ts_to=""):
@@ -78,6 +157,14 @@ class XenaMDSyncClient(XenaSyncClient):
             "limit": limit
         })
 
+    def iter_trades(self, symbol, ts_from="", ts_to="", limit=100, concurrency=4):
+        """Generator of trades of all pages, pages are prefetched by client threads, see trades() and xena.paginate.paginate_sync
+
+        :returns: xena.proto.market_pb2.MDEntry
+        """
+
+        return self._paginate(lambda page, limit: self.trades(symbol, ts_from, ts_to, page, limit), limit, concurrency)
+
     def server_time(self):
         resp = self._get('/market-data/v2/server-time', msg=common_pb2.Heartbeat)
         return datetime.fromtimestamp(resp.TransactTime/1000000000)
@@ -91,12 +178,20 @@ class XenaTradingSyncClient(XenaSyncClient):
 
     URL = 'https://api.xena.exchange'
 
-    def __init__(self, api_key, api_secret):
-        super().__init__(self.URL)
+    def __init__(self, api_key, api_secret, **kwargs):
+        """
+        :param kwargs: connection pool and retry options, see XenaSyncClient
+        """
+
+        super().__init__(self.URL, **kwargs)
 
         self._api_key = api_key
         self._api_secret = api_secret
         self._log = logging.getLogger(__name__)
+        # xena.normalize.OrderNormalizer to fit orders to instrument steps before they are sent
+        self.normalizer = None
+        # xena.risk.RiskGate to check orders before they are sent
+        self.risk_gate = None
 
     def _get_headers(self):
         timestamp = int(time.time() * 1000000000)
@@ -114,6 +209,11 @@ class XenaTradingSyncClient(XenaSyncClient):
         return headers
 
     def new_order(self, cmd):
+        if self.normalizer is not None:
+            self.normalizer.normalize(cmd)
+        if self.risk_gate is not None:
+            self.risk_gate.check(cmd)
+
         return self._post('/trading/order/new', data=serialization.to_json(cmd))
 
     def market_order(self, account, client_order_id, symbol, side, qty, **kwargs):
@@ -172,6 +272,11 @@ class XenaTradingSyncClient(XenaSyncClient):
         if not isinstance(cmd, order_pb2.OrderCancelReplaceRequest):
             raise ValueError("Command has to be OrderCancelRequest")
 
+        if self.normalizer is not None:
+            self.normalizer.normalize(cmd)
+        if self.risk_gate is not None:
+            self.risk_gate.check(cmd)
+
         return self._post('/trading/order/replace', data=serialization.to_json(cmd))
 
     def collapse_positions(self, account, symbol):
@@ -220,6 +325,12 @@ class XenaTradingSyncClient(XenaSyncClient):
             "limit": limit
         })
 
+    def iter_positions_history(self, account, id=0, parentid=0, symbol="", open_ts_from=0, open_ts_to=0, close_ts_from=0, close_ts_to=0, limit=100, concurrency=4):
+        """Generator of positions of all pages of positions_history(), pages are prefetched by client threads, see xena.paginate.paginate_sync"""
+
+        return self._paginate(lambda page, limit: self.positions_history(
+            account, id, parentid, symbol, open_ts_from, open_ts_to, close_ts_from, close_ts_to, page, limit), limit, concurrency)
+
     def order(self, account, client_order_id="", order_id=""):
         if client_order_id == "" and order_id == "":
             raise ValueError("client_order_id or order_id is required")
@@ -247,6 +358,11 @@ class XenaTradingSyncClient(XenaSyncClient):
             "limit": limit
         })
     
+    def iter_last_order_statuses(self, account, symbol="", ts_from=0, ts_to=0, limit=100, concurrency=4):
+        """Generator of execution reports of all pages of last_order_statuses(), see xena.paginate.paginate_sync"""
+
+        return self._paginate(lambda page, limit: self.last_order_statuses(account, symbol, ts_from, ts_to, page, limit), limit, concurrency)
+
     def order_history(self, account, symbol="", client_order_id="", order_id="", ts_from=0, ts_to=0, page=1, limit=0):
         return self._get('/trading/accounts/' + str(account) + '/order-history', params={
             "symbol": symbol,
@@ -258,6 +374,12 @@ class XenaTradingSyncClient(XenaSyncClient):
             "limit": limit
         })
 
+    def iter_order_history(self, account, symbol="", client_order_id="", order_id="", ts_from=0, ts_to=0, limit=100, concurrency=4):
+        """Generator of execution reports of all pages of order_history(), see xena.paginate.paginate_sync"""
+
+        return self._paginate(lambda page, limit: self.order_history(
+            account, symbol, client_order_id, order_id, ts_from, ts_to, page, limit), limit, concurrency)
+
     def trade_history(self, account, trade_id="", client_order_id="", symbol="", ts_from=0, ts_to=0, page=1, limit=0):
         return self._get('/trading/accounts/' + str(account) + '/trade-history', params={
             "trade_id": trade_id,
@@ -269,6 +391,12 @@ class XenaTradingSyncClient(XenaSyncClient):
             "limit": limit
         })
 
+    def iter_trade_history(self, account, trade_id="", client_order_id="", symbol="", ts_from=0, ts_to=0, limit=100, concurrency=4):
+        """Generator of trades of all pages of trade_history(), see xena.paginate.paginate_sync"""
+
+        return self._paginate(lambda page, limit: self.trade_history(
+            account, trade_id, client_order_id, symbol, ts_from, ts_to, page, limit), limit, concurrency)
+
     def balance(self, account):
         return self._get('/trading/accounts/' + str(account) + '/balance')
 
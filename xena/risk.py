@@ -0,0 +1,206 @@
+import logging
+
+import xena.proto.constants as constants
+import xena.proto.order_pb2 as order_pb2
+import xena.exceptions as exceptions
+
+
+CHECK_MAX_QTY = 'max_qty'
+CHECK_MAX_NOTIONAL = 'max_notional'
+CHECK_MAX_OPEN_ORDERS = 'max_open_orders'
+CHECK_MAX_POSITION = 'max_position'
+CHECK_PRICE_BAND = 'price_band'
+# notional of market order can not be checked without price in the book
+CHECK_NO_PRICE = 'no_price'
+
+
+class RiskLimits:
+    """Pre-trade limits for one symbol, None disables the check"""
+
+    __slots__ = ('max_qty', 'max_notional', 'max_open_orders', 'max_position', 'price_band')
+
+    def __init__(self, max_qty=None, max_notional=None, max_open_orders=None, max_position=None, price_band=None):
+        """
+        :param max_qty: max OrderQty of one order
+        :type max_qty: float
+        :param max_notional: max OrderQty * price of one order, market orders are valued at the best opposite price
+        :type max_notional: float
+        :param max_open_orders: max number of open orders per account in the symbol
+        :type max_open_orders: int
+        :param max_position: max absolute position per account in the symbol if the order and all open orders on the same side are filled
+        :type max_position: float
+        :param price_band: max relative distance of limit price from the book mid price, like 0.05 for 5%
+        :type price_band: float
+        """
+
+        self.max_qty = max_qty
+        self.max_notional = max_notional
+        self.max_open_orders = max_open_orders
+        self.max_position = max_position
+        self.price_band = price_band
+
+    def __repr__(self):
+        return 'RiskLimits({})'.format(', '.join('{}={}'.format(name, getattr(self, name)) for name in self.__slots__))
+
+
+class RiskGate:
+    """Local pre-trade checks of NewOrderSingle and OrderCancelReplaceRequest.
+
+    Checks use only local state: open orders from xena.orders.OrderStore, positions from :positions callable
+    and prices from xena.book.OrderBooks, so a breach is rejected with xena.exceptions.RiskRejectException
+    before the command is sent. Set it as risk_gate of XenaTradingWebsocketClient or XenaTradingClient.
+    """
+
+    def __init__(self, order_store=None, positions=None, books=None, default_limits=None):
+        """
+        :param order_store: source of open orders, e.g. XenaTradingWebsocketClient.order_store
+        :type order_store: xena.orders.OrderStore
+        :param positions: function(account, symbol) returning signed position volume, negative for short
+        :type positions: callable
+        :param books: source of prices for price band and market order notional
+        :type books: xena.book.OrderBooks
+        :param default_limits: limits for symbols without own limits, no checks if not set
+        :type default_limits: xena.risk.RiskLimits
+        """
+
+        self._log = logging.getLogger(__name__)
+        self._order_store = order_store
+        self._positions = positions
+        self._books = books
+        self._default_limits = default_limits
+        self._limits = {}
+
+    def set_limits(self, symbol, limits):
+        self._limits[symbol] = limits
+
+    def remove_limits(self, symbol):
+        self._limits.pop(symbol, None)
+
+    def limits(self, symbol):
+        return self._limits.get(symbol, self._default_limits)
+
+    def _reject(self, check, limit, value, cmd):
+        self._log.warning('reject %s %s by %s: %s, limit %s', cmd.Symbol, cmd.ClOrdId, check, value, limit)
+        raise exceptions.RiskRejectException(check, limit, value, cmd)
+
+    def _to_price(self, book, price):
+        if book.price_fixed_point is not None:
+            return book.price_fixed_point.to_float(price)
+        return price
+
+    def _mid(self, symbol):
+        if self._books is None:
+            return None
+
+        book = self._books.get(symbol)
+        if book is None:
+            return None
+        mid = book.mid
+        if mid is None:
+            return None
+        return self._to_price(book, mid)
+
+    def _opposite_price(self, symbol, side):
+        if self._books is None:
+            return None
+
+        book = self._books.get(symbol)
+        if book is None:
+            return None
+        level = book.best_ask if side == constants.Side_Buy else book.best_bid
+        if level is None:
+            return None
+        return self._to_price(book, level[0])
+
+    def _open_qty(self, account, symbol, side, exclude):
+        qty = 0.0
+        for order in self._order_store.open_orders(account, symbol):
+            if order.side == side and order is not exclude:
+                qty += float(order.leaves_qty or order.order_qty or 0)
+        return qty
+
+    def check(self, cmd, pending=None):
+        """Check NewOrderSingle, each order of NewOrderList or OrderCancelReplaceRequest, other commands always pass
+
+        :param pending: commands checked before :cmd, but not tracked yet, e.g. earlier commands of a batch,
+            pass the same dict to every check of the batch, so open orders and positions limits count them as well
+        :type pending: dict
+        :raises: xena.exceptions.RiskRejectException
+        """
+
+        if isinstance(cmd, order_pb2.NewOrderList):
+            if pending is None:
+                pending = {}
+            for element in cmd.ListOrdGrp:
+                self.check(element, pending)
+            return
+
+        if isinstance(cmd, order_pb2.NewOrderSingle):
+            replaced = None
+        elif isinstance(cmd, order_pb2.OrderCancelReplaceRequest):
+            replaced = None
+            if self._order_store is not None:
+                replaced = self._order_store.get(cmd.OrigClOrdId)
+                if replaced is None and cmd.OrderId != "":
+                    replaced = self._order_store.get_by_order_id(cmd.OrderId)
+        else:
+            return
+
+        limits = self._limits.get(cmd.Symbol, self._default_limits)
+        if limits is None:
+            return
+
+        order_qty = cmd.OrderQty
+        if order_qty == "" and replaced is not None:
+            order_qty = replaced.order_qty
+        qty = float(order_qty or 0)
+        # (account, symbol) -> [number of new orders, buy qty, sell qty] of pending commands
+        key = (cmd.Account, cmd.Symbol)
+        batched = pending.get(key, (0, 0.0, 0.0)) if pending is not None else (0, 0.0, 0.0)
+
+        if limits.max_qty is not None and qty > limits.max_qty:
+            self._reject(CHECK_MAX_QTY, limits.max_qty, qty, cmd)
+
+        if limits.max_open_orders is not None and self._order_store is not None and isinstance(cmd, order_pb2.NewOrderSingle):
+            count = self._order_store.open_count(cmd.Account, cmd.Symbol) + batched[0] + 1
+            if count > limits.max_open_orders:
+                self._reject(CHECK_MAX_OPEN_ORDERS, limits.max_open_orders, count, cmd)
+
+        price = float(cmd.Price) if cmd.Price != "" else None
+        if limits.price_band is not None and price is not None:
+            mid = self._mid(cmd.Symbol)
+            if mid is not None and mid > 0:
+                distance = abs(price - mid) / mid
+                if distance > limits.price_band:
+                    self._reject(CHECK_PRICE_BAND, limits.price_band, distance, cmd)
+
+        if limits.max_notional is not None:
+            if price is None and cmd.StopPx != "":
+                price = float(cmd.StopPx)
+            if price is None:
+                price = self._opposite_price(cmd.Symbol, cmd.Side)
+            if price is None:
+                self._reject(CHECK_NO_PRICE, limits.max_notional, None, cmd)
+
+            notional = price * qty
+            if notional > limits.max_notional:
+                self._reject(CHECK_MAX_NOTIONAL, limits.max_notional, notional, cmd)
+
+        is_buy = cmd.Side == constants.Side_Buy
+        if limits.max_position is not None:
+            position = 0.0
+            if self._positions is not None:
+                position = float(self._positions(cmd.Account, cmd.Symbol) or 0)
+
+            exposure = qty + (batched[1] if is_buy else batched[2])
+            if self._order_store is not None:
+                exposure += self._open_qty(cmd.Account, cmd.Symbol, cmd.Side, replaced)
+
+            projected = position + exposure if is_buy else position - exposure
+            # orders reducing the position are allowed even if it's already over the limit
+            if abs(projected) > limits.max_position and abs(projected) > abs(position):
+                self._reject(CHECK_MAX_POSITION, limits.max_position, abs(projected), cmd)
+
+        if pending is not None:
+            count = batched[0] + (1 if isinstance(cmd, order_pb2.NewOrderSingle) else 0)
+            pending[key] = (count, batched[1] + (qty if is_buy else 0.0), batched[2] + (0.0 if is_buy else qty))
@@ -0,0 +1,283 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+import xena.proto.order_pb2 as order_pb2
+import xena.exceptions as exceptions
+
+
+PRIORITY_CANCEL = 0
+PRIORITY_REPLACE = 1
+PRIORITY_NEW = 2
+
+
+def priority(cmd):
+    """Send priority of :cmd, lower goes first.
+    Cancels and commands which are not orders (heartbeats, status requests) go first, then replaces, then new orders
+    """
+
+    if isinstance(cmd, order_pb2.OrderCancelReplaceRequest):
+        return PRIORITY_REPLACE
+    if isinstance(cmd, (order_pb2.NewOrderSingle, order_pb2.NewOrderList)):
+        return PRIORITY_NEW
+    return PRIORITY_CANCEL
+
+
+class TokenBucket:
+    """Token bucket with :rate tokens per second and up to :burst tokens, time is passed explicitly"""
+
+    def __init__(self, rate, burst, now=0):
+        if rate <= 0 or burst < 1:
+            raise ValueError("Rate has to be positive and burst at least 1")
+
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated_at = now
+
+    def _refill(self, now):
+        if now > self._updated_at:
+            self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+
+    def available(self, now):
+        self._refill(now)
+        return self._tokens
+
+    def delay(self, now, tokens=1):
+        """Seconds until :tokens are available"""
+
+        self._refill(now)
+        if self._tokens >= tokens:
+            return 0
+        return (tokens - self._tokens) / self.rate
+
+    def take(self, now, tokens=1):
+        """Take :tokens if available
+
+        :returns: bool
+        """
+
+        self._refill(now)
+        if self._tokens < tokens:
+            return False
+        self._tokens -= tokens
+        return True
+
+
+class QueueStats:
+    """Queueing delay of sent commands of one priority"""
+
+    __slots__ = ('count', 'total_delay', 'max_delay')
+
+    def __init__(self):
+        self.count = 0
+        self.total_delay = 0.0
+        self.max_delay = 0.0
+
+    @property
+    def avg_delay(self):
+        if self.count == 0:
+            return 0.0
+        return self.total_delay / self.count
+
+    def add(self, delay):
+        self.count += 1
+        self.total_delay += delay
+        if delay > self.max_delay:
+            self.max_delay = delay
+
+    def __repr__(self):
+        return 'QueueStats(count={}, avg_delay={:.6f}, max_delay={:.6f})'.format(self.count, self.avg_delay, self.max_delay)
+
+
+class _Item:
+    __slots__ = ('priority', 'seq', 'account', 'cmd', 'payload', 'enqueued_at', 'future', 'delay')
+
+    def __init__(self, priority, seq, account, cmd, payload, enqueued_at, future):
+        self.priority = priority
+        self.seq = seq
+        self.account = account
+        self.cmd = cmd
+        self.payload = payload
+        self.enqueued_at = enqueued_at
+        self.future = future
+        # seconds spent in the queue
+        self.delay = None
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class SendScheduler:
+    """Priority send queue limited by token buckets per connection and per account.
+
+    Commands are queued per account and the best (priority, arrival) command among accounts with free tokens
+    is sent first, so cancels overtake queued replaces and new orders and a throttled account does not block others.
+    poll() is a pure function of the passed time, which makes the scheduler deterministic under a fake clock.
+    """
+
+    def __init__(self, send, connection_rate=None, connection_burst=1, account_rate=None, account_burst=1, clock=time.monotonic, sleep=asyncio.sleep, loop=None):
+        """
+        :param send: coroutine function to send payload of a command
+        :type send: async coroutine
+        :param connection_rate: commands per second for all accounts, no limit if not set
+        :type connection_rate: float
+        :param connection_burst: max commands sent at once for all accounts
+        :type connection_burst: int
+        :param account_rate: commands per second for each account, no limit if not set
+        :type account_rate: float
+        :param account_burst: max commands sent at once for each account
+        :type account_burst: int
+        :param clock: function returning current time in seconds
+        :type clock: callable
+        :param sleep: coroutine function to wait given number of seconds
+        :type sleep: async coroutine
+        """
+
+        self._log = logging.getLogger(__name__)
+        self._send = send
+        self._clock = clock
+        self._sleep = sleep
+        self._loop = loop
+        now = clock()
+        self._connection_bucket = TokenBucket(connection_rate, connection_burst, now) if connection_rate is not None else None
+        self._account_rate = account_rate
+        self._account_burst = account_burst
+        self._account_buckets = {}
+        # account -> heap of _Item
+        self._queues = {}
+        self._seq = itertools.count()
+        self._size = 0
+        self._wakeup = None
+        self._future_run = None
+        self.stats = {PRIORITY_CANCEL: QueueStats(), PRIORITY_REPLACE: QueueStats(), PRIORITY_NEW: QueueStats()}
+
+    def __len__(self):
+        return self._size
+
+    def _account_bucket(self, account, now):
+        if self._account_rate is None:
+            return None
+        if account not in self._account_buckets:
+            self._account_buckets[account] = TokenBucket(self._account_rate, self._account_burst, now)
+        return self._account_buckets[account]
+
+    def enqueue(self, cmd, payload=None, now=None, future=None):
+        """Put :cmd into the queue without sending, see poll()"""
+
+        now = self._clock() if now is None else now
+        account = getattr(cmd, 'Account', 0)
+        item = _Item(priority(cmd), next(self._seq), account, cmd, cmd if payload is None else payload, now, future)
+        heapq.heappush(self._queues.setdefault(account, []), item)
+        self._size += 1
+        return item
+
+    def poll(self, now):
+        """Take commands which could be sent at :now
+
+        :returns: (list of items with cmd, payload and delay in send order, seconds to wait before next poll or None if queue is empty)
+        """
+
+        ready = []
+        while self._size > 0:
+            if self._connection_bucket is not None and self._connection_bucket.delay(now) > 0:
+                return ready, self._connection_bucket.delay(now)
+
+            best = None
+            wait = None
+            for account, queue in self._queues.items():
+                bucket = self._account_bucket(account, now)
+                delay = 0 if bucket is None else bucket.delay(now)
+                if delay > 0:
+                    wait = delay if wait is None else min(wait, delay)
+                elif best is None or queue[0] < best:
+                    best = queue[0]
+
+            if best is None:
+                return ready, wait
+
+            heapq.heappop(self._queues[best.account])
+            if not self._queues[best.account]:
+                del self._queues[best.account]
+            self._size -= 1
+
+            # caller of submit() was cancelled, the command is dropped without spending tokens
+            if best.future is not None and best.future.cancelled():
+                continue
+
+            if self._connection_bucket is not None:
+                self._connection_bucket.take(now)
+            bucket = self._account_bucket(best.account, now)
+            if bucket is not None:
+                bucket.take(now)
+
+            best.delay = now - best.enqueued_at
+            self.stats[best.priority].add(best.delay)
+            ready.append(best)
+
+        return ready, None
+
+    async def submit(self, cmd, payload=None):
+        """Queue :cmd and wait until its payload is sent, :cmd is not sent if the caller is cancelled while it is queued
+
+        :returns: queueing delay in seconds
+        """
+
+        loop = self._loop or asyncio.get_event_loop()
+        future = loop.create_future()
+        self.enqueue(cmd, payload, future=future)
+
+        if self._future_run is None or self._future_run.done():
+            self._future_run = asyncio.ensure_future(self._run(), loop=self._loop)
+        elif self._wakeup is not None and not self._wakeup.done():
+            self._wakeup.set_result(None)
+
+        return await future
+
+    async def _run(self):
+        loop = self._loop or asyncio.get_event_loop()
+        while True:
+            items, wait = self.poll(self._clock())
+            for item in items:
+                # caller could be cancelled while previous items were sent
+                if item.future is not None and item.future.cancelled():
+                    continue
+                try:
+                    await self._send(item.payload)
+                except Exception as e:
+                    if item.future is not None and not item.future.done():
+                        item.future.set_exception(e)
+                    continue
+
+                if item.future is not None and not item.future.done():
+                    item.future.set_result(item.delay)
+
+            if items:
+                continue
+
+            # wait for new command or for tokens
+            self._wakeup = loop.create_future()
+            if wait is None:
+                await self._wakeup
+            else:
+                sleep = asyncio.ensure_future(self._sleep(wait), loop=self._loop)
+                await asyncio.wait([self._wakeup, sleep], return_when=asyncio.FIRST_COMPLETED)
+                sleep.cancel()
+            self._wakeup = None
+
+    def close(self):
+        """Stop sending, queued commands fail with xena.exceptions.ConnectionClosedException"""
+
+        if self._future_run is not None:
+            self._future_run.cancel()
+            self._future_run = None
+
+        for queue in self._queues.values():
+            for item in queue:
+                if item.future is not None and not item.future.done():
+                    item.future.set_exception(exceptions.ConnectionClosedException('Scheduler closed'))
+        self._queues = {}
+        self._size = 0
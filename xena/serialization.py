@@ -69,7 +69,10 @@ def _read_from(result, msg, use_fix=False):
         if use_fix:
             field_name = field_number
         if field.type == descriptor.FieldDescriptor.TYPE_MESSAGE:
-            if field.label == descriptor.FieldDescriptor.LABEL_REPEATED:
+            if field.message_type.GetOptions().map_entry:
+                if value:
+                    result[field_name] = dict(value)
+            elif field.label == descriptor.FieldDescriptor.LABEL_REPEATED:
                 if value:
                     result[field_name] = []
                     for in_value in value:
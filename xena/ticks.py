@@ -0,0 +1,139 @@
+from decimal import Decimal, ROUND_CEILING, ROUND_FLOOR, ROUND_HALF_UP
+
+import numpy as np
+
+
+class FixedPoint:
+    """Integer representation of decimal strings as a number of :step units.
+
+    Prices and quantities in messages are strings, FixedPoint parses them to ints (ticks or lots)
+    so hot code could do exact integer arithmetic, and formats ints back to exact strings for outgoing orders.
+
+    Usage::
+
+        prices = FixedPoint("0.5")
+        prices.parse("10000.5")  # 20001
+        prices.format(20001)  # "10000.5"
+    """
+
+    def __init__(self, step):
+        """
+        :param step: required, minimal increment like "0.5" or "0.001"
+        :type step: str, int or Decimal
+        """
+
+        step = Decimal(str(step))
+        if step <= 0:
+            raise ValueError("Step has to be positive, got \"{}\"".format(step))
+
+        self.step = step
+        self.scale = max(0, -step.normalize().as_tuple().exponent)
+        # step and one in 10^-scale units
+        self._unit = int(step.scaleb(self.scale))
+        self._one = 10 ** self.scale
+        self._float_step = float(step)
+
+    def __repr__(self):
+        return 'FixedPoint("{}")'.format(self.step)
+
+    def _slow_parse(self, value, rounding):
+        ticks = Decimal(value) / self.step
+        if rounding is None:
+            if ticks != ticks.to_integral_value():
+                raise ValueError("\"{}\" is not a multiple of {}".format(value, self.step))
+            return int(ticks)
+        return int(ticks.to_integral_value(rounding=rounding))
+
+    def parse(self, value, rounding=None):
+        """Parse decimal string to number of steps
+
+        :param value: required, empty string is zero
+        :type value: str
+        :param rounding: decimal.ROUND_FLOOR, ROUND_CEILING or ROUND_HALF_UP, if not set the value has to be a multiple of step
+        :type rounding: str
+        :returns: int
+        """
+
+        if value == "":
+            return 0
+
+        sign = 1
+        digits = value
+        if value[0] == '-':
+            sign = -1
+            digits = value[1:]
+
+        int_part, _, frac = digits.partition('.')
+        if len(frac) > self.scale or not int_part.isdigit() or (frac and not frac.isdigit()):
+            # more digits than step has, exponent notation or garbage
+            return self._slow_parse(value, rounding)
+
+        units = int(int_part) * self._one
+        if frac:
+            units += int(frac) * 10 ** (self.scale - len(frac))
+
+        ticks, remainder = divmod(units, self._unit)
+        if remainder != 0:
+            return self._slow_parse(value, rounding)
+
+        return sign * ticks
+
+    def format(self, ticks):
+        """Format number of steps to exact decimal string"""
+
+        units = int(ticks) * self._unit
+        sign = '-' if units < 0 else ''
+        whole, frac = divmod(abs(units), self._one)
+        if self.scale == 0:
+            return sign + str(whole)
+        return sign + str(whole) + '.' + str(frac).zfill(self.scale)
+
+    def round(self, value, rounding=ROUND_HALF_UP):
+        """Round decimal string to the nearest multiple of step"""
+
+        return self.format(self.parse(value, rounding))
+
+    def to_float(self, ticks):
+        return ticks * self._float_step
+
+    def parse_array(self, values, rounding=None):
+        """Vectorized parse(), values are parsed as float64 so result is exact while value has less than 15 significant digits
+
+        :param values: required
+        :type values: list of str or numpy array
+        :returns: numpy array of int64
+        """
+
+        values = np.asarray(values)
+        if values.dtype.kind in 'US':
+            values = np.where(values == '', '0', values)
+        steps = values.astype(np.float64) / self._float_step
+
+        if rounding is None:
+            ticks = np.rint(steps)
+            if np.any(np.abs(steps - ticks) > 1e-6):
+                raise ValueError("Some values are not a multiple of {}".format(self.step))
+        elif rounding == ROUND_FLOOR:
+            ticks = np.floor(steps + 1e-9)
+        elif rounding == ROUND_CEILING:
+            ticks = np.ceil(steps - 1e-9)
+        else:
+            ticks = np.floor(steps + 0.5)
+
+        return ticks.astype(np.int64)
+
+    def format_array(self, ticks):
+        """Vectorized format()
+
+        :returns: numpy array of str
+        """
+
+        units = np.asarray(ticks, dtype=np.int64) * self._unit
+        whole, frac = np.divmod(np.abs(units), self._one)
+        result = np.char.add(np.where(units < 0, '-', ''), whole.astype(str))
+        if self.scale == 0:
+            return result
+        return np.char.add(np.char.add(result, '.'), np.char.zfill(frac.astype(str), self.scale))
+
+    def to_float_array(self, ticks):
+        return np.asarray(ticks, dtype=np.float64) * self._float_step
@@ -0,0 +1,420 @@
+import collections
+import logging
+
+import numpy as np
+
+import xena.proto.constants as constants
+from xena.candles import timeframe_ns
+
+
+class TradeStats(collections.namedtuple('TradeStats', 'count volume notional buy_volume sell_volume high low')):
+    """Aggregates of trades inside a window"""
+
+    __slots__ = ()
+
+    @property
+    def vwap(self):
+        if self.volume == 0:
+            return 0.0
+        return self.notional / self.volume
+
+    @property
+    def imbalance(self):
+        """(buy_volume - sell_volume) / volume, in [-1, 1]"""
+
+        if self.volume == 0:
+            return 0.0
+        return (self.buy_volume - self.sell_volume) / self.volume
+
+
+EMPTY_STATS = TradeStats(0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0)
+
+
+class _MonotonicQueue:
+    """Ring buffer of increasing seq of trades with monotonic prices, front is the high (or low) since the front trade"""
+
+    def __init__(self, capacity):
+        self._seqs = np.zeros(capacity, dtype=np.int64)
+        self._head = 0
+        self._tail = 0
+
+    def __len__(self):
+        return self._tail - self._head
+
+    def front(self):
+        return int(self._seqs[self._head % len(self._seqs)])
+
+    def back(self):
+        return int(self._seqs[(self._tail - 1) % len(self._seqs)])
+
+    def append(self, seq):
+        self._seqs[self._tail % len(self._seqs)] = seq
+        self._tail += 1
+
+    def pop(self):
+        self._tail -= 1
+
+    def popleft(self):
+        self._head += 1
+
+    def first_since(self, seq):
+        """The first kept seq >= :seq, it has the high (or low) price of trades since :seq"""
+
+        capacity = len(self._seqs)
+        start = self._head % capacity
+        size = self._tail - self._head
+        if start + size <= capacity:
+            index = np.searchsorted(self._seqs[start:start + size], seq)
+        else:
+            wrapped = self._seqs[start:]
+            if wrapped[-1] >= seq:
+                index = np.searchsorted(wrapped, seq)
+            else:
+                index = len(wrapped) + np.searchsorted(self._seqs[:size - len(wrapped)], seq)
+        return int(self._seqs[(self._head + int(index)) % capacity])
+
+
+class _RollingWindow:
+
+    def __init__(self, duration, capacity):
+        self.duration = duration
+        self.head = 0
+        self.count = 0
+        self.volume = 0.0
+        self.notional = 0.0
+        self.buy_volume = 0.0
+        self.sell_volume = 0.0
+        # front is current high/low
+        self.highs = _MonotonicQueue(capacity)
+        self.lows = _MonotonicQueue(capacity)
+
+
+class TradeTape:
+    """Fixed capacity array backed tape of trades for one symbol.
+
+    Registered windows are updated on each trade by adding the new trade and expiring the old ones,
+    so their stats are available in O(1). Stats for any other trailing window are calculated from
+    running totals and monotonic queues of high and low prices without rescanning the tape.
+    """
+
+    def __init__(self, symbol, capacity=100000, windows=()):
+        """
+        :param capacity: max number of trades to keep
+        :type capacity: int
+        :param windows: rolling windows to maintain, durations in nanoseconds or strings like '10s', '1m'
+        :type windows: list
+        """
+
+        if capacity < 1:
+            raise ValueError("Tape capacity has to be positive")
+
+        self.symbol = symbol
+        self.capacity = capacity
+
+        self._ts = np.zeros(capacity, dtype=np.int64)
+        self._px = np.zeros(capacity, dtype=np.float64)
+        self._qty = np.zeros(capacity, dtype=np.float64)
+        self._side = np.zeros(capacity, dtype=np.int8)
+        # running totals including trade in the slot, re-based to the oldest trade every capacity trades,
+        # so their magnitude and rounding errors do not grow with the age of the tape
+        self._cum_qty = np.zeros(capacity, dtype=np.float64)
+        self._cum_notional = np.zeros(capacity, dtype=np.float64)
+        self._cum_buy_qty = np.zeros(capacity, dtype=np.float64)
+        self._cum_sell_qty = np.zeros(capacity, dtype=np.float64)
+        # total number of trades ever added, trade with seq N is stored in slot N % capacity
+        self._seq = 0
+        self._last_trade_ids = set()
+        # all trades in tape, high/low of a window up to the last trade is the first entry inside the window
+        self._highs = _MonotonicQueue(capacity)
+        self._lows = _MonotonicQueue(capacity)
+
+        self._windows = {}
+        for window in windows:
+            self.add_window(window)
+
+    def __len__(self):
+        return min(self._seq, self.capacity)
+
+    @property
+    def last_ts(self):
+        if self._seq == 0:
+            return None
+        return int(self._ts[(self._seq - 1) % self.capacity])
+
+    def add_window(self, duration):
+        """Register rolling window, stats for it could be read by window()"""
+
+        key = duration
+        if isinstance(duration, str):
+            duration = timeframe_ns(duration)
+
+        window = _RollingWindow(duration, self.capacity)
+        self._windows[key] = window
+        if self._seq > 0:
+            # fill the window with trades already in the tape
+            window.head = self._search(self.last_ts - duration + 1)
+            for seq in range(window.head, self._seq):
+                self._push(window, seq)
+
+    def _search(self, ts):
+        """seq of the first trade in tape with trade.ts >= :ts"""
+
+        lo, hi = self._seq - len(self), self._seq
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._ts[mid % self.capacity] < ts:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _push(self, window, seq):
+        pos = seq % self.capacity
+        qty = self._qty[pos]
+        px = self._px[pos]
+        window.count += 1
+        window.volume += qty
+        window.notional += qty * px
+        if self._side[pos] > 0:
+            window.buy_volume += qty
+        elif self._side[pos] < 0:
+            window.sell_volume += qty
+
+        self._push_extremes(window.highs, window.lows, seq, px)
+
+    def _push_extremes(self, highs, lows, seq, px):
+        while highs and self._px[highs.back() % self.capacity] <= px:
+            highs.pop()
+        highs.append(seq)
+        while lows and self._px[lows.back() % self.capacity] >= px:
+            lows.pop()
+        lows.append(seq)
+
+    def _pop(self, window):
+        pos = window.head % self.capacity
+        qty = self._qty[pos]
+        window.count -= 1
+        window.volume -= qty
+        window.notional -= qty * self._px[pos]
+        if self._side[pos] > 0:
+            window.buy_volume -= qty
+        elif self._side[pos] < 0:
+            window.sell_volume -= qty
+        window.head += 1
+
+        while window.highs and window.highs.front() < window.head:
+            window.highs.popleft()
+        while window.lows and window.lows.front() < window.head:
+            window.lows.popleft()
+
+        if window.count == 0:
+            window.volume = window.notional = window.buy_volume = window.sell_volume = 0.0
+
+    def _expire(self, window, now):
+        while window.head < self._seq and self._ts[window.head % self.capacity] <= now - window.duration:
+            self._pop(window)
+
+    def add(self, ts, price, qty, side):
+        """Add trade to the tape
+
+        :param ts: unixtimestamp in nanoseconds
+        :type ts: int
+        :param side: aggressor side, constants.Side_Buy or constants.Side_Sell, trades with other side are
+            neither buys nor sells
+        :type side: str
+        """
+
+        pos = self._seq % self.capacity
+        prev = (self._seq - 1) % self.capacity
+        sign = 0
+        if side == constants.Side_Buy:
+            sign = 1
+        elif side == constants.Side_Sell:
+            sign = -1
+        notional = price * qty
+
+        # trade in the slot is going to be overwritten, so it has to leave the windows first
+        for window in self._windows.values():
+            if window.head <= self._seq - self.capacity:
+                self._pop(window)
+        while self._highs and self._highs.front() <= self._seq - self.capacity:
+            self._highs.popleft()
+        while self._lows and self._lows.front() <= self._seq - self.capacity:
+            self._lows.popleft()
+
+        if self._seq > 0:
+            self._cum_qty[pos] = self._cum_qty[prev] + qty
+            self._cum_notional[pos] = self._cum_notional[prev] + notional
+            self._cum_buy_qty[pos] = self._cum_buy_qty[prev] + (qty if sign > 0 else 0.0)
+            self._cum_sell_qty[pos] = self._cum_sell_qty[prev] + (qty if sign < 0 else 0.0)
+        else:
+            self._cum_qty[pos] = qty
+            self._cum_notional[pos] = notional
+            self._cum_buy_qty[pos] = qty if sign > 0 else 0.0
+            self._cum_sell_qty[pos] = qty if sign < 0 else 0.0
+
+        self._ts[pos] = ts
+        self._px[pos] = price
+        self._qty[pos] = qty
+        self._side[pos] = sign
+        self._seq += 1
+        if self._seq % self.capacity == 0:
+            self._rebase()
+
+        self._push_extremes(self._highs, self._lows, self._seq - 1, price)
+        for window in self._windows.values():
+            self._push(window, self._seq - 1)
+            self._expire(window, ts)
+
+    def _rebase(self):
+        """Make running totals start from the oldest trade in tape, differences between them stay the same"""
+
+        oldest = (self._seq - len(self)) % self.capacity
+        qty = self._qty[oldest]
+        for cum, own in ((self._cum_qty, qty), (self._cum_notional, qty * self._px[oldest]),
+                         (self._cum_buy_qty, qty if self._side[oldest] > 0 else 0.0),
+                         (self._cum_sell_qty, qty if self._side[oldest] < 0 else 0.0)):
+            cum -= cum[oldest] - own
+
+    def add_entry(self, entry):
+        """Add trade from xena.proto.market_pb2.MDEntry, trades already in the tape are skipped
+
+        :returns: True if trade was added
+        """
+
+        last_ts = self.last_ts
+        if last_ts is not None:
+            if entry.TransactTime < last_ts:
+                return False
+            if entry.TransactTime == last_ts and entry.TradeId in self._last_trade_ids:
+                return False
+            if entry.TransactTime > last_ts:
+                self._last_trade_ids.clear()
+
+        self._last_trade_ids.add(entry.TradeId)
+        self.add(entry.TransactTime, float(entry.MDEntryPx), float(entry.MDEntrySize), entry.AggressorSide)
+        return True
+
+    def window(self, duration):
+        """Stats for registered rolling window as of the last trade
+
+        :returns: xena.trades.TradeStats
+        """
+
+        window = self._windows[duration]
+        if window.count == 0:
+            return EMPTY_STATS
+
+        return TradeStats(
+            window.count, window.volume, window.notional, window.buy_volume, window.sell_volume,
+            float(self._px[window.highs.front() % self.capacity]), float(self._px[window.lows.front() % self.capacity]),
+        )
+
+    def expire(self, now):
+        """Expire trades older than window duration from registered windows without adding new trade
+
+        :param now: unixtimestamp in nanoseconds
+        :type now: int
+        """
+
+        for window in self._windows.values():
+            self._expire(window, now)
+
+    def stats(self, duration, now=None):
+        """Stats for arbitrary trailing window (now - duration, now], now is ts of the last trade if not set
+
+        :returns: xena.trades.TradeStats
+        """
+
+        if isinstance(duration, str):
+            duration = timeframe_ns(duration)
+        if self._seq == 0:
+            return EMPTY_STATS
+        if now is None:
+            now = self.last_ts
+
+        first = self._search(now - duration + 1)
+        last = self._search(now + 1)
+        if first >= last:
+            return EMPTY_STATS
+
+        # running totals before the first trade in window
+        end = (last - 1) % self.capacity
+        pos = first % self.capacity
+        qty = self._cum_qty[end] - (self._cum_qty[pos] - self._qty[pos])
+        notional = self._cum_notional[end] - (self._cum_notional[pos] - self._qty[pos] * self._px[pos])
+        buy_qty = self._cum_buy_qty[end] - (self._cum_buy_qty[pos] - (self._qty[pos] if self._side[pos] > 0 else 0.0))
+        sell_qty = self._cum_sell_qty[end] - (self._cum_sell_qty[pos] - (self._qty[pos] if self._side[pos] < 0 else 0.0))
+
+        high, low = self._extremes(first, last)
+        return TradeStats(last - first, float(qty), float(notional), float(buy_qty), float(sell_qty), high, low)
+
+    def _extremes(self, first, last):
+        """(high, low) of trades with seq in [first, last)"""
+
+        if last == self._seq:
+            high = self._highs.first_since(first)
+            low = self._lows.first_since(first)
+            return float(self._px[high % self.capacity]), float(self._px[low % self.capacity])
+
+        # window ending before the last trade is rare, so it is scanned
+        prices = self._prices(first, last)
+        return float(prices.max()), float(prices.min())
+
+    def _prices(self, first, last):
+        start, end = first % self.capacity, (last - 1) % self.capacity + 1
+        if start < end:
+            return self._px[start:end]
+        return np.concatenate((self._px[start:], self._px[:end]))
+
+
+class TradeTapes:
+    """Trade tapes for many symbols fed by XenaMDWebsocketClient.trades stream"""
+
+    def __init__(self, capacity=100000, windows=()):
+        """
+        :param capacity: max number of trades to keep per symbol
+        :type capacity: int
+        :param windows: rolling windows to maintain for each symbol, see TradeTape
+        :type windows: list
+        """
+
+        self._log = logging.getLogger(__name__)
+        self._capacity = capacity
+        self._windows = windows
+        self._tapes = {}
+
+    def tape(self, symbol):
+        if symbol not in self._tapes:
+            self._tapes[symbol] = TradeTape(symbol, self._capacity, self._windows)
+        return self._tapes[symbol]
+
+    async def handle(self, ws, msg):
+        """Add trades from stream message to tapes, could be used as callback for XenaMDWebsocketClient.trades"""
+
+        if msg.MsgType == constants.MsgType_MarketDataRequestReject:
+            return
+
+        default_symbol = msg.MDStreamId.split(':', 1)[1]
+        for entry in msg.MDEntry:
+            if entry.MDEntryType != constants.MDEntryType_Trade:
+                continue
+            self.tape(entry.Symbol or default_symbol).add_entry(entry)
+
+    async def subscribe(self, ws, symbol, callback=None, **kwargs):
+        """Subscribe tapes to trades stream for :symbol
+
+        :param ws: connected md websocket client
+        :type ws: xena.websocket.XenaMDWebsocketClient
+        :param callback: optional callback coroutine called after tape update
+        :type callback: async coroutine
+
+        :returns: stream id to use in usubscribe
+        """
+
+        async def handle(ws, msg):
+            await self.handle(ws, msg)
+            if callback is not None:
+                await callback(ws, msg)
+
+        return await ws.trades(symbol, handle, **kwargs)
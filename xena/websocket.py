@@ -1,4 +1,5 @@
 import asyncio
+import itertools
 import logging
 import time
 from hashlib import sha256
@@ -15,6 +16,14 @@ import xena.proto.constants as constants
 import xena.serialization as serialization
 import xena.helpers as helpers
 import xena.exceptions as exceptions
+from xena.accounts import AccountState
+from xena.batch import OrderBatch
+from xena.coalesce import ReplaceCoalescer
+from xena.dispatch import Dispatcher
+from xena.market_watch import MarketWatchState
+from xena.orders import OrderStore
+from xena.positions import PositionStore
+from xena.scheduler import SendScheduler
 
 
 class WebsocketClient:
@@ -138,6 +147,7 @@ class XenaMDWebsocketClient(WebsocketClient):
 
         self._log = logging.getLogger(__name__)
         self._streams = {}
+        self.market_watch_state = None
         self._md_response_types = [constants.MsgType_MarketDataSnapshotFullRefresh, constants.MsgType_MarketDataIncrementalRefresh, constants.MsgType_MarketDataRequestReject]
 
         async def on_connection_close(client, exception):
@@ -297,24 +307,42 @@ class XenaMDWebsocketClient(WebsocketClient):
         await self.subscribe(stream_id, callback, throttle_interval, throttle_unit)
         return stream_id
 
-    async def market_watch(self, callback):
+    async def market_watch(self, callback, deltas=False, symbols=None):
         """Subsrcibe to market watch stream.
         The callback will allways receive xena.proto.market_pb2.MarketDataRefresh message with MsgType_MarketDataSnapshotFullRefresh.
 
-        :param symbol: required
-        :type symbol: str
+        With :deltas the client keeps the previous market watch state in self.market_watch_state and the callback
+        receives only changes as xena.proto.market_pb2.MarketDataRefresh with MsgType_MarketDataIncrementalRefresh,
+        see xena.market_watch.MarketWatchState.update(). Messages without changes are not passed to the callback.
+
         :param callback: callback coroutine to handle messages
         :type callback: async coroutine
-        :param throttle_interval: throttling interval in throttle_unit: units
-        :type throttle_interval: int
-        :param throttle_unit: throttling units of throttle_interval:
-        :type throttle_unit: string, sett constants.ThrottleTimeUnit_*
+        :param deltas: pass only per symbol changes to callback
+        :type deltas: bool
+        :param symbols: with :deltas, pass only changes for these symbols
+        :type symbols: iterable of str
 
         :returns: stream id to use in usubscribe
         """
 
         stream_id = "market-watch"
-        await self.subscribe(stream_id, callback)
+        if not deltas:
+            await self.subscribe(stream_id, callback)
+            return stream_id
+
+        state = MarketWatchState(symbols)
+
+        async def handle(ws, msg):
+            if msg.MsgType != constants.MsgType_MarketDataSnapshotFullRefresh:
+                await callback(ws, msg)
+                return
+
+            delta = state.update(msg)
+            if delta is not None:
+                await callback(ws, delta)
+
+        await self.subscribe(stream_id, handle)
+        self.market_watch_state = state
         return stream_id
 
 
@@ -324,14 +352,67 @@ class XenaTradingWebsocketClient(WebsocketClient):
     """
 
     URL = 'wss://api.xena.exchange/ws/trading'
+    # default time in seconds to wait for response when request is sent with wait=True
+    REQUEST_TIMEOUT = 30
+    # response MsgType -> field with request id the response is for
+    RESPONSE_REQUEST_ID_FIELDS = {
+        constants.MsgType_AccountStatusReport: 'AccountStatusRequestId',
+        constants.MsgType_MassPositionReport: 'PosReqId',
+        constants.MsgType_ExecutionReportMsgType: 'OrdStatusReqID',
+        constants.MsgType_OrderMassStatusResponse: 'MassStatusReqId',
+        constants.MsgType_MassTradeCaptureReportResponse: 'TradeRequestID',
+        constants.MsgType_PositionMaintenanceReport: 'PosReqId',
+    }
+
+    def __init__(self, api_key, api_secret, loop, track_orders=False, track_positions=False, instruments=None, track_accounts=False):
+        """
+        :param track_orders: keep xena.orders.OrderStore in self.order_store updated from sent commands and execution reports
+        :type track_orders: bool
+        :param track_positions: keep xena.positions.PositionStore in self.position_store updated from position reports,
+            positions of logged in accounts are requested on every connect
+        :type track_positions: bool
+        :param instruments: instruments for stores to keep volumes in lots
+        :type instruments: xena.instruments.InstrumentCache
+        :param track_accounts: keep xena.accounts.AccountState in self.account_state updated from account status and margin reports,
+            account status of logged in accounts is requested on every connect
+        :type track_accounts: bool
+        """
 
-    def __init__(self, api_key, api_secret, loop):
         super().__init__(loop, self._handle, self.URL)
 
         self._api_key = api_key
         self._api_secret = api_secret
         self._log = logging.getLogger(__name__)
         self._listeners = {}
+        self._dispatcher = Dispatcher()
+        self.order_store = OrderStore() if track_orders else None
+        self.position_store = PositionStore(instruments) if track_positions else None
+        self.account_state = AccountState() if track_accounts else None
+        # xena.normalize.OrderNormalizer to fit orders to instrument steps before they are sent
+        self.normalizer = None
+        # xena.risk.RiskGate to check orders before they are sent
+        self.risk_gate = None
+        # xena.scheduler.SendScheduler, see rate_limit()
+        self.scheduler = None
+        # xena.coalesce.ReplaceCoalescer, created by the first replace(coalesce=True)
+        self.replace_coalescer = None
+        # ClOrdId or ListId -> xena.batch.OrderBatch waiting for results
+        self._batches = {}
+        # (response MsgType, request id) -> future of the request sent with wait=True
+        self._pending_requests = {}
+        self._request_id_prefix = str(int(time.time() * 1000))
+        self._request_counter = 0
+
+        async def on_connection_close(client, exception):
+            self._fail_pending_requests(exception)
+            # acknowledgements of replaces in flight are lost with the connection, so reconnect rolls them all back
+            if self.replace_coalescer is not None:
+                self.replace_coalescer.clear()
+            if self.position_store is not None:
+                self.position_store.invalidate()
+            if self.account_state is not None:
+                self.account_state.invalidate()
+        self._on_connection_close.append(on_connection_close)
 
     def _login_msg(self, accounts=None):
         def inner():
@@ -352,17 +433,37 @@ class XenaTradingWebsocketClient(WebsocketClient):
         return inner
 
     async def _handle(self, msg):
+        released = []
         try:
             msg = serialization.from_json(msg)
+            if self.order_store is not None:
+                self.order_store.apply(msg)
+            if self.position_store is not None:
+                self.position_store.apply(msg)
+            if self.account_state is not None:
+                self.account_state.apply(msg)
+            if self._pending_requests:
+                self._resolve_request(msg)
+            if self._batches and msg.MsgType in (constants.MsgType_ExecutionReportMsgType, constants.MsgType_OrderCancelRejectMsgType, constants.MsgType_ListStatus):
+                self._apply_batches(msg)
+            if self.replace_coalescer is not None:
+                released = self.replace_coalescer.apply(msg)
+
             if msg.MsgType in self._listeners:
                 await self._listeners[msg.MsgType](self, msg)
 
             # send to general listeners
             if "all" in self._listeners:
                 await self._listeners["all"](self, msg)
+
+            await self._dispatcher.dispatch(self, msg)
         except Exception as e:
             self._log.exception('trade handler')
 
+        # sent in background, so waiting for rate limit does not block reading
+        for cmd in released:
+            asyncio.ensure_future(self._send_released(cmd), loop=self._loop)
+
     def listen(self, callback):
         """ Add listener to all message types
 
@@ -393,14 +494,36 @@ class XenaTradingWebsocketClient(WebsocketClient):
 
             self._listeners[msg_types] = callback
 
+    def listen_filtered(self, callback, msg_types=None, account=None, symbol=None, client_order_id_prefix=None):
+        """ Add listener for messages matching all given filters, any number of listeners could be added for the same filters.
+        Messages are routed only to interested listeners with a few dict lookups, see xena.dispatch.Dispatcher
+
+        :param callback: callback coroutine
+        :type callback: async coroutine
+        :param msg_types: MsgType of message to listen or list of MsgType, all types if not set
+        :type msg_types: str, contants.MsgType_*
+        :param account: listen only messages with Account
+        :type account: int
+        :param symbol: listen only messages with Symbol
+        :type symbol: str
+        :param client_order_id_prefix: listen only messages with ClOrdId starting with "<prefix>-"
+        :type client_order_id_prefix: str
+
+        :returns: handle to use in remove_listener()
+        """
+
+        return self._dispatcher.add(callback, msg_types, account, symbol, client_order_id_prefix)
+
     def remove_listener(self, msg_type):
-        """Remove listener for :msg_type previously added  by listen_type()
+        """Remove listener for :msg_type previously added  by listen_type() or listener added by listen_filtered()
 
-        :param msg_type: MsgType of message to listen or list of MsgType
-        :type msg_type: str, contants.MsgType_*
+        :param msg_type: MsgType of message to listen or list of MsgType, or handle returned by listen_filtered()
+        :type msg_type: str, contants.MsgType_* or int
         """
 
-        if msg_type in self._listeners:
+        if isinstance(msg_type, int):
+            self._dispatcher.remove(msg_type)
+        elif msg_type in self._listeners:
             del self._listeners[msg_type]
 
     async def connect(self, accounts=None):
@@ -412,49 +535,290 @@ class XenaTradingWebsocketClient(WebsocketClient):
         self._login_msg_fnc = self._login_msg(accounts)
         return await self._connect()
 
+    async def _connect(self):
+        logon = await super()._connect()
+        if logon is None:
+            return logon
+
+        # positions and balances could change while disconnected
+        if self.position_store is not None:
+            self.position_store.invalidate(logon.Account)
+            for account in logon.Account:
+                await self.positions(account)
+        if self.account_state is not None:
+            self.account_state.invalidate(logon.Account)
+            for account in logon.Account:
+                await self.account_status_report(account)
+        return logon
+
     async def send_cmd(self, cmd):
-        """ Serialize command and send bytes into websocet"""
+        """ Serialize command and send bytes into websocet.
+        If self.normalizer is set, orders are normalized first and misfit orders raise xena.exceptions.NormalizationException.
+        If self.risk_gate is set, orders breaching limits raise xena.exceptions.RiskRejectException and are not sent
+        """
+
+        await self._send_cmd(cmd)
+
+    async def _send_cmd(self, cmd):
+        """send_cmd returning False if the socket is closed and nothing is sent"""
 
+        data = self._prepare(cmd)
+        # tracked before sending, so an execution report received while sending finds the order
+        if self.order_store is not None:
+            self.order_store.track(cmd)
+        try:
+            sent = await self._send_prepared(cmd, data)
+        except BaseException:
+            if self.order_store is not None:
+                self.order_store.untrack(cmd)
+            raise
+
+        if not sent and self.order_store is not None:
+            self.order_store.untrack(cmd)
+        return sent
+
+    def _prepare(self, cmd, pending=None):
         if not hasattr(cmd, "DESCRIPTOR"):
             raise ValueError("Command has to be protobuf object")
 
-        await self.send(serialization.to_fix_json(cmd))
+        if self.normalizer is not None:
+            self.normalizer.normalize(cmd)
+        if self.risk_gate is not None:
+            self.risk_gate.check(cmd, pending)
+
+        return serialization.to_fix_json(cmd)
+
+    async def _send_prepared(self, cmd, data):
+        """Send serialized :cmd, returns False if the client is closed, send() skips messages then"""
 
-    async def account_status_report(self, account, request_id=""):
+        if self._closed:
+            return False
+        if self.scheduler is not None:
+            # closed scheduler fails queued commands with xena.exceptions.ConnectionClosedException
+            await self.scheduler.submit(cmd, data)
+        else:
+            await self.send(data)
+        return True
+
+    async def send_batch(self, cmds, as_list=False, list_id="", wait=False, timeout=None):
+        """Send many orders, cancels and replaces at once.
+        All commands are normalized, checked and serialized before the first one is sent, so a misfit or
+        risk breach of any command raises before anything is sent. Results are correlated per ClOrdId
+        from ExecutionReport, OrderCancelReject and ListStatus messages, see xena.batch.OrderBatch
+
+        :param cmds: required
+        :type cmds: list of protobuf commands
+        :param as_list: send NewOrderSingle :cmds as one NewOrderList message
+        :type as_list: bool
+        :param list_id: ListId of NewOrderList, generated if empty
+        :type list_id: str
+        :param wait: wait for results of all commands
+        :type wait: bool
+        :param timeout: seconds to wait for results, no limit if not set
+        :type timeout: float
+
+        :returns: xena.batch.OrderBatch
+        """
+
+        cmds = list(cmds)
+        if not cmds:
+            raise ValueError("Batch is empty")
+
+        if as_list:
+            cmds = [helpers.order_list(cmds[0].Account, list_id or self._next_request_id(), cmds, cmds[0].Symbol)]
+
+        # risk limits count earlier commands of the batch, they are not tracked yet
+        pending = {}
+        payloads = [self._prepare(cmd, pending) for cmd in cmds]
+        batch = OrderBatch(cmds, self._loop)
+        for key in itertools.chain(batch.results, batch.list_ids):
+            self._batches[key] = batch
+
+        for cmd in cmds:
+            if self.order_store is not None:
+                self.order_store.track(cmd)
+        for i, (cmd, data) in enumerate(zip(cmds, payloads)):
+            try:
+                sent = await self._send_prepared(cmd, data)
+            except BaseException as e:
+                self._abort_batch(batch, cmds[i:])
+                if isinstance(e, Exception):
+                    batch.fail(e)
+                raise
+            if not sent:
+                self._abort_batch(batch, cmds[i:])
+                batch.fail(exceptions.ConnectionClosedException('Connection is closed'))
+                return batch
+
+        if wait:
+            await batch.wait(timeout)
+        return batch
+
+    def _abort_batch(self, batch, unsent):
+        if self.order_store is not None:
+            for cmd in unsent:
+                self.order_store.untrack(cmd)
+        for key in itertools.chain(batch.results, batch.list_ids):
+            if self._batches.get(key) is batch:
+                del self._batches[key]
+
+    def _apply_batches(self, msg):
+        if msg.MsgType == constants.MsgType_ListStatus:
+            batch = self._batches.get(msg.ListId)
+        else:
+            batch = self._batches.get(msg.ClOrdId)
+        if batch is None:
+            return
+
+        batch.apply(msg)
+        if batch.done:
+            for key in itertools.chain(batch.results, batch.list_ids):
+                if self._batches.get(key) is batch:
+                    del self._batches[key]
+
+    def rate_limit(self, connection_rate=None, connection_burst=1, account_rate=None, account_burst=1):
+        """Send commands through priority queue limited by token buckets, see xena.scheduler.SendScheduler.
+        Cancels and mass cancels are sent before queued replaces and new orders, send_cmd waits until the command is sent.
+        Queueing delay statistics per priority are in self.scheduler.stats
+
+        :param connection_rate: commands per second for the connection, no limit if not set
+        :type connection_rate: float
+        :param connection_burst: max commands sent at once for the connection
+        :type connection_burst: int
+        :param account_rate: commands per second for each account, no limit if not set
+        :type account_rate: float
+        :param account_burst: max commands sent at once for each account
+        :type account_burst: int
+        """
+
+        if self.scheduler is not None:
+            self.scheduler.close()
+        self.scheduler = SendScheduler(self.send, connection_rate, connection_burst, account_rate, account_burst, loop=self._loop)
+
+    async def close(self):
+        await super().close()
+        if self.scheduler is not None:
+            self.scheduler.close()
+        self._fail_pending_requests(None)
+
+    def _resolve_request(self, msg):
+        field = self.RESPONSE_REQUEST_ID_FIELDS.get(msg.MsgType)
+        if field is None:
+            return
+
+        future = self._pending_requests.pop((msg.MsgType, getattr(msg, field)), None)
+        if future is not None and not future.done():
+            future.set_result(msg)
+
+    def _fail_pending_requests(self, exception):
+        batches, self._batches = set(self._batches.values()), {}
+        for batch in batches:
+            batch.fail(exceptions.ConnectionClosedException('Connection closed: {}'.format(exception)))
+
+        pending, self._pending_requests = self._pending_requests, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(exceptions.ConnectionClosedException('Connection closed: {}'.format(exception)))
+
+    def _next_request_id(self):
+        self._request_counter += 1
+        return '{}-{}'.format(self._request_id_prefix, self._request_counter)
+
+    async def request(self, cmd, request_id_field, response_type, timeout=None):
+        """Send :cmd and wait for the response of :response_type with the same request id.
+        Any number of requests could wait for responses concurrently.
+        If request id of :cmd is empty, it's generated.
+
+        :param cmd: required
+        :type cmd: protobuf object
+        :param request_id_field: name of request id field of :cmd, like "PosReqId"
+        :type request_id_field: str
+        :param response_type: MsgType of the response, see RESPONSE_REQUEST_ID_FIELDS
+        :type response_type: str, constants.MsgType_*
+        :param timeout: seconds to wait for the response, REQUEST_TIMEOUT by default
+        :type timeout: float
+
+        :returns: response message, on timeout raises asyncio.TimeoutError, on disconnect xena.exceptions.ConnectionClosedException
+        """
+
+        if response_type not in self.RESPONSE_REQUEST_ID_FIELDS:
+            raise ValueError("Can not match responses of \"{}\" message type".format(response_type))
+
+        if getattr(cmd, request_id_field) == "":
+            setattr(cmd, request_id_field, self._next_request_id())
+
+        key = (response_type, getattr(cmd, request_id_field))
+        if key in self._pending_requests:
+            raise KeyError("Request \"{}\" is already waiting for response".format(key[1]))
+
+        if self._closed:
+            raise exceptions.ConnectionClosedException('Connection closed')
+
+        future = (self._loop or asyncio.get_event_loop()).create_future()
+        self._pending_requests[key] = future
+        try:
+            await self.send_cmd(cmd)
+            return await asyncio.wait_for(future, self.REQUEST_TIMEOUT if timeout is None else timeout)
+        finally:
+            if self._pending_requests.get(key) is future:
+                del self._pending_requests[key]
+
+    async def _send_request(self, cmd, request_id_field, response_type, wait, timeout):
+        if not wait:
+            await self.send_cmd(cmd)
+            return None
+        return await self.request(cmd, request_id_field, response_type, timeout)
+
+    async def account_status_report(self, account, request_id="", wait=False, timeout=None):
         """Request balances and margin requirements for :account
         To receive respose, client has to listen constants.MsgType_AccountStatusReport and 
         constants.MsgType_MarginRequirementReport for getting margin requirements report
+        or pass :wait to get the response as result.
 
         :param account: required
         :type account: int
+        :param wait: wait for the response and return it, see request()
+        :type wait: bool
+        :param timeout: seconds to wait for the response, REQUEST_TIMEOUT by default
+        :type timeout: float
         """
 
         cmd = balance_pb2.AccountStatusReportRequest()
         cmd.MsgType = constants.MsgType_AccountStatusReportRequest
         cmd.AccountStatusRequestId = request_id
         cmd.Account = account
-        await self.send_cmd(cmd)
+        return await self._send_request(cmd, 'AccountStatusRequestId', constants.MsgType_AccountStatusReport, wait, timeout)
 
-    async def positions(self, account, request_id=""):
+    async def positions(self, account, request_id="", wait=False, timeout=None):
         """Request all position for :account
         To receive respose, client has to listen constants.MsgType_MassPositionReport
+        or pass :wait to get the response as result.
 
         :param account: required
         :type account: int
+        :param wait: wait for the response and return it, see request()
+        :type wait: bool
+        :param timeout: seconds to wait for the response, REQUEST_TIMEOUT by default
+        :type timeout: float
         """
 
         cmd = positions_pb2.PositionsRequest()
         cmd.MsgType = constants.MsgType_RequestForPositions
         cmd.PosReqId = request_id
         cmd.Account = account
-        await self.send_cmd(cmd)
+        return await self._send_request(cmd, 'PosReqId', constants.MsgType_MassPositionReport, wait, timeout)
     
-    async def order(self, account, request_id="", client_order_id="", order_id=""):
+    async def order(self, account, request_id="", client_order_id="", order_id="", wait=False, timeout=None):
         """Request order for :account by ClOrdId or OrderId
         To receive respose, client has to listen constants.MsgType_ExecutionReportMsgType
+        or pass :wait to get the response as result.
 
         :param account: required
         :type account: int
+        :param wait: wait for the response and return it, see request()
+        :type wait: bool
+        :param timeout: seconds to wait for the response, REQUEST_TIMEOUT by default
+        :type timeout: float
         """
 
         if client_order_id == "" and order_id == "":
@@ -466,20 +830,25 @@ class XenaTradingWebsocketClient(WebsocketClient):
         cmd.Account = account
         cmd.ClOrdId = client_order_id
         cmd.OrderId = order_id
-        await self.send_cmd(cmd)
+        return await self._send_request(cmd, 'OrdStatusReqId', constants.MsgType_ExecutionReportMsgType, wait, timeout)
     
-    async def orders(self, account, request_id=""):
+    async def orders(self, account, request_id="", wait=False, timeout=None):
         """ Depricated """
-        await self.active_orders(account, request_id)
+        return await self.active_orders(account, request_id, wait=wait, timeout=timeout)
 
-    async def active_orders(self, account, request_id="", symbol=""):
+    async def active_orders(self, account, request_id="", symbol="", wait=False, timeout=None):
         """Request all active orders for :account
         To receive respose, client has to listen constants.MsgType_OrderMassStatusResponse
+        or pass :wait to get the response as result.
 
         :param account: required
         :type account: int
         :param symbol: filter trades by symbol
         :type sybmol: string
+        :param wait: wait for the response and return it, see request()
+        :type wait: bool
+        :param timeout: seconds to wait for the response, REQUEST_TIMEOUT by default
+        :type timeout: float
         """
 
         cmd = order_pb2.OrderMassStatusRequest()
@@ -488,11 +857,12 @@ class XenaTradingWebsocketClient(WebsocketClient):
         cmd.MassStatusReqId = request_id
         cmd.Account = account
         cmd.Symbol = symbol
-        await self.send_cmd(cmd)
+        return await self._send_request(cmd, 'MassStatusReqId', constants.MsgType_OrderMassStatusResponse, wait, timeout)
     
-    async def last_order_statuses(self, account, request_id="", symbol="", ts_from=0, ts_to=0):
+    async def last_order_statuses(self, account, request_id="", symbol="", ts_from=0, ts_to=0, wait=False, timeout=None):
         """Request last statuses from order history for :account
         To receive respose, client has to listen constants.MsgType_OrderMassStatusResponse
+        or pass :wait to get the response as result.
 
         :param account: required
         :type account: int
@@ -502,6 +872,10 @@ class XenaTradingWebsocketClient(WebsocketClient):
         :type ts_from: int unixtimestamp in nanoseconds
         :param ts_to: show execution reports which TransactTime less than ts_to, if present - ts_from is required
         :type ts_to: int unixtimestamp in nanoseconds
+        :param wait: wait for the response and return it, see request()
+        :type wait: bool
+        :param timeout: seconds to wait for the response, REQUEST_TIMEOUT by default
+        :type timeout: float
         """
 
         cmd = order_pb2.OrderMassStatusRequest()
@@ -519,11 +893,12 @@ class XenaTradingWebsocketClient(WebsocketClient):
                 raise ValueError("ts_from is required")
             cmd.TransactTime.append(ts_to)
 
-        await self.send_cmd(cmd)
+        return await self._send_request(cmd, 'MassStatusReqId', constants.MsgType_OrderMassStatusResponse, wait, timeout)
     
-    async def order_history(self, account, request_id="", symbol="", ts_from=0, ts_to=0):
+    async def order_history(self, account, request_id="", symbol="", ts_from=0, ts_to=0, wait=False, timeout=None):
         """Request order history for :account
         To receive respose, client has to listen constants.MsgType_OrderMassStatusResponse
+        or pass :wait to get the response as result.
 
         :param account: required
         :type account: int
@@ -533,6 +908,10 @@ class XenaTradingWebsocketClient(WebsocketClient):
         :type ts_from: int unixtimestamp in nanoseconds
         :param ts_to: show execution reports which TransactTime less than ts_to, if present - ts_from is required
         :type ts_to: int unixtimestamp in nanoseconds
+        :param wait: wait for the response and return it, see request()
+        :type wait: bool
+        :param timeout: seconds to wait for the response, REQUEST_TIMEOUT by default
+        :type timeout: float
         """
 
         cmd = order_pb2.OrderMassStatusRequest()
@@ -550,11 +929,12 @@ class XenaTradingWebsocketClient(WebsocketClient):
                 raise ValueError("ts_from is required")
             cmd.TransactTime.append(ts_to)
 
-        await self.send_cmd(cmd)
+        return await self._send_request(cmd, 'MassStatusReqId', constants.MsgType_OrderMassStatusResponse, wait, timeout)
 
-    async def trade_history(self, account, request_id="", symbol="", ts_from=0, ts_to=0):
+    async def trade_history(self, account, request_id="", symbol="", ts_from=0, ts_to=0, wait=False, timeout=None):
         """Request all orders for :account
-        To receive respose, client has to listen constants.MsgType_MassPositionReport.
+        To receive respose, client has to listen constants.MsgType_MassTradeCaptureReportResponse
+        or pass :wait to get the response as result.
         Response will contain last 1000 trades.
 
         :param account: required
@@ -565,6 +945,10 @@ class XenaTradingWebsocketClient(WebsocketClient):
         :type ts_from: int unixtimestamp in nanoseconds
         :param ts_to: show trades which TransactTime less than ts_to, if present - ts_from is required
         :type ts_to: int unixtimestamp in nanoseconds
+        :param wait: wait for the response and return it, see request()
+        :type wait: bool
+        :param timeout: seconds to wait for the response, REQUEST_TIMEOUT by default
+        :type timeout: float
         """
 
         cmd = order_pb2.TradeCaptureReportRequest()
@@ -581,7 +965,7 @@ class XenaTradingWebsocketClient(WebsocketClient):
                 raise ValueError("ts_from is required")
             cmd.TransactTime.append(ts_to)
 
-        await self.send_cmd(cmd)
+        return await self._send_request(cmd, 'TradeRequestID', constants.MsgType_MassTradeCaptureReportResponse, wait, timeout)
 
     async def market_order(self, account, client_order_id, symbol, side, qty, **kwargs):
         """Create market order and send request"""
@@ -656,17 +1040,60 @@ class XenaTradingWebsocketClient(WebsocketClient):
         await self.send_cmd(cmd)
 
 
-    async def replace(self, cmd):
-        """Wrapper for send_cmd with convenient methond name for sending replace commnads"""
+    async def replace(self, cmd, coalesce=False):
+        """Wrapper for send_cmd with convenient methond name for sending replace commnads
+
+        :param coalesce: if previous replace for the order is not acknowledged yet, hold :cmd and send only
+            the latest held replace after acknowledgement, chained on acknowledged ClOrdId, see xena.coalesce.ReplaceCoalescer
+        :type coalesce: bool
+        """
 
         if not isinstance(cmd, order_pb2.OrderCancelReplaceRequest):
             raise ValueError("Command has to be OrderCancelRequest")
 
-        await self.send_cmd(cmd)
+        if not coalesce:
+            await self.send_cmd(cmd)
+            return
+
+        if self.replace_coalescer is None:
+            self.replace_coalescer = ReplaceCoalescer()
+        cmd = self.replace_coalescer.submit(cmd)
+        if cmd is not None:
+            await self._send_coalesced(cmd)
+
+    async def _send_coalesced(self, cmd):
+        """Send replace which replace_coalescer keeps in flight, roll it back if it's not sent"""
+
+        try:
+            sent = await self._send_cmd(cmd)
+        except BaseException:
+            self._abort_coalesced(cmd)
+            raise
+        if not sent:
+            self._abort_coalesced(cmd)
+
+    def _abort_coalesced(self, cmd):
+        if self.replace_coalescer is None:
+            return
+        # held replace of the same order goes instead of the failed one
+        for held in self.replace_coalescer.abort(cmd):
+            asyncio.ensure_future(self._send_released(held), loop=self._loop)
+
+    async def _send_released(self, cmd):
+        try:
+            await self._send_coalesced(cmd)
+        except Exception:
+            self._log.exception('send held replace %s', cmd.ClOrdId)
 
-    async def collapse_positions(self, account, symbol, request_id):
+    async def collapse_positions(self, account, symbol, request_id="", wait=False, timeout=None):
         """Send request to collapse positions
         To receive respose, client has to listen constants.MsgType_PositionMaintenanceReport
+        or pass :wait to get the response as result.
+
+        :param wait: wait for the response and return it, see request()
+        :type wait: bool
+        :param timeout: seconds to wait for the response, REQUEST_TIMEOUT by default
+        :type timeout: float
         """
 
         cmd = positions_pb2.PositionMaintenanceRequest()
@@ -676,7 +1103,7 @@ class XenaTradingWebsocketClient(WebsocketClient):
         cmd.PosReqId = request_id
         cmd.PosTransType = constants.PosTransType_Collapse
         cmd.PosMaintAction = constants.PosMaintAction_Replace
-        await self.send_cmd(cmd)
+        return await self._send_request(cmd, 'PosReqId', constants.MsgType_PositionMaintenanceReport, wait, timeout)
 
     async def heartbeat(self, group_id, intervalInSec):
         """Send application heartbeat"""